@@ -1,3 +1,5 @@
+import hashlib
+
 import vlc
 from mutagen.mp3 import MP3
 
@@ -129,6 +131,20 @@ class EpicMusicPlayer(EventManager):
         """
         return self._media_list.index_of_item(self._player.get_media_player().get_media())
 
+    @property
+    def playlist_identity(self) -> str:
+        """
+        Get the identity of the playlist.
+
+        This method returns a digest of the names of the songs in the playlist, in order. The members of a lobby
+        with the same identity refer to the same songs with the same indices.
+
+        Returns:
+        - str: The identity of the playlist.
+        """
+        names = "\n".join(song.name for song in self._playlist)
+        return hashlib.sha1(names.encode()).hexdigest()[:16]
+
     @property
     def is_paused(self) -> bool:
         """
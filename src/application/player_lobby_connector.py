@@ -1,3 +1,7 @@
+import threading
+
+from typing import Callable
+
 from net.lobby import NetLobby
 
 from messages.messages import *
@@ -18,7 +22,14 @@ class PlayerLobbyConnector:
     The PlayerLobbyConnector class is designed to manage the connection and communication between a lobby (e.g., NetLobby)
     and a media player (e.g., EpicMusicPlayer). It facilitates interactions such as sending requests, receiving updates,
     and ensuring seamless communication between the lobby and the media player.
+
+    Dragging the slider or pressing next repeatedly produces bursts of jump and set commands. The leader coalesces
+    them: the first command is broadcast and applied right away, and within the following window only the latest
+    command of each type is, when the window closes. Stop, resume and state commands close the window first, so the
+    commands are still applied in the order they were received.
     """
+    # Time within which the leader broadcasts and applies only the latest jump or set command
+    _COALESCING_WINDOW = 0.2
 
     # The player that is connected to a lobby
     _player: "EpicMusicPlayer"
@@ -26,6 +37,15 @@ class PlayerLobbyConnector:
     # The lobby the player is connected to
     _lobby: NetLobby
 
+    # The latest coalesced command of each type received within the window, with the action applying it, the latest last
+    _pending_commands: dict[type, tuple[ApplicationMessage, Callable, tuple]]
+
+    # Timer closing the coalescing window, None if no window is open
+    _coalescing_timer: object | None
+
+    # Guards the coalescing window, and keeps the commands in order while they are applied
+    _coalescing_lock: threading.RLock
+
     def __init__(self, player: "EpicMusicPlayer", lobby: NetLobby):
         """
         Constructor for the PlayerLobbyConnector class.
@@ -39,8 +59,13 @@ class PlayerLobbyConnector:
         """
         self._player = player
         self._lobby = lobby
+        self._pending_commands = {}
+        self._coalescing_timer = None
+        self._coalescing_lock = threading.RLock()
 
-        self._lobby.connect_to_event(self._lobby.EVENT_NEW_MEMBER, self._send_player_state)
+        # The lobby hands the state over to the joining members with their acceptance
+        self._lobby.set_state_provider(self._player.get_state)
+        self._lobby.set_playlist_identity(self._player.playlist_identity)
 
         self._lobby.connect_to_message(StopMessage, self._process_stop_message)
         self._lobby.connect_to_message(ResumeMessage, self._process_resume_message)
@@ -78,14 +103,23 @@ class PlayerLobbyConnector:
 
         This method sends a general application request to the lobby, propagating the specified ApplicationMessage to all members.
 
+        The request is handed over to the lobby with submit(), so this method can be called from any thread
+        (e.g. the GUI or the media player callbacks).
+
         Parameters:
         - message (ApplicationMessage): The application message to be sent to the lobby.
         """
-        if self._lobby.is_leader():
-            self._lobby.broadcast(message)
-            self._lobby.send_to_leader(message)
-        else:
-            self._lobby.send_to_leader(message)
+        self._lobby.submit(self._send_application_request, message)
+
+    def _send_application_request(self, message: ApplicationMessage):
+        """
+        Send a general application request in the context of the lobby.
+
+        Parameters:
+        - message (ApplicationMessage): The application message to be sent to the lobby.
+        """
+        # The leader sends the request to itself as well, and its handler broadcasts the command
+        self._lobby.send_to_leader(message)
 
     def request_stop(self):
         """
@@ -125,19 +159,6 @@ class PlayerLobbyConnector:
         """
         self.application_request(SetMessage(index))
 
-    def _send_player_state(self, address: str):
-        """
-        Automatically send the current state of the media player to a newly joined member.
-
-        This method is called automatically when a new member is added to the lobby (specifically by the leader client).
-        It sends the current state of the media player to the newly joined member using the specified address.
-
-        Parameters:
-        - address (str): The address of the newly joined member to send the player state.
-        """
-        state = StateMessage(self._player.get_state())
-        self._lobby.send_to(address, state)
-
     def _process_stop_message(self, message: StopMessage):
         """
         Process the received StopMessage from the lobby.
@@ -150,6 +171,7 @@ class PlayerLobbyConnector:
         - message (StopMessage): The StopMessage received from the lobby.
         """
         if self._lobby.is_leader():
+            self._flush_coalesced_commands()
             self._lobby.broadcast(message)
         if not self._player.is_paused:
             self._player.pause()
@@ -166,6 +188,7 @@ class PlayerLobbyConnector:
         - message (ResumeMessage): The ResumeMessage received from the lobby.
         """
         if self._lobby.is_leader():
+            self._flush_coalesced_commands()
             self._lobby.broadcast(message)
         if self._player.is_paused:
             self._player.play()
@@ -181,9 +204,7 @@ class PlayerLobbyConnector:
         Parameters:
         - message (SetMessage): The SetMessage received from the lobby.
         """
-        if self._lobby.is_leader():
-            self._lobby.broadcast(message)
-        self._player.set_song(message.index)
+        self._issue_coalesced(message, self._player.set_song, message.index)
 
     def _process_jump_to_timestamp_message(self, message: JumpToTimestampMessage):
         """
@@ -196,9 +217,7 @@ class PlayerLobbyConnector:
         Parameters:
         - message (JumpToTimestampMessage): The JumpToTimestampMessage received from the lobby.
         """
-        if self._lobby.is_leader():
-            self._lobby.broadcast(message)
-        self._player.skip_to_timestamp(message.destination_timestamp)
+        self._issue_coalesced(message, self._player.skip_to_timestamp, message.destination_timestamp)
 
     def _process_state_message(self, message: StateMessage):
         """
@@ -212,5 +231,62 @@ class PlayerLobbyConnector:
         - message (StateMessage): The StateMessage received from the lobby.
         """
         if self._lobby.is_leader():
+            self._flush_coalesced_commands()
             self._lobby.broadcast(message)
         self._player.set_state(message.state)
+
+    def _issue_coalesced(self, message: ApplicationMessage, action: Callable, *args):
+        """
+        Apply a frequent command, and as the leader broadcast it to all members.
+
+        The leader applies the command right away if no coalescing window is open, and opens one. Within the window,
+        the command replaces the earlier one of the same type, and is broadcast and applied when the window closes.
+
+        Parameters:
+        - message (ApplicationMessage): The command.
+        - action (Callable): The action applying the command on the media player.
+        - args: Positional arguments to be passed to the action.
+        """
+        with self._coalescing_lock:
+            if self._lobby.is_leader():
+                if self._coalescing_timer is not None:
+                    self._pending_commands.pop(type(message), None)
+                    self._pending_commands[type(message)] = (message, action, args)
+                    return
+                self._coalescing_timer = self._lobby.schedule(self._COALESCING_WINDOW, self._coalescing_window_expired)
+                self._lobby.broadcast(message)
+            action(*args)
+
+    def _coalescing_window_expired(self):
+        """
+        Broadcast and apply the latest commands received within the window, and open a new window if there were any.
+        """
+        self._flush_coalesced_commands(reopen=True)
+
+    def _flush_coalesced_commands(self, reopen: bool = False):
+        """
+        Close the coalescing window, and broadcast and apply the latest commands received within it.
+
+        If this client is no longer the leader, the commands are sent to the new leader instead.
+
+        Parameters:
+        - reopen (bool): True to open a new window if there were commands, so the following ones are coalesced as well.
+        """
+        with self._coalescing_lock:
+            if self._coalescing_timer is not None:
+                self._coalescing_timer.cancel()
+                self._coalescing_timer = None
+            pending = list(self._pending_commands.values())
+            self._pending_commands.clear()
+            if not pending:
+                return
+
+            is_leader = self._lobby.is_leader()
+            if reopen and is_leader:
+                self._coalescing_timer = self._lobby.schedule(self._COALESCING_WINDOW, self._coalescing_window_expired)
+            for message, action, args in pending:
+                if is_leader:
+                    self._lobby.broadcast(message)
+                    action(*args)
+                else:
+                    self._lobby.send_to_leader(message)
@@ -0,0 +1,47 @@
+"""
+Benchmark of the message codecs.
+
+Measures the encoding and decoding throughput and the encoded size of a few typical
+messages for every codec. Run it from the root of the repository:
+
+    python src/benchmarks/codec_benchmark.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from application.state import State
+from messages.codec import BinaryCodec, JsonCodec
+from messages.messages import HealthCheckMessage, MemberAcceptMessage, StateMessage
+
+def _member_accept(count: int) -> MemberAcceptMessage:
+    members = {}
+    for i in range(count):
+        ip, port = f'10.0.{i // 256}.{i % 256}', 10000 + i
+        members[f'{ip}:{port}'] = {'ip': ip, 'port': port, 'name': f'member {i}', 'id': i * 7919, 'is_leader': i == 0, 'is_alive': True}
+    return MemberAcceptMessage('10.0.0.0:10000', members)
+
+def _throughput(callback, repeat: int) -> float:
+    return repeat / min(timeit.repeat(callback, number=repeat, repeat=3))
+
+def main():
+    messages = {
+        'HealthCheckMessage': (HealthCheckMessage('192.168.100.200:30000'), 50000),
+        'StateMessage': (StateMessage(State(3, 123456, True)), 50000),
+        'MemberAcceptMessage (10)': (_member_accept(10), 5000),
+        'MemberAcceptMessage (1000)': (_member_accept(1000), 50)
+    }
+    codecs = {'json': JsonCodec(), 'binary': BinaryCodec()}
+
+    print(f"{'message':<28} {'codec':<7} {'bytes':>8} {'encode/s':>12} {'decode/s':>12}")
+    for name, (msg, repeat) in messages.items():
+        for codec_name, codec in codecs.items():
+            data = codec.encode(msg)
+            encode = _throughput(lambda: codec.encode(msg), repeat)
+            decode = _throughput(lambda: codec.decode(data), repeat)
+            print(f"{name:<28} {codec_name:<7} {len(data):>8} {encode:>12,.0f} {decode:>12,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark of the leader elections.
+
+Builds lobbies of a few sizes on an in-memory network, stops the leader and lets every remaining
+member notice the failure at the same time, which is the worst case for the bully election. The
+failover time (until every member has accepted the same new leader) and the number of election
+messages sent are measured for the bully and the term based election, and for the standby successor
+taking over without an election. The in-memory network has
+no latency, so the time only includes the timers and the handling of the messages. The failovers
+in which the members did not agree on a new leader within the timeout are counted as failed. Run it from the
+root of the repository:
+
+    python src/benchmarks/election_benchmark.py
+"""
+import logging
+import os
+import queue
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from net.backend import IpAddress, NetBackend
+from net.base_lobby import _read_header
+from net.lobby import NetLobby
+
+from messages.messages import MessageTypes
+
+# The lobbies are not waited for longer than this
+_TIMEOUT = 10.0
+
+class _MemoryNetwork:
+    """
+    Delivers the messages between the backends of the lobbies in the same process.
+    """
+    def __init__(self):
+        self.inboxes: dict[IpAddress, queue.Queue] = {}
+        self.election_messages = 0
+        self._lock = threading.Lock()
+
+    def send(self, source: IpAddress, dest: IpAddress, data: bytes) -> bool:
+        inbox = self.inboxes.get(dest)
+        if inbox is None:
+            return False
+        _, message_type, _, _ = _read_header(data)
+        if message_type is not None and message_type.type == MessageTypes.Election.value:
+            with self._lock:
+                self.election_messages += 1
+        inbox.put((source, data))
+        return True
+
+class _MemoryBackend(NetBackend):
+    blocking_send = False
+
+    def __init__(self, network: _MemoryNetwork, address: IpAddress):
+        self._network = network
+        self._address = address
+        self._inbox = network.inboxes[address] = queue.Queue()
+
+    def receive(self) -> tuple[IpAddress, bytes]:
+        try:
+            return self._inbox.get(timeout=0.2)
+        except queue.Empty:
+            return (None, None)
+
+    def send(self, dest: IpAddress, data: bytes) -> bool:
+        return self._network.send(self._address, dest, data)
+
+    def shutdown(self) -> None:
+        self._network.inboxes.pop(self._address, None)
+
+class _BenchmarkLobby(NetLobby):
+    def __init__(self, network: _MemoryNetwork):
+        super().__init__()
+        self._network = network
+
+    def _create_backend(self, port: int) -> NetBackend:
+        return _MemoryBackend(self._network, f'127.0.0.1:{port}')
+
+def _wait_for(condition, timeout: float = _TIMEOUT) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+def _failover(size: int, term_election: bool, standby: bool) -> tuple[float | None, int]:
+    """
+    Measure a single failover.
+
+    Returns:
+    - tuple[float | None, int]: The failover time in seconds (None if the members did not agree on a
+      new leader in time) and the number of election messages.
+    """
+    network = _MemoryNetwork()
+    lobbies = [_BenchmarkLobby(network) for _ in range(size)]
+    for lobby in lobbies:
+        lobby.use_term_election(term_election)
+        lobby.use_standby(standby)
+        lobby.start()
+
+    leader, members = lobbies[0], lobbies[1:]
+    try:
+        leader.create_lobby('127.0.0.1', 40000, 'leader')
+        for i, member in enumerate(members, 1):
+            member.join_lobby(f'member {i}', '127.0.0.1', 40000 + i, '127.0.0.1', 40000)
+            # The members join one at a time
+            if not _wait_for(lambda: all(len(lobby._members) == i + 1 for lobby in lobbies[:i + 1])):
+                raise RuntimeError(f"The lobby of {size} members was not formed")
+
+        if standby and not _wait_for(lambda: any(member._standby_sync is not None for member in members)):
+            raise RuntimeError("The successor was not updated")
+
+        failed_leader = leader._identity
+        leader.stop()
+        network.election_messages = 0
+
+        def detect(member: _BenchmarkLobby):
+            # A member which has already accepted a new leader does not notice the failure any more
+            if member._leader == failed_leader:
+                member._start_leader_election()
+
+        # Every member notices the failure of the leader at the same time
+        start = time.monotonic()
+        detections = [threading.Thread(target=detect, args=(member,)) for member in members]
+        for detection in detections:
+            detection.start()
+
+        def converged() -> bool:
+            leaders = {member._leader for member in members}
+            if len(leaders) != 1 or failed_leader in leaders:
+                return False
+            return not any(member._leader_election_in_progress for member in members)
+
+        failover = time.monotonic() - start if _wait_for(converged) else None
+
+        # Let the late messages of the election arrive
+        time.sleep(0.5)
+        for detection in detections:
+            detection.join()
+        return failover, network.election_messages
+    finally:
+        for lobby in lobbies:
+            if lobby is not leader:
+                lobby.stop()
+
+def main():
+    # The election is logged on the console
+    logging.getLogger('net.lobby_leader_election_implementation').setLevel(logging.WARNING)
+
+    repeat = 3
+    print(f"{'election':<9} {'members':>7} {'failover ms':>12} {'messages':>9} {'failed':>7}")
+    for size in (5, 10, 30):
+        for name, term_election, standby in (('bully', False, False), ('term', True, False), ('standby', False, True)):
+            results = [_failover(size, term_election, standby) for _ in range(repeat)]
+            failovers = [failover for failover, _ in results if failover is not None]
+            failover = f"{statistics.median(failovers) * 1000:.1f}" if failovers else '-'
+            messages = statistics.median(messages for _, messages in results)
+            print(f"{name:<9} {size:>7} {failover:>12} {messages:>9.0f} {repeat - len(failovers):>7}")
+
+if __name__ == "__main__":
+    main()
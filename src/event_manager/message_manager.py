@@ -31,6 +31,18 @@ class MessageManager:
         
         self._message_types[type] = callback
 
+    def _has_message_handler(self, type: object) -> bool:
+        """
+        Check whether a callback function is registered for a specific message type.
+
+        Parameters:
+        - type (object): The custom message type.
+
+        Returns:
+        - bool: True if there is a callback function for the message type, False otherwise.
+        """
+        return type in self._message_types
+
     def _call_message_handler(self, type: object, *args, **kwargs):
         """
         Invoke the callback function associated with a specific message type.
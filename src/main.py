@@ -7,8 +7,26 @@ def main():
     if len(sys.argv) > 1 and sys.argv[1] == 'l':
         local = True
 
+    # Run the lobby on a single asyncio event loop instead of threads
+    use_asyncio = 'asyncio' in sys.argv[1:]
+
+    # Detect failed members with the SWIM protocol instead of the leader health checks
+    use_swim = 'swim' in sys.argv[1:]
+
+    # Broadcast through a tree of relays instead of sending to every member from the leader
+    use_relay_tree = 'relay' in sys.argv[1:]
+
+    # Elect a new leader with terms and votes instead of the bully election
+    use_term_election = 'term' in sys.argv[1:]
+
+    # Let a designated successor take over immediately when the leader fails
+    use_standby = 'standby' in sys.argv[1:]
+
+    # Prefer the members with short round trip times to the rest of the lobby as the next leader
+    use_rtt_ranking = 'rtt' in sys.argv[1:]
+
     songs = ["src/songs/[Copyright Free Romantic Music] - .mpga","src/songs/Orchestral Trailer Piano Music (No Copyright) .mpga"]
-    app = Application(songs, local)
+    app = Application(songs, local, use_asyncio, use_swim, use_relay_tree, use_term_election, use_standby, use_rtt_ranking)
     app.start()
 
 if __name__ == "__main__":
@@ -5,6 +5,7 @@ from tkinter import *
 from application.player import EpicMusicPlayer
 
 from net.lobby import NetLobby
+from net.asyncio_lobby import AsyncioNetLobby
 
 from gui.main import main_window
 from gui.name import name_window
@@ -16,13 +17,18 @@ def get_public_ip():
     return get('https://api.ipify.org').text
 
 class Application:
-    def __init__(self, songs: list[str], local: bool):
+    def __init__(self, songs: list[str], local: bool, use_asyncio: bool = False, use_swim: bool = False, use_relay_tree: bool = False, use_term_election: bool = False, use_standby: bool = False, use_rtt_ranking: bool = False):
         self.main_window = Tk()
         self.main_window.protocol("WM_DELETE_WINDOW", self.on_close)
         
         self._name = "No Name"
         self._player = EpicMusicPlayer(songs)
-        self._lobby = NetLobby()
+        self._lobby = AsyncioNetLobby() if use_asyncio else NetLobby()
+        self._lobby.use_swim(use_swim)
+        self._lobby.use_relay_tree(use_relay_tree)
+        self._lobby.use_term_election(use_term_election)
+        self._lobby.use_standby(use_standby)
+        self._lobby.use_rtt_ranking(use_rtt_ranking)
         self._player.connect_to_lobby(self._lobby)
         self._local = local
 
@@ -40,7 +46,7 @@ class Application:
         port = 30000
 
         print(f"Listening on {ip}:{port}")
-        self._lobby.create_lobby(ip, port, self._name)
+        self._lobby.submit(self._lobby.create_lobby, ip, port, self._name)
 
         music_player_window(self.main_window, self._player)
         members_win = Toplevel(self.main_window)
@@ -69,14 +75,14 @@ class Application:
         print(f"Listening on {my_ip}:{port}")
 
         self._lobby.start()
-        self._lobby.join_lobby(self._name, my_ip, port, address[0], address[1] if len(address) == 2 else 30000)
+        self._lobby.submit(self._lobby.join_lobby, self._name, my_ip, port, address[0], address[1] if len(address) == 2 else 30000)
         self._player.start()
 
     def connect_back_pushed(self):
         main_window(self.main_window, self.main_host_pushed, self.main_connect_pushed, self.main_exit_pushed)
 
     def on_close(self):
-        self._lobby.leave_lobby()
+        self._lobby.submit(self._lobby.leave_lobby)
         self._lobby.stop()
 
         self.main_window.destroy()
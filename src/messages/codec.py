@@ -0,0 +1,143 @@
+import json
+import struct
+
+from abc import ABC, abstractmethod
+from typing import Callable
+
+from messages.fields import Field
+from messages.messages import BaseMessage, message_class
+
+class Codec(ABC):
+    """
+    Interface for turning messages into bytes and back.
+    """
+    @abstractmethod
+    def encode(self, msg: BaseMessage) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, data: bytes) -> BaseMessage:
+        pass
+
+class JsonCodec(Codec):
+    """
+    Human readable codec encoding the messages as UTF-8 JSON.
+
+    It is mainly useful for debugging, as the messages are easy to read in a packet capture.
+    """
+    def encode(self, msg: BaseMessage) -> bytes:
+        return json.dumps(msg.__dict__).encode('utf-8')
+
+    def decode(self, data: bytes) -> BaseMessage:
+        return BaseMessage.from_dict(json.loads(bytes(data)))
+
+class BinaryCodec(Codec):
+    """
+    Compact binary codec.
+
+    A message is encoded as a fixed header of its type and subtype (one byte each), followed by
+    the fields of the message packed in network byte order. Strings are prefixed with their length.
+
+    The encoder and the decoder of every message class are generated once from the fields the class
+    declares, consecutive fixed size fields are packed with a single struct.
+    """
+    def encode(self, msg: BaseMessage) -> bytes:
+        return _encoder(type(msg))(msg)
+
+    def decode(self, data: bytes) -> BaseMessage:
+        type, subtype = _HEADER.unpack_from(data)
+        cls = message_class(type, subtype)
+        if cls is None:
+            raise ValueError(f"Unknown message type {(type, subtype)}")
+        return _decoder(cls)(data)
+
+def decode_message(data: bytes) -> BaseMessage:
+    """
+    Decode a message encoded by any of the codecs.
+
+    JSON messages always start with an opening brace, which is never a valid message type of
+    the binary codec, so the peers do not need to agree on the codec they are sending with.
+
+    Parameters:
+    - data (bytes): The encoded message.
+
+    Returns:
+    - BaseMessage: The decoded message.
+    """
+    if data[:1] == b'{':
+        return _JSON_CODEC.decode(data)
+    return _BINARY_CODEC.decode(data)
+
+_HEADER = struct.Struct('!BB')
+
+# Generated encoders and decoders by message class
+_ENCODERS: dict[type, Callable[[BaseMessage], bytes]] = {}
+_DECODERS: dict[type, Callable[[bytes], BaseMessage]] = {}
+
+def _plan(cls: type) -> list[tuple[struct.Struct | None, tuple[Field, ...]]]:
+    """
+    Group the fields of a message class into packing steps.
+
+    Consecutive fixed size fields are merged into a single struct step, while the variable size
+    fields get a step of their own (without a struct).
+    """
+    steps = []
+    fixed = []
+    for field in cls._all_fields:
+        if field.format is not None:
+            fixed.append(field)
+            continue
+        if fixed:
+            steps.append((struct.Struct('!' + ''.join(f.format for f in fixed)), tuple(fixed)))
+            fixed = []
+        steps.append((None, (field,)))
+    if fixed:
+        steps.append((struct.Struct('!' + ''.join(f.format for f in fixed)), tuple(fixed)))
+    return steps
+
+def _encoder(cls: type) -> Callable[[BaseMessage], bytes]:
+    if cls in _ENCODERS:
+        return _ENCODERS[cls]
+    if '_key' not in cls.__dict__:
+        raise ValueError(f"{cls.__name__} cannot be encoded")
+
+    header = _HEADER.pack(*cls._key)
+    steps = [(packer, tuple(field.name for field in fields), fields[0].write) for packer, fields in _plan(cls)]
+
+    def encode(msg: BaseMessage) -> bytes:
+        out = bytearray(header)
+        for packer, names, write in steps:
+            if packer is not None:
+                out += packer.pack(*[getattr(msg, name) for name in names])
+            else:
+                write(out, getattr(msg, names[0]))
+        return bytes(out)
+
+    _ENCODERS[cls] = encode
+    return encode
+
+def _decoder(cls: type) -> Callable[[bytes], BaseMessage]:
+    if cls in _DECODERS:
+        return _DECODERS[cls]
+
+    steps = [(packer, tuple(field.name for field in fields), fields[0].read) for packer, fields in _plan(cls)]
+    new = cls.__new__
+
+    def decode(data: bytes) -> BaseMessage:
+        msg = new(cls)
+        offset = _HEADER.size
+        for packer, names, read in steps:
+            if packer is not None:
+                for name, value in zip(names, packer.unpack_from(data, offset)):
+                    setattr(msg, name, value)
+                offset += packer.size
+            else:
+                value, offset = read(data, offset)
+                setattr(msg, names[0], value)
+        return msg
+
+    _DECODERS[cls] = decode
+    return decode
+
+_JSON_CODEC = JsonCodec()
+_BINARY_CODEC = BinaryCodec()
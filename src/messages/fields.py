@@ -0,0 +1,196 @@
+import base64
+import struct
+
+from typing import Callable
+
+from application.state import State
+
+class Field:
+    """
+    Declaration of a single field of a message.
+
+    A field knows how to pack itself into the binary wire format and how to convert itself
+    to and from a JSON compatible value. Fixed size fields also expose their struct format,
+    so that consecutive ones can be packed with a single struct.
+    """
+    __slots__ = ('name', 'format', 'write', 'read', 'to_json', 'from_json')
+
+    def __init__(self, name: str,
+                 format: str = None,
+                 write: Callable[[bytearray, any], None] = None,
+                 read: Callable[[bytes, int], tuple[any, int]] = None,
+                 to_json: Callable[[any], any] = None,
+                 from_json: Callable[[any], any] = None):
+        self.name = name
+        self.format = format # Struct format of a fixed size field, None for variable size fields
+        self.write = write
+        self.read = read
+        self.to_json = to_json if to_json is not None else _identity
+        self.from_json = from_json if from_json is not None else _identity
+
+def Str(name: str) -> Field:
+    return Field(name, write=_write_str, read=_read_str)
+
+def Int32(name: str) -> Field:
+    return Field(name, format='i')
+
+def Int64(name: str) -> Field:
+    return Field(name, format='q')
+
+def Bool(name: str) -> Field:
+    return Field(name, format='?')
+
+def Members(name: str) -> Field:
+    return Field(name, write=_write_members, read=_read_members)
+
+def StateField(name: str) -> Field:
+    return Field(name, write=_write_state, read=_read_state, to_json=_state_to_json, from_json=_state_from_json)
+
+def SwimUpdates(name: str) -> Field:
+    return Field(name, write=_write_swim_updates, read=_read_swim_updates, from_json=_swim_updates_from_json)
+
+def Addresses(name: str) -> Field:
+    return Field(name, write=_write_addresses, read=_read_addresses)
+
+def Latencies(name: str) -> Field:
+    return Field(name, write=_write_latencies, read=_read_latencies)
+
+def Payload(name: str) -> Field:
+    return Field(name, write=_write_payload, read=_read_payload, to_json=_payload_to_json, from_json=_payload_from_json)
+
+_LENGTH = struct.Struct('!H')
+_PEER = struct.Struct('!HiBBH')
+_STATE = struct.Struct('!iq?')
+_SWIM_UPDATE = struct.Struct('!BI')
+_PAYLOAD_LENGTH = struct.Struct('!I')
+_LATENCY = struct.Struct('!I')
+
+def _identity(value):
+    return value
+
+def _write_str(out: bytearray, value: str):
+    encoded = value.encode('utf-8')
+    out += _LENGTH.pack(len(encoded))
+    out += encoded
+
+def _read_str(data: bytes, offset: int) -> tuple[str, int]:
+    (length,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    end = offset + length
+    return str(data[offset:end], 'utf-8'), end
+
+def _write_members(out: bytearray, members: dict[str, dict]):
+    # The address of a member is not sent, it is always made of its ip and port. The fixed size parts of
+    # the members are packed into one block, followed by their ips and names as a single string, so
+    # they are decoded in bulk. The lengths of the ips and names are counted in characters.
+    out += _LENGTH.pack(len(members))
+    strings = []
+    for member in members.values():
+        ip, name = member['ip'], member['name']
+        out += _PEER.pack(int(member['port']), member['id'], member['is_leader'] | member['is_alive'] << 1, len(ip), len(name))
+        strings.append(ip)
+        strings.append(name)
+    _write_payload(out, ''.join(strings).encode('utf-8'))
+
+def _read_members(data: bytes, offset: int) -> tuple[dict[str, dict], int]:
+    (count,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    end = offset + count * _PEER.size
+    peers = _PEER.iter_unpack(memoryview(data)[offset:end])
+    strings, offset = _read_payload(data, end)
+    text = str(strings, 'utf-8')
+
+    members = {}
+    position = 0
+    for port, id, flags, ip_length, name_length in peers:
+        ip = text[position:position + ip_length]
+        position += ip_length
+        name = text[position:position + name_length]
+        position += name_length
+        members[f'{ip}:{port}'] = {
+            'ip': ip,
+            'port': port,
+            'name': name,
+            'id': id,
+            'is_leader': bool(flags & 1),
+            'is_alive': bool(flags & 2)
+        }
+    return members, offset
+
+def _write_state(out: bytearray, state: State):
+    out += _STATE.pack(state.index, state.timestamp, bool(state.playing))
+
+def _read_state(data: bytes, offset: int) -> tuple[State, int]:
+    index, timestamp, playing = _STATE.unpack_from(data, offset)
+    return State(index, timestamp, playing), offset + _STATE.size
+
+def _state_to_json(state: State) -> dict[str, any]:
+    return state.__dict__
+
+def _state_from_json(d: dict[str, any]) -> State:
+    return State(**d)
+
+def _write_swim_updates(out: bytearray, updates: list[tuple[int, str, int]]):
+    out += _LENGTH.pack(len(updates))
+    for kind, address, incarnation in updates:
+        out += _SWIM_UPDATE.pack(kind, incarnation)
+        _write_str(out, address)
+
+def _read_swim_updates(data: bytes, offset: int) -> tuple[list[tuple[int, str, int]], int]:
+    (count,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    updates = []
+    for _ in range(count):
+        kind, incarnation = _SWIM_UPDATE.unpack_from(data, offset)
+        address, offset = _read_str(data, offset + _SWIM_UPDATE.size)
+        updates.append((kind, address, incarnation))
+    return updates, offset
+
+def _swim_updates_from_json(updates: list[list]) -> list[tuple[int, str, int]]:
+    return [tuple(update) for update in updates]
+
+def _write_addresses(out: bytearray, addresses: list[str]):
+    out += _LENGTH.pack(len(addresses))
+    for address in addresses:
+        _write_str(out, address)
+
+def _read_addresses(data: bytes, offset: int) -> tuple[list[str], int]:
+    (count,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    addresses = []
+    for _ in range(count):
+        address, offset = _read_str(data, offset)
+        addresses.append(address)
+    return addresses, offset
+
+def _write_latencies(out: bytearray, latencies: dict[str, int]):
+    out += _LENGTH.pack(len(latencies))
+    for address, latency in latencies.items():
+        _write_str(out, address)
+        out += _LATENCY.pack(latency)
+
+def _read_latencies(data: bytes, offset: int) -> tuple[dict[str, int], int]:
+    (count,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    latencies = {}
+    for _ in range(count):
+        address, offset = _read_str(data, offset)
+        (latencies[address],) = _LATENCY.unpack_from(data, offset)
+        offset += _LATENCY.size
+    return latencies, offset
+
+def _write_payload(out: bytearray, payload: bytes):
+    out += _PAYLOAD_LENGTH.pack(len(payload))
+    out += payload
+
+def _read_payload(data: bytes, offset: int) -> tuple[bytes, int]:
+    (length,) = _PAYLOAD_LENGTH.unpack_from(data, offset)
+    offset += _PAYLOAD_LENGTH.size
+    end = offset + length
+    return bytes(data[offset:end]), end
+
+def _payload_to_json(payload: bytes) -> str:
+    return base64.b64encode(payload).decode('ascii')
+
+def _payload_from_json(payload: str) -> bytes:
+    return base64.b64decode(payload)
@@ -1,39 +1,101 @@
 from enum import Enum
 
 from application.state import State
+from messages.fields import Field, Str, Int32, Int64, Bool, Members, StateField, SwimUpdates, Addresses, Latencies, Payload
 
 class MessageTypes(Enum):
     LobbyMessage = 1
     HealthCheckMessage = 2
     Election = 3
     ApplicationMessage = 4
-
-class BaseMessage:
-    def __init__(self, type: MessageTypes):
-        self.type = type.value
-
-    def __init_from_dict__(self, d: dict[str, any]):
-        self.type = d['type']
+    Swim = 5
+    Relay = 6
+
+# Every concrete message class by its (type, subtype) pair
+_REGISTRY: dict[tuple[int, int], type] = {}
+
+# The attribute holding the subtype of the messages of a type
+_SUBTYPE_ATTRIBUTES: dict[int, str] = {}
+
+class _MessageMeta(type):
+    """
+    Metaclass generating the message classes from their field declarations.
+
+    Every message class declares only its own fields in _fields, from which the metaclass creates
+    the __slots__ of the class and collects all the fields of the message (_all_fields), the fields
+    of the base classes first. The type and the subtype of a message are given as class keywords,
+    they are stored on the class instead of the instances, and the concrete message classes are
+    registered by their (type, subtype) pair.
+    """
+    def __new__(mcs, name, bases, namespace, type: MessageTypes = None, subtype: Enum = None, subtype_attribute: str = None):
+        fields: tuple[Field, ...] = namespace.get('_fields', ())
+        namespace['_fields'] = fields
+        namespace['__slots__'] = tuple(field.name for field in fields)
+        cls = super().__new__(mcs, name, bases, namespace)
+
+        cls._all_fields = sum((getattr(base, '_all_fields', ()) for base in bases), ()) + fields
+
+        if type is not None:
+            cls.type = type.value
+        if subtype_attribute is not None:
+            _SUBTYPE_ATTRIBUTES[cls.type] = subtype_attribute
+        if subtype is not None:
+            setattr(cls, _SUBTYPE_ATTRIBUTES[cls.type], subtype.value)
+            cls._key = (cls.type, subtype.value)
+        elif type is not None and subtype_attribute is None:
+            cls._key = (cls.type, 0) # Message types without subtypes
+
+        if '_key' in cls.__dict__:
+            _REGISTRY[cls._key] = cls
+        return cls
+
+class BaseMessage(metaclass=_MessageMeta):
+    # The type of the message
+    type: int
+
+    # The (type, subtype) pair of a concrete message class
+    _key: tuple[int, int]
+
+    # All the fields of the message, the fields of the base classes first
+    _all_fields: tuple[Field, ...]
 
     @property
     def __dict__(self) -> dict[str, any]:
-        return {
-            'type': self.type
-        }
-    
+        d = {'type': self.type}
+        if self.type in _SUBTYPE_ATTRIBUTES:
+            attribute = _SUBTYPE_ATTRIBUTES[self.type]
+            d[attribute] = getattr(self, attribute)
+        for field in self._all_fields:
+            d[field.name] = field.to_json(getattr(self, field.name))
+        return d
+
+    @staticmethod
     def from_dict(d: dict[str, any]) -> "BaseMessage":
-        match d['type']:
-            case MessageTypes.LobbyMessage.value:
-                return LobbyMessage.from_dict(d)
-            
-            case MessageTypes.HealthCheckMessage.value:
-                return HealthCheckMessage.from_dict(d)
-            
-            case MessageTypes.Election.value:
-                return ElectionMessage.from_dict(d)
-            
-            case MessageTypes.ApplicationMessage.value:
-                return ApplicationMessage.from_dict(d)
+        type = d['type']
+        subtype = d[_SUBTYPE_ATTRIBUTES[type]] if type in _SUBTYPE_ATTRIBUTES else 0
+        cls = _REGISTRY.get((type, subtype))
+        if cls is None:
+            return None
+
+        msg = cls.__new__(cls)
+        for field in cls._all_fields:
+            setattr(msg, field.name, field.from_json(d[field.name]))
+        return msg
+
+def message_class(type: int, subtype: int) -> type | None:
+    """
+    Get the message class of the given type and subtype.
+
+    Returns:
+    - type | None: The message class, or None if there is no such message.
+    """
+    return _REGISTRY.get((type, subtype))
+
+def message_classes() -> list[type]:
+    """
+    Get all the concrete message classes.
+    """
+    return list(_REGISTRY.values())
 
 ##################
 # LOBBY MESSAGES #
@@ -45,164 +107,111 @@ class LobbyMessageType(Enum):
     MemberAccept = 4
     Leave = 5
     MemberLeft = 6
+    MembershipRequest = 7
+    MembershipDelta = 8
+    CommandRequest = 9
+    RelayUnreachable = 10
 
-class LobbyMessage(BaseMessage):
-    def __init__(self, lobby_message_type: LobbyMessageType, sender: str):
-        super().__init__(MessageTypes.LobbyMessage)
-        self.lobby_type = lobby_message_type.value
-        self.sender = sender
-
-    def __init_from_dict__(self, d: dict[str, any]):
-        super().__init_from_dict__(d)
-        self.lobby_type = d['lobby_type']
-        self.sender = d['sender']
-
-    @property
-    def __dict__(self) -> dict[str, any]:
-        d = super().__dict__
-        d['lobby_type'] = self.lobby_type
-        d['sender'] = self.sender
-        return d
-
-    def from_dict(d: [str, any]) -> "LobbyMessage":
-        msg = None
-        match d['lobby_type']:
-            case LobbyMessageType.RequestJoin.value:
-                msg = RequestJoinMessage.__new__(RequestJoinMessage)
+class LobbyMessage(BaseMessage, type=MessageTypes.LobbyMessage, subtype_attribute='lobby_type'):
+    _fields = (Str('sender'),)
 
-            case LobbyMessageType.RequestNewMember.value:
-                msg = RequestNewMemberMessage.__new__(RequestNewMemberMessage)
-
-            case LobbyMessageType.NewMember.value:
-                msg = NewMemberMessage.__new__(NewMemberMessage)
-
-            case LobbyMessageType.MemberAccept.value:
-                msg = MemberAcceptMessage.__new__(MemberAcceptMessage)
-
-            case LobbyMessageType.Leave.value:
-                msg = LeaveMessage.__new__(LeaveMessage)
-
-            case LobbyMessageType.MemberLeft.value:
-                msg = MemberLeftMessage.__new__(MemberLeftMessage)
-
-        if msg is not None:
-            msg.__init_from_dict__(d)
+    def __init__(self, sender: str):
+        self.sender = sender
 
-        return msg
+class RequestJoinMessage(LobbyMessage, subtype=LobbyMessageType.RequestJoin):
+    _fields = (Str('target'), Str('name'))
 
-class RequestJoinMessage(LobbyMessage):
     def __init__(self, sender: str, target: str, name: str):
-        super().__init__(LobbyMessageType.RequestJoin, sender)
+        super().__init__(sender)
         self.target = target # Hack to help the leader
         self.name = name
 
-    def __init_from_dict__(self, d: dict[str, any]):
-        super().__init_from_dict__(d)
-        self.target = d['target']
-        self.name = d['name']
+class RequestNewMemberMessage(LobbyMessage, subtype=LobbyMessageType.RequestNewMember):
+    _fields = (Str('name'), Str('new_member_address'))
 
-    @property
-    def __dict__(self) -> dict[str, any]:
-        d = super().__dict__
-        d['target'] = self.target
-        d['name'] = self.name
-        return d
-    
-class RequestNewMemberMessage(LobbyMessage):
     def __init__(self, sender: str, name: str, new_member_address: str):
-        super().__init__(LobbyMessageType.RequestNewMember, sender)
+        super().__init__(sender)
         self.name = name
         self.new_member_address = new_member_address
 
-    def __init_from_dict__(self, d: dict[str, any]):
-        super().__init_from_dict__(d)
-        self.name = d['name']
-        self.new_member_address = d['new_member_address']
+class NewMemberMessage(LobbyMessage, subtype=LobbyMessageType.NewMember):
+    _fields = (Members('members'), Int64('epoch'))
 
-    @property
-    def __dict__(self) -> dict[str, any]:
-        d = super().__dict__
-        d['name'] = self.name
-        d['new_member_address'] = self.new_member_address
-        return d
-    
-class NewMemberMessage(LobbyMessage):
-    def __init__(self, sender: str, name: str, new_member_address: str, new_member_id: int):
-        super().__init__(LobbyMessageType.NewMember, sender)
-        self.name = name
-        self.new_member_address = new_member_address
-        self.new_member_id = new_member_id
+    def __init__(self, sender: str, members: dict[str, any], epoch: int):
+        super().__init__(sender)
+        self.members = members # The members admitted in the same batch
+        self.epoch = epoch # The membership epoch of the change
 
-    def __init_from_dict__(self, d: dict[str, any]):
-        super().__init_from_dict__(d)
-        self.name = d['name']
-        self.new_member_address = d['new_member_address']
-        self.new_member_id = d['new_member_id']
+class MemberAcceptMessage(LobbyMessage, subtype=LobbyMessageType.MemberAccept):
+    _fields = (Members('members'), Int64('epoch'), StateField('state'), Int64('captured_at'), Str('playlist'), Int64('command_seq'))
 
-    @property
-    def __dict__(self) -> dict[str, any]:
-        d = super().__dict__
-        d['name'] = self.name
-        d['new_member_address'] = self.new_member_address
-        d['new_member_id'] = self.new_member_id
-        return d
-
-class MemberAcceptMessage(LobbyMessage):
-    def __init__(self, sender: str, members: dict[str, any]):
-        super().__init__(LobbyMessageType.MemberAccept, sender)
+    def __init__(self, sender: str, members: dict[str, any], epoch: int = 0, state: State = None, captured_at: int = 0, playlist: str = "", command_seq: int = 0):
+        super().__init__(sender)
         self.members = members
+        self.epoch = epoch # The membership epoch the members are up to date with
+        self.state = state if state is not None else State(-1, 0, False) # The state of the application, index -1 if there is none
+        self.captured_at = captured_at # When the state was captured, milliseconds of the wall clock of the leader
+        self.playlist = playlist # Identifies the playlist the index of the state refers to, empty if unknown
+        self.command_seq = command_seq # The sequence number of the last application command the state includes
 
-    def __init_from_dict__(self, d: dict[str, any]):
-        super().__init_from_dict__(d)
-        self.members = d['members']
-
-    @property
-    def __dict__(self) -> dict[str, any]:
-        d = super().__dict__
-        d['members'] = self.members
-        return d
-    
-class LeaveMessage(LobbyMessage):
+class LeaveMessage(LobbyMessage, subtype=LobbyMessageType.Leave):
     def __init__(self, sender: str):
-        super().__init__(LobbyMessageType.Leave, sender)
+        super().__init__(sender)
+
+class MemberLeftMessage(LobbyMessage, subtype=LobbyMessageType.MemberLeft):
+    _fields = (Str('member_address'), Int64('epoch'))
 
-class MemberLeftMessage(LobbyMessage):
-    def __init__(self, sender: str, member_address: str):
-        super().__init__(LobbyMessageType.MemberLeft, sender)
+    def __init__(self, sender: str, member_address: str, epoch: int):
+        super().__init__(sender)
         self.member_address = member_address
+        self.epoch = epoch # The membership epoch of the change
 
-    def __init_from_dict__(self, d: dict[str, any]):
-        super().__init_from_dict__(d)
-        self.member_address = d['member_address']
+class MembershipRequestMessage(LobbyMessage, subtype=LobbyMessageType.MembershipRequest):
+    _fields = (Int64('epoch'), Str('issuer'))
 
-    @property
-    def __dict__(self) -> dict[str, any]:
-        d = super().__dict__
-        d['member_address'] = self.member_address
-        return d
+    def __init__(self, sender: str, epoch: int, issuer: str):
+        super().__init__(sender)
+        self.epoch = epoch # The last membership epoch the sender has seen
+        self.issuer = issuer # The leader which issued that epoch
+
+class CommandRequestMessage(LobbyMessage, subtype=LobbyMessageType.CommandRequest):
+    _fields = (Int64('since'),)
+
+    def __init__(self, sender: str, since: int):
+        super().__init__(sender)
+        self.since = since # The sequence number of the last application command the sender has applied in order
+
+class RelayUnreachableMessage(LobbyMessage, subtype=LobbyMessageType.RelayUnreachable):
+    _fields = (Addresses('unreachable'),)
+
+    def __init__(self, sender: str, unreachable: list[str]):
+        super().__init__(sender)
+        self.unreachable = unreachable # The members a relay could not forward a relayed message to
+
+class MembershipDeltaMessage(LobbyMessage, subtype=LobbyMessageType.MembershipDelta):
+    _fields = (Int64('since'), Int64('epoch'), Members('joined'), Addresses('left'))
+
+    def __init__(self, sender: str, since: int, epoch: int, joined: dict[str, any], left: list[str]):
+        super().__init__(sender)
+        self.since = since # The epoch the changes apply on, -1 if joined contains all the members
+        self.epoch = epoch # The epoch after the changes
+        self.joined = joined
+        self.left = left
 
 ###################
 # HEALTH MESSAGES #
 ###################
-class HealthCheckMessage(BaseMessage):
-    def __init__(self, sender: str):
-        super().__init__(MessageTypes.HealthCheckMessage)
-        self.sender = sender
-
-    def __init_from_dict__(self, d: dict[str, any]):
-        super().__init_from_dict__(d)
-        self.sender = d['sender']
+class HealthCheckMessage(BaseMessage, type=MessageTypes.HealthCheckMessage):
+    _fields = (Str('sender'), Int64('sent_at'), Int64('echo'), Latencies('rtts'), Addresses('ranking'), Int64('epoch'), Int64('command_seq'))
 
-    @property
-    def __dict__(self) -> dict[str, any]:
-        d = super().__dict__
-        d['sender'] = self.sender
-        return d
-    
-    def from_dict(d: dict[str, any]) -> BaseMessage:
-        msg = HealthCheckMessage.__new__(HealthCheckMessage)
-        msg.__init_from_dict__(d)
-        return msg
+    def __init__(self, sender: str, sent_at: int = 0, echo: int = 0, rtts: dict[str, int] = None, ranking: list[str] = None, epoch: int = 0, command_seq: int = 0):
+        self.sender = sender
+        self.sent_at = sent_at # When the health check was sent, microseconds of the monotonic clock of the sender, 0 if not measured
+        self.echo = echo # The sent_at of the health check this one answers, 0 if none
+        self.rtts = rtts if rtts is not None else {} # The round trip times of the sender to the other members in microseconds
+        self.ranking = ranking if ranking is not None else [] # The members the leader prefers as the next leader, the best first
+        self.epoch = epoch # The membership epoch of the leader, so the members notice the changes they have missed
+        self.command_seq = command_seq # The sequence number of the last application command of the leader
 
 #####################
 # ELECTION MESSAGES #
@@ -211,53 +220,133 @@ class ElectionMessageType(Enum):
     ElectionStart = 1
     ElectionOk = 2
     IAmLeader = 3
+    RequestVote = 4
+    Vote = 5
+    Successor = 6
+    StandbySync = 7
+    Handoff = 8
 
-class ElectionMessage(BaseMessage):
-    def __init__(self, type: ElectionMessageType, sender: str):
-        super().__init__(MessageTypes.Election)
-        self.election_type = type.value
+class ElectionMessage(BaseMessage, type=MessageTypes.Election, subtype_attribute='election_type'):
+    _fields = (Str('sender'),)
+
+    def __init__(self, sender: str):
         self.sender = sender
-    
-    def __init_from_dict__(self, d: dict[str, any]):
-        super().__init_from_dict__(d)
-        self.election_type = d['election_type']
-        self.sender = d['sender']
 
-    @property
-    def __dict__(self) -> dict[str, any]:
-        d = super().__dict__
-        d['election_type'] = self.election_type
-        d['sender'] = self.sender
-        return d
-    
-    def from_dict(d: dict[str, any]) -> BaseMessage:
-        msg = None
-        match d['election_type']:
-            case ElectionMessageType.ElectionStart.value:
-                msg = ElectionStartMessage.__new__(ElectionStartMessage)
+class ElectionStartMessage(ElectionMessage, subtype=ElectionMessageType.ElectionStart):
+    _fields = (Str('leader'),)
 
-            case ElectionMessageType.ElectionOk.value:
-                msg = ElectionOkMessage.__new__(ElectionOkMessage)
+    def __init__(self, sender: str, leader: str):
+        super().__init__(sender)
+        self.leader = leader # The leader to be replaced
 
-            case ElectionMessageType.IAmLeader.value:
-                msg = IAmLeaderMessage.__new__(IAmLeaderMessage)
+class ElectionOkMessage(ElectionMessage, subtype=ElectionMessageType.ElectionOk):
+    def __init__(self, sender: str):
+        super().__init__(sender)
 
-        if msg is not None:
-            msg.__init_from_dict__(d)
+class IAmLeaderMessage(ElectionMessage, subtype=ElectionMessageType.IAmLeader):
+    _fields = (Int32('term'),)
 
-        return msg
+    def __init__(self, sender: str, term: int = 0):
+        super().__init__(sender)
+        self.term = term # The term of the new leader, always 0 in the bully election
 
-class ElectionStartMessage(ElectionMessage):
-    def __init__(self, sender: str):
-        super().__init__(ElectionMessageType.ElectionStart, sender)
+class RequestVoteMessage(ElectionMessage, subtype=ElectionMessageType.RequestVote):
+    _fields = (Int32('term'), Str('leader'))
 
-class ElectionOkMessage(ElectionMessage):
-    def __init__(self, sender: str):
-        super().__init__(ElectionMessageType.ElectionOk, sender)
+    def __init__(self, sender: str, term: int, leader: str):
+        super().__init__(sender)
+        self.term = term # The term the sender is a candidate in
+        self.leader = leader # The leader to be replaced
 
-class IAmLeaderMessage(ElectionMessage):
-    def __init__(self, sender: str):
-        super().__init__(ElectionMessageType.IAmLeader, sender)
+class VoteMessage(ElectionMessage, subtype=ElectionMessageType.Vote):
+    _fields = (Int32('term'), Bool('granted'))
+
+    def __init__(self, sender: str, term: int, granted: bool):
+        super().__init__(sender)
+        self.term = term
+        self.granted = granted
+
+class SuccessorMessage(ElectionMessage, subtype=ElectionMessageType.Successor):
+    _fields = (Str('successor'),)
+
+    def __init__(self, sender: str, successor: str):
+        super().__init__(sender)
+        self.successor = successor # The member taking over when the sender (the leader) fails
+
+class StandbySyncMessage(ElectionMessage, subtype=ElectionMessageType.StandbySync):
+    _fields = (Members('members'), StateField('state'), Int64('command_seq'))
+
+    def __init__(self, sender: str, members: dict[str, any], state: State, command_seq: int):
+        super().__init__(sender)
+        self.members = members
+        self.state = state # The index is -1 if the application does not provide its state
+        self.command_seq = command_seq # The number of application commands the leaders have broadcast
+
+class HandoffMessage(ElectionMessage, subtype=ElectionMessageType.Handoff):
+    _fields = (Members('members'), StateField('state'), Int32('term'), Int64('command_seq'))
+
+    def __init__(self, sender: str, members: dict[str, any], state: State, term: int, command_seq: int):
+        super().__init__(sender)
+        self.members = members
+        self.state = state # The index is -1 if the application does not provide its state
+        self.term = term # The term of the leaving leader
+        self.command_seq = command_seq # The number of application commands the leaders have broadcast
+
+#################
+# SWIM MESSAGES #
+#################
+class SwimMessageType(Enum):
+    Ping = 1
+    PingReq = 2
+    Ack = 3
+
+class SwimUpdateType(Enum):
+    Alive = 0
+    Suspect = 1
+    Confirm = 2
+
+class SwimMessage(BaseMessage, type=MessageTypes.Swim, subtype_attribute='swim_type'):
+    # Every message carries membership updates (type, address, incarnation) for the gossip
+    _fields = (Str('sender'), Int32('seq'), SwimUpdates('updates'), Int64('epoch'), Int64('command_seq'))
+
+    def __init__(self, sender: str, seq: int, updates: list[tuple[int, str, int]]):
+        self.sender = sender
+        self.seq = seq
+        self.updates = updates
+        self.epoch = 0 # The membership epoch of the sender, if it is the leader
+        self.command_seq = 0 # The sequence number of the last application command of the sender, if it is the leader
+
+class SwimPingMessage(SwimMessage, subtype=SwimMessageType.Ping):
+    def __init__(self, sender: str, seq: int, updates: list[tuple[int, str, int]]):
+        super().__init__(sender, seq, updates)
+
+class SwimPingReqMessage(SwimMessage, subtype=SwimMessageType.PingReq):
+    _fields = (Str('target'),)
+
+    def __init__(self, sender: str, seq: int, updates: list[tuple[int, str, int]], target: str):
+        super().__init__(sender, seq, updates)
+        self.target = target # The member to be probed on behalf of the sender
+
+class SwimAckMessage(SwimMessage, subtype=SwimMessageType.Ack):
+    _fields = (Str('target'),)
+
+    def __init__(self, sender: str, seq: int, updates: list[tuple[int, str, int]], target: str):
+        super().__init__(sender, seq, updates)
+        self.target = target # The member which was probed
+
+##################
+# RELAY MESSAGES #
+##################
+class RelayMessage(BaseMessage, type=MessageTypes.Relay):
+    _fields = (Str('sender'), Int32('depth'), Int32('fanout'), Int64('sent_at'), Addresses('subtree'), Payload('payload'))
+
+    def __init__(self, sender: str, depth: int, fanout: int, sent_at: int, subtree: list[str], payload: bytes):
+        self.sender = sender
+        self.depth = depth # The depth of the receiver in the relay tree, the leader is at depth 0
+        self.fanout = fanout # The number of relays the subtree is split between
+        self.sent_at = sent_at # When the leader sent the message, microseconds since the epoch
+        self.subtree = subtree # The members the receiver forwards the message to
+        self.payload = payload # The relayed message, including its routing header
 
 ########################
 # APPLICATION MESSAGES #
@@ -269,97 +358,39 @@ class CommandType(Enum):
     Set = 4
     State = 5
 
-class ApplicationMessage(BaseMessage):
-    command_type: int
-
-    def __init__(self, command_type: int):
-        super().__init__(MessageTypes.ApplicationMessage)
-        self.command_type = command_type
-
-    def __init_from_dict__(self, d: dict[str, any]):
-        super().__init_from_dict__(d)
-        self.command_type = d["command_type"]
-
-    @property
-    def __dict__(self) -> dict[str, any]:
-        d = super().__dict__
-        d['command_type'] = self.command_type
-        return d
-    
-    def from_dict(d: dict[str, any]) -> "ApplicationMessage":
-        message = None
-        match d["command_type"]:
-            case CommandType.Stop.value:
-                message = StopMessage.__new__(StopMessage)
-
-            case CommandType.Resume.value:
-                message = ResumeMessage.__new__(ResumeMessage)
-            
-            case CommandType.JumpToTimestamp.value:
-                message = JumpToTimestampMessage.__new__(JumpToTimestampMessage)
-
-            case CommandType.Set.value:
-                message = SetMessage.__new__(SetMessage)
+class ApplicationMessage(BaseMessage, type=MessageTypes.ApplicationMessage, subtype_attribute='command_type'):
+    _fields = (Int64('seq'),)
 
-            case CommandType.State.value:
-                message = StateMessage.__new__(StateMessage)
+    command_type: int
 
-        if message is not None:
-            message.__init_from_dict__(d)
+    def __init__(self):
+        self.seq = 0 # The sequence number the leader assigned to the command, 0 if it has not been broadcast
 
-        return message
+class StopMessage(ApplicationMessage, subtype=CommandType.Stop):
+    pass
 
-class StopMessage(ApplicationMessage):
-    def __init__(self):
-        super().__init__(CommandType.Stop.value)
+class ResumeMessage(ApplicationMessage, subtype=CommandType.Resume):
+    pass
 
-class ResumeMessage(ApplicationMessage):
-    def __init__(self):
-        super().__init__(CommandType.Resume.value)
+class SetMessage(ApplicationMessage, subtype=CommandType.Set):
+    _fields = (Int32('index'),)
 
-class SetMessage(ApplicationMessage):
     def __init__(self, index: int = -1):
-        super().__init__(CommandType.Set.value)
+        super().__init__()
         self.index = index
 
-    def __init_from_dict__(self, d: dict[str, any]):
-        super().__init_from_dict__(d)
-        self.index = d["index"]
+class JumpToTimestampMessage(ApplicationMessage, subtype=CommandType.JumpToTimestamp):
+    _fields = (Int64('destination_timestamp'),)
 
-    @property
-    def __dict__(self) -> dict[str, any]:
-        d = super().__dict__
-        d["index"] = self.index
-        return d
-
-class JumpToTimestampMessage(ApplicationMessage):
     destination_timestamp: int
 
     def __init__(self, destination_timestamp: int = -1):
-        super().__init__(CommandType.JumpToTimestamp.value)
+        super().__init__()
         self.destination_timestamp = destination_timestamp
 
-    def __init_from_dict__(self, d: dict[str, any]):
-        super().__init_from_dict__(d)
-        self.destination_timestamp = d["destination_timestamp"]
-
-    @property
-    def __dict__(self) -> dict[str, any]:
-        d = super().__dict__
-        d["destination_timestamp"] = self.destination_timestamp
-        return d
+class StateMessage(ApplicationMessage, subtype=CommandType.State):
+    _fields = (StateField('state'),)
 
-class StateMessage(ApplicationMessage):
     def __init__(self, state: State):
-        super().__init__(CommandType.State.value)
+        super().__init__()
         self.state = state
-
-    def __init_from_dict__(self, d: dict[str, any]):
-        super().__init_from_dict__(d)
-        self.state = State(**d["state"])
-
-    @property
-    def __dict__(self) -> dict[str, any]:
-        d = super().__dict__
-        d["state"] = self.state.__dict__
-        return d
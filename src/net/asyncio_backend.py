@@ -0,0 +1,249 @@
+import asyncio
+import queue
+import socket
+
+from collections import deque
+from typing import Callable
+
+from net.backend import _FRAME_HEADER, IpAddress, NetBackend
+
+import log
+
+_logger = log.getLogger(__name__)
+
+class AsyncioBackend(NetBackend):
+    """
+    Networking backend running on an asyncio event loop.
+
+    The backend uses the same length-prefixed framing and one pooled connection per peer as the
+    TcpBackend, but all the connections are served by the coroutines of a single event loop instead
+    of threads. The received messages are handed to the given callback on the loop, or to receive()
+    when no callback is given.
+
+    Sending never blocks: the message is queued to the connection of the peer and written by the loop.
+    A send only fails when the last attempt to connect to the peer has failed, the connection is
+    nevertheless retried in the background.
+    """
+    blocking_send = False
+
+    # Time we wait for connecting to a peer
+    _CONNECT_TIMEOUT = 1.0
+
+    # Time receive() waits for a message before giving up
+    _RECEIVE_TIMEOUT = 3.0
+
+    # Time we wait for the pending messages to be written on shutdown
+    _SHUTDOWN_TIMEOUT = 1.0
+
+    # The event loop serving the connections
+    _loop: asyncio.AbstractEventLoop
+
+    # Called on the loop with every received message, if given
+    _on_message: Callable[[IpAddress, bytes], None] | None
+
+    # Received messages, used only without a callback
+    _inbox: queue.Queue
+
+    # Listening socket of the backend
+    _server_socket: socket.socket
+
+    # The asyncio server accepting the incoming connections
+    _server: asyncio.AbstractServer | None
+
+    # Outgoing connections, one per peer
+    _connections: dict[IpAddress, "_OutgoingConnection"]
+
+    # Peers whose last connection attempt has failed
+    _unreachable: set[IpAddress]
+
+    def __init__(self, port: int, loop: asyncio.AbstractEventLoop, on_message: Callable[[IpAddress, bytes], None] = None) -> None:
+        self._loop = loop
+        self._on_message = on_message
+        self._inbox = queue.Queue()
+        self._server = None
+        self._connections = {}
+        self._unreachable = set()
+
+        # The socket is bound here, so the errors are raised to the caller
+        self._server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server_socket.bind(('0.0.0.0', port))
+        self._server_socket.listen()
+        self._server_socket.setblocking(False)
+
+        self._call_on_loop(self._start_server)
+
+    def receive(self) -> (IpAddress, bytes):
+        try:
+            return self._inbox.get(timeout=self._RECEIVE_TIMEOUT)
+        except queue.Empty:
+            return (None, None)
+
+    def send(self, dest: IpAddress, data: bytes) -> bool:
+        _logger.info(f'Sending {len(data)} bytes to {dest}')
+        self._call_on_loop(self._enqueue, dest, data)
+        return dest not in self._unreachable
+
+    def shutdown(self) -> None:
+        if self._is_loop_thread():
+            self._loop.create_task(self._close())
+        elif self._loop.is_running():
+            future = asyncio.run_coroutine_threadsafe(self._close(), self._loop)
+            try:
+                future.result(self._SHUTDOWN_TIMEOUT * 3)
+            except TimeoutError:
+                pass
+        else:
+            self._server_socket.close()
+
+    def _is_loop_thread(self) -> bool:
+        """
+        Check whether the caller runs on the event loop of the backend.
+        """
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _call_on_loop(self, callback: Callable, *args):
+        """
+        Call the given callback on the event loop, regardless of the calling thread.
+        """
+        if self._is_loop_thread():
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    def _start_server(self):
+        """
+        Start serving the incoming connections on the listening socket.
+        """
+        async def start():
+            self._server = await asyncio.start_server(self._serve, sock=self._server_socket)
+        self._loop.create_task(start())
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Read the length-prefixed messages of a single incoming connection.
+
+        Parameters:
+        - reader (asyncio.StreamReader): The reading end of the connection.
+        - writer (asyncio.StreamWriter): The writing end of the connection.
+        """
+        peer = writer.get_extra_info('peername')
+        source = f'{peer[0]}:{peer[1]}'
+        try:
+            while True:
+                header = await reader.readexactly(_FRAME_HEADER.size)
+                (length,) = _FRAME_HEADER.unpack(header)
+                data = await reader.readexactly(length)
+                _logger.info(f'Received message of {length} bytes from {source}')
+                if self._on_message is not None:
+                    self._on_message(source, data)
+                else:
+                    self._inbox.put((source, data))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass # Sender closed the connection
+        except Exception:
+            _logger.exception(f'Failed to process message from {source}')
+        finally:
+            writer.close()
+
+    def _enqueue(self, dest: IpAddress, data: bytes):
+        """
+        Queue a message to the connection of the given peer, connecting to it if necessary.
+
+        Parameters:
+        - dest (IpAddress): The address of the peer combined with port.
+        - data (bytes): The message.
+        """
+        connection = self._connections.get(dest)
+        if connection is None or connection.closed:
+            connection = _OutgoingConnection(dest)
+            self._connections[dest] = connection
+            connection.pending.append(data)
+            self._loop.create_task(self._connect(connection))
+        elif connection.writer is None:
+            connection.pending.append(data)
+        else:
+            connection.writer.writelines((_FRAME_HEADER.pack(len(data)), data))
+
+    async def _connect(self, connection: "_OutgoingConnection"):
+        """
+        Open the connection to a peer and write the messages queued meanwhile.
+
+        Parameters:
+        - connection (_OutgoingConnection): The connection to open.
+        """
+        parts = connection.dest.split(':')
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(parts[0], int(parts[1])), self._CONNECT_TIMEOUT)
+        except (OSError, ValueError, asyncio.TimeoutError):
+            _logger.info(f'Failed to connect to {connection.dest}')
+            self._unreachable.add(connection.dest)
+            connection.close()
+            connection.attempted.set()
+            return
+
+        self._unreachable.discard(connection.dest)
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection.writer = writer
+        while connection.pending:
+            data = connection.pending.popleft()
+            writer.writelines((_FRAME_HEADER.pack(len(data)), data))
+        connection.attempted.set()
+
+        # The peer never writes to this connection, so anything read means it was closed
+        try:
+            await reader.read(1)
+        except ConnectionError:
+            pass
+        connection.close()
+
+    async def _close(self):
+        """
+        Stop accepting connections, write the pending messages and close all the connections.
+
+        The connection attempts still in progress are waited for, so the messages queued to them are written as well.
+        """
+        if self._server is not None:
+            self._server.close()
+        else:
+            self._server_socket.close()
+
+        # The messages queued while connecting (e.g. a leave sent right before the shutdown) are written
+        # once the connection is open, so the pending connection attempts are waited for first
+        attempts = [asyncio.ensure_future(connection.attempted.wait()) for connection in self._connections.values()
+                    if connection.writer is None and not connection.closed]
+        if attempts:
+            _, not_done = await asyncio.wait(attempts, timeout=self._SHUTDOWN_TIMEOUT)
+            for attempt in not_done:
+                attempt.cancel()
+
+        writers = [connection.writer for connection in self._connections.values() if connection.writer is not None]
+        for writer in writers:
+            try:
+                await asyncio.wait_for(writer.drain(), self._SHUTDOWN_TIMEOUT)
+            except (ConnectionError, asyncio.TimeoutError):
+                pass
+            writer.close()
+        self._connections.clear()
+
+class _OutgoingConnection:
+    """
+    State of the pooled connection to a single peer.
+    """
+    __slots__ = ('dest', 'writer', 'pending', 'closed', 'attempted')
+
+    def __init__(self, dest: IpAddress):
+        self.dest = dest
+        self.writer: asyncio.StreamWriter | None = None
+        self.pending: deque[bytes] = deque() # Messages queued while connecting
+        self.closed = False
+        self.attempted = asyncio.Event() # Set when the connection attempt has finished, whether it succeeded or not
+
+    def close(self):
+        self.closed = True
+        self.pending.clear()
+        if self.writer is not None:
+            self.writer.close()
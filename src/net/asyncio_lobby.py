@@ -0,0 +1,159 @@
+import asyncio
+import threading
+
+from typing import Callable
+
+from net.asyncio_backend import AsyncioBackend
+from net.backend import NetBackend
+from net.lobby import NetLobby
+
+from messages.messages import BaseMessage
+
+import log
+
+_logger = log.getLogger(__name__)
+
+class AsyncioNetLobby(NetLobby):
+    """
+    Lobby driven by a single asyncio event loop.
+
+    The AsyncioNetLobby provides the same functionality as the NetLobby, but instead of a receiving
+    thread, blocking sockets and a thread for every timer, everything runs on one event loop thread:
+    the connections are served by an AsyncioBackend, the message handlers are called on the loop as
+    the messages arrive and the timers of the health check and the leader election are loop callbacks.
+
+    Other threads (e.g. the GUI or the media player callbacks) must not call into the lobby directly,
+    they should hand their operations over to the loop with submit().
+    """
+
+    # The event loop running the lobby
+    _loop: asyncio.AbstractEventLoop
+
+    # The thread running the event loop
+    _loop_thread: threading.Thread
+
+    def __init__(self):
+        super().__init__()
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._run_loop, daemon=True)
+
+    def start(self):
+        """
+        Start the event loop of the lobby.
+
+        Note:
+        To the start the message handling the lobby needs to be hosted or joined to another lobby.
+        """
+        self._exit = False
+        self._loop_thread.start()
+
+    def stop(self):
+        """
+        Stops and finishes the lobby.
+
+        This method stops the health check, closes the connections and finally stops the event loop.
+        """
+        self._exit = True
+        self._stop_health_check()
+        if self._backend is not None:
+            self._backend.shutdown()
+        if self._loop_thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+
+    def submit(self, callback: Callable, *args):
+        """
+        Run a callback on the event loop of the lobby.
+
+        The callback is called immediately if the caller already runs on the loop, otherwise it is
+        scheduled to be called on the loop as soon as possible.
+
+        Parameters:
+        - callback (Callable): The callback to run.
+        - args: Positional arguments to be passed to the callback.
+        """
+        if self._is_loop_thread():
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    def _run_loop(self):
+        """
+        Run the event loop until the lobby is stopped.
+
+        After the loop has been stopped, the remaining tasks (e.g. the incoming connections) are cancelled
+        and given a chance to clean up before the loop is closed.
+        """
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    def _is_loop_thread(self) -> bool:
+        """
+        Check whether the caller runs on the event loop of the lobby.
+        """
+        return threading.current_thread() is self._loop_thread
+
+    def _create_backend(self, port: int) -> NetBackend:
+        """
+        Create an AsyncioBackend, which delivers the messages straight to the handlers on the loop.
+
+        Parameters:
+        - port (int): The port number the backend listens on.
+
+        Returns:
+        - NetBackend: The backend used to send and receive the messages.
+        """
+        return AsyncioBackend(port, self._loop, self._process_data)
+
+    def _process_data(self, source: str, data: bytes):
+        try:
+            super()._process_data(source, data)
+        except Exception:
+            _logger.exception(f'Failed to process message from {source}')
+
+    def _dispatch(self, sender: str, msg: BaseMessage):
+        """
+        Call the handler of a received message right away on the event loop.
+        """
+        self._call_message_handler(type(msg), msg)
+
+    def _schedule(self, delay: float, callback: Callable, *args) -> "_LoopTimer":
+        """
+        Schedule a callback to be called once on the event loop after the given delay.
+
+        Parameters:
+        - delay (float): The delay in seconds.
+        - callback (Callable): The callback to call.
+        - args: Positional arguments to be passed to the callback.
+
+        Returns:
+        - _LoopTimer: A timer handle, which can be used to cancel the callback from any thread.
+        """
+        return _LoopTimer(self, delay, callback, args)
+
+class _LoopTimer:
+    """
+    Thread-safe handle of a callback scheduled on the event loop of an AsyncioNetLobby.
+    """
+    __slots__ = ('_handle', '_cancelled')
+
+    def __init__(self, lobby: AsyncioNetLobby, delay: float, callback: Callable, args: tuple):
+        self._handle: asyncio.TimerHandle | None = None
+        self._cancelled = False
+        lobby.submit(self._arm, lobby._loop, delay, callback, args)
+
+    def _arm(self, loop: asyncio.AbstractEventLoop, delay: float, callback: Callable, args: tuple):
+        if not self._cancelled:
+            self._handle = loop.call_later(delay, callback, *args)
+
+    def cancel(self):
+        self._cancelled = True
+        handle = self._handle
+        if handle is not None:
+            handle.cancel()
@@ -1,18 +1,29 @@
 from abc import ABC, abstractmethod
 import log
+import queue
+import select
+import selectors
 import socket
+import struct
+import threading
 
 IpAddress = str
 
 _logger = log.getLogger(__name__)
 
+# Every message on the wire is prefixed with its length as a 4-byte big-endian integer
+_FRAME_HEADER = struct.Struct('!I')
+
 class NetBackend(ABC):
+    # Whether send() can block the caller until the message is written (e.g. on connecting)
+    blocking_send = True
+
     @abstractmethod
-    def receive(self) -> tuple[IpAddress, str]:
+    def receive(self) -> tuple[IpAddress, bytes]:
         pass
 
     @abstractmethod
-    def send(self, dest: IpAddress, data: str) -> None:
+    def send(self, dest: IpAddress, data: bytes) -> bool:
         pass
 
     @abstractmethod
@@ -20,45 +31,279 @@ class NetBackend(ABC):
         pass
 
 class TcpBackend(NetBackend):
-    """Quick and dirty networking."""
+    """
+    Networking over persistent, length-prefixed TCP connections.
+
+    Instead of opening a new connection for every message, the backend keeps one long-lived
+    connection per peer in a pool. The connection is opened on the first send and transparently
+    reopened when the peer has dropped it. Since the connections stay open, every message is
+    framed with a length prefix to mark its boundaries.
+
+    All incoming connections are served by a single selector loop, which reassembles the
+    messages of every connection separately and hands the complete ones to receive().
+    """
+    # Time we wait for connecting and sending to a peer
+    _SEND_TIMEOUT = 1.0
+
+    # Time receive() waits for a message before giving up
+    _RECEIVE_TIMEOUT = 3.0
+
+    # Time the receive loop waits for socket events before checking whether it should exit
+    _SELECT_TIMEOUT = 0.5
+
+    # Maximum number of bytes read from a connection at once
+    _RECV_SIZE = 65536
+
     server: socket.socket
 
+    # Pooled outgoing connections, one per peer
+    _connections: dict[IpAddress, socket.socket]
+
+    # Serializes the sends to the same peer, so the frames are not interleaved
+    _send_locks: dict[IpAddress, threading.Lock]
+
+    # Guards the connection pool and the send locks
+    _pool_lock: threading.Lock
+
+    # Watches the listening socket and the incoming connections (epoll where available)
+    _selector: selectors.BaseSelector
+
+    # Complete messages received from any of the incoming connections
+    _inbox: queue.Queue
+
+    # Accepts and reads all the incoming connections
+    _receive_thread: threading.Thread
+
+    # Used to end the receive thread
+    _running: bool
+
     def __init__(self, port: int) -> None:
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.server.bind(('0.0.0.0', port))
         self.server.listen()
-        self.server.settimeout(3)
+        self.server.setblocking(False)
+
+        self._connections = {}
+        self._send_locks = {}
+        self._pool_lock = threading.Lock()
+        self._inbox = queue.Queue()
+        self._running = True
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.server, selectors.EVENT_READ)
+
+        self._receive_thread = threading.Thread(target=self._receive_loop, daemon=True)
+        self._receive_thread.start()
 
-    def receive(self) -> (IpAddress, str):
-        # This can only receive from one peer at a time, hopefully that is fine
+    def receive(self) -> (IpAddress, bytes):
         try:
-            conn, source = self.server.accept()
-            data = bytearray()
-            while True:
-                frame = conn.recv(1000)
-                _logger.info(f'Received frame of {len(frame)} bytes')
-                if not frame:
-                    break # Sender closed connection, which it will always do with our send(...)
-                data.extend(frame)
-            
-            return (f'{source[0]}:{source[1]}', data.decode('utf-8'))
-        except socket.timeout:
+            return self._inbox.get(timeout=self._RECEIVE_TIMEOUT)
+        except queue.Empty:
             return (None, None)
 
-    def send(self, dest: IpAddress, data: str) -> bool:
-        # Connect, send, close - inefficient, but easy
-        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client.settimeout(1)
+    def send(self, dest: IpAddress, data: bytes) -> bool:
         _logger.info(f'Sending {len(data)} bytes to {dest}')
+
+        with self._send_lock(dest):
+            conn = self._connections.get(dest)
+            if conn is not None and _is_closed(conn):
+                self._drop_connection(dest)
+                conn = None
+
+            # A pooled connection can still turn out to be dead, in that case we retry once on a new one
+            pooled = conn is not None
+            while True:
+                if conn is None:
+                    try:
+                        conn = self._connect(dest)
+                    except (socket.error, ValueError):
+                        return False
+                    self._connections[dest] = conn
+
+                try:
+                    _send_frame(conn, data)
+                    return True
+                except socket.error:
+                    self._drop_connection(dest)
+                    conn = None
+                    if not pooled:
+                        return False
+                    pooled = False
+
+    def shutdown(self) -> None:
+        self._running = False
+        with self._pool_lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+        self._receive_thread.join()
+
+    def _send_lock(self, dest: IpAddress) -> threading.Lock:
+        """
+        Get the lock serializing the sends to the given peer.
+
+        Parameters:
+        - dest (IpAddress): The address of the peer.
+
+        Returns:
+        - threading.Lock: The lock belonging to the peer.
+        """
+        with self._pool_lock:
+            if dest not in self._send_locks:
+                self._send_locks[dest] = threading.Lock()
+            return self._send_locks[dest]
+
+    def _connect(self, dest: IpAddress) -> socket.socket:
+        """
+        Open a new connection to the given peer.
+
+        Parameters:
+        - dest (IpAddress): The address of the peer combined with port.
+
+        Returns:
+        - socket.socket: The connected socket.
+        """
         parts = dest.split(':')
+        conn = socket.create_connection((parts[0], int(parts[1])), timeout=self._SEND_TIMEOUT)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        _logger.info(f'Opened connection to {dest}')
+        return conn
+
+    def _drop_connection(self, dest: IpAddress):
+        """
+        Close and forget the pooled connection of the given peer.
+
+        Parameters:
+        - dest (IpAddress): The address of the peer.
+        """
+        with self._pool_lock:
+            conn = self._connections.pop(dest, None)
+        if conn is not None:
+            conn.close()
+
+    def _receive_loop(self):
+        """
+        Multiplex the listening socket and all incoming connections on a single thread.
+
+        The loop accepts new connections and reads whatever data is available on any of the
+        incoming connections, so a slow or stalled sender cannot hold up the others. The data
+        is collected into a per-connection buffer, and every complete message is put to the inbox.
+        """
+        while self._running:
+            for key, _ in self._selector.select(timeout=self._SELECT_TIMEOUT):
+                if key.fileobj is self.server:
+                    self._accept()
+                else:
+                    self._read(key.fileobj, key.data)
+
+        for key in list(self._selector.get_map().values()):
+            _close(key.fileobj)
+        self._selector.close()
+
+    def _accept(self):
+        """
+        Accept a pending incoming connection and register it to the selector.
+        """
+        try:
+            conn, source = self.server.accept()
+        except (BlockingIOError, socket.timeout):
+            return
+        except OSError:
+            self._running = False
+            return
+        conn.setblocking(False)
+        self._selector.register(conn, selectors.EVENT_READ, _IncomingConnection(f'{source[0]}:{source[1]}'))
+
+    def _read(self, conn: socket.socket, incoming: "_IncomingConnection"):
+        """
+        Read the available data of an incoming connection and extract the complete messages.
+
+        Parameters:
+        - conn (socket.socket): The readable incoming connection.
+        - incoming (_IncomingConnection): The reassembly state of the connection.
+        """
         try:
-            client.connect((parts[0], int(parts[1])))
-            client.sendall(data.encode('utf-8'))
-            client.close()
-        except socket.error:
-            return False
+            chunk = conn.recv(self._RECV_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b''
+
+        if not chunk:
+            # Sender closed the connection
+            self._selector.unregister(conn)
+            conn.close()
+            return
+
+        for data in incoming.feed(chunk):
+            _logger.info(f'Received message of {len(data)} bytes from {incoming.source}')
+            self._inbox.put((incoming.source, data))
+
+class _IncomingConnection:
+    """
+    Reassembles the length-prefixed messages of a single incoming connection.
+    """
+    __slots__ = ('source', '_buffer')
+
+    def __init__(self, source: IpAddress):
+        self.source = source
+        self._buffer = bytearray()
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        """
+        Append received data to the buffer and return the messages completed by it.
+
+        Parameters:
+        - chunk (bytes): The newly received data.
+
+        Returns:
+        - list[bytes]: The complete messages, in the order they were sent.
+        """
+        self._buffer.extend(chunk)
+        messages = []
+        offset = 0
+        while len(self._buffer) - offset >= _FRAME_HEADER.size:
+            (length,) = _FRAME_HEADER.unpack_from(self._buffer, offset)
+            end = offset + _FRAME_HEADER.size + length
+            if len(self._buffer) < end:
+                break
+            messages.append(bytes(self._buffer[offset + _FRAME_HEADER.size:end]))
+            offset = end
+        del self._buffer[:offset]
+        return messages
+
+def _send_frame(conn: socket.socket, data: bytes):
+    """
+    Send a message with its length prefix.
+
+    The prefix and the message are sent with a single gather write, so the message buffer
+    is not copied (it may be shared between several sends, e.g. by a broadcast).
+    """
+    header = _FRAME_HEADER.pack(len(data))
+    sent = conn.sendmsg([header, data])
+    if sent < len(header) + len(data):
+        conn.sendall(memoryview(header + data)[sent:])
+
+def _is_closed(conn: socket.socket) -> bool:
+    """
+    Check whether the remote end has closed a pooled connection.
+
+    The receiving side never writes to the connection, so if it is readable it can only
+    mean that it was closed or reset.
+    """
+    try:
+        readable, _, _ = select.select([conn], [], [], 0)
+        return bool(readable)
+    except (OSError, ValueError):
         return True
-    
-    def shutdown(self) -> None:
-        return
-        self.server.shutdown(socket.SHUT_RDWR)
\ No newline at end of file
+
+def _close(sock: socket.socket):
+    """
+    Shut down and close a socket, waking up the threads blocked on it.
+    """
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    sock.close()
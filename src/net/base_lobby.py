@@ -1,60 +1,29 @@
 import random
-import json
+import struct
 import threading
+import time
 
-from abc import abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 
-from dataclasses import dataclass
+from abc import abstractmethod
+from typing import Callable
 
 from net.backend import IpAddress, NetBackend, TcpBackend
+from net.dispatcher import OrderedDispatcher
+from net.membership import Membership, MembershipDelta, MembershipSnapshot, Peer
+from net.timer_wheel import TimerWheel, WheelTimer
 
 from event_manager.event_manager import EventManager
 from event_manager.message_manager import MessageManager
 
 from messages.messages import *
+from messages.codec import BinaryCodec, Codec, decode_message
 
 import log
 
 _logger = log.getLogger(__name__)
 
-@dataclass
-class LobbyMessage:
-    to_leader: bool
-    message: BaseMessage
-
-    @property
-    def __dict__(self) -> dict[str, any]:
-        return {
-            'to_leader': self.to_leader,
-            'message': self.message.__dict__
-        }
-    
-    def from_dict(d: dict[str, any]) -> "LobbyMessage":
-        return LobbyMessage(d["to_leader"], BaseMessage.from_dict(d["message"]))
-
-@dataclass
-class Peer:
-    ip: str = ""
-    port: int = 0
-    name: str = ""
-    id: int = 0
-    is_leader: bool = True
-    is_alive: bool = True
-
-    @property
-    def ip_address(self) -> IpAddress:
-        return f"{self.ip}:{self.port}"
-
-    def __str__(self) -> str:
-        return f"{self.name}:{self.id}"
-    
-    def __eq__(self, __value: object) -> bool:
-        if isinstance(__value, Peer):
-            return self.ip == __value.ip and self.port == __value.port
-        elif isinstance(__value, IpAddress):
-            return self.ip_address == __value
-        return False
-
 class BaseLobby(EventManager, MessageManager):
     """
     Base class for hosting or joining another lobby.
@@ -71,6 +40,24 @@ class BaseLobby(EventManager, MessageManager):
     # The event raised when a member has joined the lobby
     EVENT_NEW_MEMBER = "new_member"
 
+    # Time a broadcast waits for the sends to all the members to finish
+    _BROADCAST_DEADLINE = 2.0
+
+    # Maximum number of members a broadcast sends to at the same time
+    _BROADCAST_WORKERS = 32
+
+    # Maximum number of message handlers running at the same time
+    _DISPATCH_WORKERS = 8
+
+    # Maximum number of timer callbacks running at the same time
+    _TIMER_WORKERS = 4
+
+    # Number of the latest membership changes kept, so the members which missed some can catch up without a snapshot
+    _MEMBERSHIP_LOG_SIZE = 64
+
+    # The message types handled by the control dispatcher, so they never wait behind the other messages
+    _CONTROL_MESSAGE_TYPES = (MessageTypes.HealthCheckMessage.value, MessageTypes.Election.value, MessageTypes.Swim.value)
+
     # TCP backend used to send the messages
     _backend: NetBackend = None
 
@@ -81,7 +68,7 @@ class BaseLobby(EventManager, MessageManager):
     _leader: IpAddress = ""
 
     # Members of the lobby
-    _members: dict[IpAddress, Peer] = {}
+    _membership: Membership
 
     # The message handler thread is in charge of receiving and distributing the messages
     _message_handler_thread: threading.Thread
@@ -89,8 +76,56 @@ class BaseLobby(EventManager, MessageManager):
     # Used to end the message handle thread
     _exit: bool
 
+    # Set when the backend has been created, the message handler thread waits for it
+    _backend_ready: threading.Event
+
+    # Runs all the timers of the lobby on a single thread
+    _timer_wheel: TimerWheel
+
     # In case the leader is not available we queue the messages until a new leader is selected
-    _pending_leader_msgs: list = []
+    _pending_leader_msgs: list[BaseMessage]
+
+    # Threads sending a broadcast to the members in parallel
+    _broadcast_pool: ThreadPoolExecutor
+
+    # Runs the handlers of the lobby and application messages
+    _dispatcher: OrderedDispatcher
+
+    # Runs the handlers of the health check and leader election messages
+    _control_dispatcher: OrderedDispatcher
+
+    # Runs the callbacks of the expired timers, so a blocking callback does not hold up the timer wheel
+    _timer_dispatcher: OrderedDispatcher
+
+    # Used to encode the sent messages, the received ones are decoded with the codec they were sent with
+    _codec: Codec
+
+    # When the last lobby or application message was received from every member, the health check uses it as a proof of life
+    _last_received: dict[IpAddress, float]
+
+    # When the last lobby or application message was sent to every member
+    _last_sent: dict[IpAddress, float]
+
+    # Provides the current state of the application, None if the application has not registered one
+    _state_provider: Callable[[], State] | None
+
+    # The epoch of the latest membership change, the leader increments it for every change it announces
+    _membership_epoch: int
+
+    # The leader which issued the latest membership epoch, the epochs of different leaders are not comparable
+    _membership_issuer: IpAddress
+
+    # The latest membership changes, the oldest first
+    _membership_log: deque[MembershipDelta]
+
+    # Guards the membership epoch and the log
+    _membership_epoch_lock: threading.RLock
+
+    # Identifies the playlist of the application, the state is only handed over between members with the same playlist
+    _playlist_identity: str
+
+    # When this client sent its join request, the age of the state in the acceptance cannot exceed the time since
+    _join_requested_at: float
 
     def __init__(self):
         """
@@ -104,6 +139,25 @@ class BaseLobby(EventManager, MessageManager):
 
         self._message_handler_thread = threading.Thread(target=self._main_loop)
         self._exit = True
+        self._membership = Membership()
+        self._pending_leader_msgs = []
+        self._backend_ready = threading.Event()
+        self._timer_wheel = TimerWheel()
+        self._broadcast_pool = ThreadPoolExecutor(max_workers=self._BROADCAST_WORKERS, thread_name_prefix="broadcast")
+        self._dispatcher = OrderedDispatcher(self._DISPATCH_WORKERS, "dispatch")
+        # A single worker, as the control messages are all handled in a single lane
+        self._control_dispatcher = OrderedDispatcher(1, "control-dispatch")
+        self._timer_dispatcher = OrderedDispatcher(self._TIMER_WORKERS, "timer")
+        self._codec = BinaryCodec()
+        self._last_received = {}
+        self._last_sent = {}
+        self._state_provider = None
+        self._membership_epoch = 0
+        self._membership_issuer = ""
+        self._membership_log = deque(maxlen=self._MEMBERSHIP_LOG_SIZE)
+        self._membership_epoch_lock = threading.RLock()
+        self._playlist_identity = ""
+        self._join_requested_at = 0.0
 
         # Register own events
         self._register_event(self.EVENT_MEMBERS_CHANGED)
@@ -131,7 +185,14 @@ class BaseLobby(EventManager, MessageManager):
         """
         self._exit = True
         self._stop_health_check()
+        self._timer_wheel.stop()
         self._message_handler_thread.join()
+        if self._backend is not None:
+            self._backend.shutdown()
+        self._broadcast_pool.shutdown(wait=False)
+        self._dispatcher.shutdown()
+        self._control_dispatcher.shutdown()
+        self._timer_dispatcher.shutdown()
 
     def start(self):
         """
@@ -163,16 +224,17 @@ class BaseLobby(EventManager, MessageManager):
         Note:
         The start() method needs to be called to start the message handling.
         """
-        peer = Peer(ip, port, name, self._generate_random_id(), True, True)
+        peer = Peer(ip, port, name, self._generate_random_id(), True)
         self._leader = peer.ip_address
         self._identity = peer.ip_address
         self._add_member(peer)
 
-        self._backend = TcpBackend(port)
+        self._backend = self._create_backend(port)
+        self._backend_ready.set()
 
         self._start_health_check()
 
-        _logger.info(f"Created lobby with peer {peer.__dict__}")
+        _logger.info(f"Created lobby with peer {peer!r}")
 
     def join_lobby(self, my_name: str, my_ip: str, my_port: int, lobby_ip: str, lobby_port: int) -> bool:
         """
@@ -197,15 +259,17 @@ class BaseLobby(EventManager, MessageManager):
         The start() method needs to be called to start the message handling.
         """
         lobby_address = f'{lobby_ip}:{lobby_port}'
-        self._backend = TcpBackend(my_port)
+        self._backend = self._create_backend(my_port)
+        self._backend_ready.set()
 
         # Create myself
-        me = Peer(my_ip, my_port, my_name, -1, False, True)
+        me = Peer(my_ip, my_port, my_name, -1, False)
         self._identity = me.ip_address
         self._add_member(me)
 
         # Ask the given member to join the lobby
         _logger.info(f'Joining a lobby at {lobby_address}...')
+        self._join_requested_at = time.monotonic()
         return self.send_to(lobby_address, RequestJoinMessage(self._identity, lobby_address, my_name))
 
     def leave_lobby(self):
@@ -220,13 +284,13 @@ class BaseLobby(EventManager, MessageManager):
         """
         if self.is_leader():
             if len(self._members) > 1:
-                del self._members[self._identity]
+                self._membership.remove([self._identity])
                 address= random.choice(list(self._members.keys()))
                 self.send_to(address, LeaveMessage(self._identity))
         else:
             self.send_to(self._leader, LeaveMessage(self._identity))
 
-    def broadcast(self, msg: BaseMessage) -> None:
+    def broadcast(self, msg: BaseMessage, targets: list[Peer] | None = None) -> None:
         """
         Broadcast a message to all lobby members.
 
@@ -234,23 +298,36 @@ class BaseLobby(EventManager, MessageManager):
         The broadcasting functionality is restricted to the leader; therefore,
         only the leader has the authority to send messages to all members.
 
+        If sending can block, the message is sent to the members in parallel, so a few unavailable
+        members cannot delay the others. The members which could not be reached, or whose send did not
+        finish within the broadcast deadline, are removed from the lobby, and the other members are
+        notified about it.
+
         Parameters:
         - msg (BaseMessage): The message to be broadcasted to all members.
+        - targets (list[Peer] | None): The members to send the message to, all the other members by default.
         """
         if not self.is_leader():
             raise RuntimeError('only the leader can broadcast')
-        
-        unavailable_members = []
 
-        for address, member in self._members.items():
-            if address == self._identity:
-                continue
+        if targets is None:
+            targets = [member for address, member in self._members.items() if address != self._identity]
+        _logger.debug(f"Broadcasting message to {len(targets)} members: {msg.__dict__}")
+
+        # The message is encoded only once, the same buffer is sent to every member
+        data = _write_message(False, self._identity, msg, self._codec.encode(msg))
+
+        if self._backend.blocking_send and len(targets) > 1:
+            sends = {self._broadcast_pool.submit(self._send_data, member.ip_address, data, msg): member for member in targets}
+            done, not_done = wait(sends, timeout=self._BROADCAST_DEADLINE)
+            unavailable_members = [sends[send] for send in not_done]
+            unavailable_members.extend(sends[send] for send in done if send.exception() is not None or not send.result())
+            if not_done:
+                _logger.warning(f"Broadcast deadline expired before reaching {[str(member) for member in unavailable_members]}")
+        else:
+            unavailable_members = [member for member in targets if not self._send_data(member.ip_address, data, msg)]
 
-            success = self.send_to(address, msg)
-            if not success:
-                unavailable_members.append(member)
-                
-        self._remove_members(unavailable_members)
+        self._remove_unavailable_members(unavailable_members)
 
     def send_to(self, target: IpAddress, msg: BaseMessage) -> None:
         """
@@ -265,12 +342,29 @@ class BaseLobby(EventManager, MessageManager):
         - target (IpAddress): The IP address of the target member combined with port.
         - msg (BaseMessage): The message to be sent to the target member.
         """
-        message = LobbyMessage(target == self._leader, msg)
         _logger.debug(f"Sending message to {target}: {msg.__dict__}")
+        return self._send_data(target, _write_message(target == self._leader, self._identity, msg, self._codec.encode(msg)), msg)
+
+    def _send_data(self, target: IpAddress, data: bytes, msg: BaseMessage) -> bool:
+        """
+        Send an already encoded message to a specific lobby member.
 
-        success = self._backend.send(target, _write_message(message.__dict__))
+        If the target is the leader and it cannot be reached, the message is queued
+        and sent again when a new leader has been selected.
+
+        Parameters:
+        - target (IpAddress): The IP address of the target member combined with port.
+        - data (bytes): The encoded message, including its header.
+        - msg (BaseMessage): The message itself.
+
+        Returns:
+        - bool: True if the message was sent, False otherwise.
+        """
+        success = self._backend.send(target, data)
         if not success and target == self._leader:
             self._pending_leader_msgs.append(msg) # Send this when we have a leader 
+        elif success and msg.type not in self._CONTROL_MESSAGE_TYPES:
+            self._last_sent[target] = time.monotonic()
         return success
 
     def send_to_leader(self, msg: BaseMessage) -> None:
@@ -286,6 +380,73 @@ class BaseLobby(EventManager, MessageManager):
         """
         self.send_to(self._leader, msg)
 
+    def use_codec(self, codec: Codec):
+        """
+        Select the codec used to encode the sent messages.
+
+        The lobby uses the compact BinaryCodec by default. The JsonCodec can be selected
+        for debugging, the members decode the messages of both codecs.
+
+        Parameters:
+        - codec (Codec): The codec to encode the messages with.
+        """
+        self._codec = codec
+
+    def set_state_provider(self, provider: Callable[[], State] | None):
+        """
+        Register the callable providing the current state of the application.
+
+        The lobby does not interpret the state, it only hands it over to the other members
+        when they need it (e.g. to the member taking over the lobby if the leader fails).
+
+        Parameters:
+        - provider (Callable[[], State] | None): Returns the current state of the application, None to unregister.
+        """
+        self._state_provider = provider
+
+    def set_playlist_identity(self, identity: str):
+        """
+        Set the identity of the playlist the states of the application refer to.
+
+        A joining member applies the state it receives with the acceptance to the lobby only if
+        its playlist has the same identity as the one of the leader.
+
+        Parameters:
+        - identity (str): Identifies the playlist, empty if unknown.
+        """
+        self._playlist_identity = identity
+
+    def submit(self, callback: Callable, *args):
+        """
+        Run a callback in the context of the lobby.
+
+        Other threads (e.g. the GUI or the media player callbacks) should use this method to issue
+        operations on the lobby. The threaded lobby runs the callback immediately on the calling thread,
+        while event loop based lobbies hand it over to their own loop.
+
+        Parameters:
+        - callback (Callable): The callback to run.
+        - args: Positional arguments to be passed to the callback.
+        """
+        callback(*args)
+
+    def schedule(self, delay: float, callback: Callable, *args):
+        """
+        Run a callback in the context of the lobby after the given delay.
+
+        The threaded lobby runs the callback on one of its timer worker threads, while event loop based
+        lobbies run it on their own loop.
+
+        Parameters:
+        - delay (float): The delay in seconds.
+        - callback (Callable): The callback to run.
+        - args: Positional arguments to be passed to the callback.
+
+        Returns:
+        - A timer handle, which can be used to cancel the callback with its cancel() method.
+        """
+        return self._schedule(delay, callback, *args)
+
     def is_leader(self) -> bool:
         """
         Check if the client is the leader of the lobby.
@@ -299,6 +460,19 @@ class BaseLobby(EventManager, MessageManager):
         """
         return self._identity == self._leader
 
+    @property
+    def _members(self) -> MembershipSnapshot:
+        """
+        Retrieve the current members of the lobby.
+
+        The members are an immutable snapshot, which can be read without a lock and is never
+        changed afterwards. The changes go through the membership table.
+
+        Returns:
+        - MembershipSnapshot: The members of the lobby by their identity.
+        """
+        return self._membership.snapshot
+
     @property
     def _me(self) -> Peer | None:
         """
@@ -311,10 +485,7 @@ class BaseLobby(EventManager, MessageManager):
         Returns:
         - Union[Peer, None]: The client's own peer object if available, or None.
         """
-        if self._identity in self._members:
-            return self._members[self._identity]
-        else:
-            return None
+        return self._members.get(self._identity)
     
     @property
     def _leader_peer(self) -> Peer | None:
@@ -327,10 +498,7 @@ class BaseLobby(EventManager, MessageManager):
         Returns:
         - Union[Peer, None]: The leader's peer object if available, or None.
         """
-        if self._leader in self._members:
-            return self._members[self._leader]
-        else:
-            return None
+        return self._members.get(self._leader)
 
     def _main_loop(self):
         """
@@ -341,7 +509,7 @@ class BaseLobby(EventManager, MessageManager):
         from other lobby members and delegating them to preconfigured handlers.
         """
         # Wait for backend initialization
-        while not self._exit and self._backend == None:
+        while not self._exit and not self._backend_ready.wait(timeout=0.5):
             pass
 
         while not self._exit:
@@ -350,16 +518,89 @@ class BaseLobby(EventManager, MessageManager):
             # Timeout occured
             if source is None or data is None:
                 continue
-        
-            msg: LobbyMessage = LobbyMessage.from_dict(_read_message(data))
 
-            # Don't process leader message if I'm not the leader
-            if msg.to_leader and not self.is_leader():
-                _logger.warning(f'Received message for the leader, but I\'m not the leader')
-                continue
+            self._process_data(source, data)
+
+    def _process_data(self, source: IpAddress, data: bytes):
+        """
+        Decode a received message and delegate it to its handler.
+
+        The routing header of the message is read first, and the body is decoded only if
+        the message is meant for this client and there is a handler for its type.
+
+        Parameters:
+        - source (IpAddress): The address the message was received from.
+        - data (bytes): The received message, including its header.
+        """
+        to_leader, message_type, sender, body = _read_header(data)
+
+        # Don't process leader message if I'm not the leader
+        if to_leader and not self.is_leader():
+            _logger.warning(f'Received message for the leader from {sender}, but I\'m not the leader')
+            return
+
+        if message_type is None or not self._has_message_handler(message_type):
+            _logger.warning(f'Dropped message from {sender} without a handler')
+            return
+
+        # Any other traffic than the control messages proves the sender is alive as well
+        if message_type.type not in self._CONTROL_MESSAGE_TYPES:
+            self._last_received[sender] = time.monotonic()
+
+        msg = decode_message(body)
+        _logger.debug(f"Received {type(msg).__name__} from {sender}: {msg.__dict__}")
+        self._dispatch(sender, msg)
+
+    def _dispatch(self, sender: IpAddress, msg: BaseMessage):
+        """
+        Hand a received message over to its handler.
+
+        The handlers are run on worker threads, so a slow handler does not stop the receiving of
+        the messages. The messages of the same type from the same sender are handled one at a time
+        in the order they were received. The health check and leader election messages have their
+        own worker, so they are never delayed by the lobby or the application messages. They are all
+        handled one at a time in a single lane, whatever their sender, as the election handlers share
+        their state without a lock.
+
+        Parameters:
+        - sender (IpAddress): The identity of the sender.
+        - msg (BaseMessage): The received message.
+        """
+        if msg.type in self._CONTROL_MESSAGE_TYPES:
+            self._control_dispatcher.submit(None, self._call_message_handler, type(msg), msg)
+        else:
+            self._dispatcher.submit((sender, msg.type), self._call_message_handler, type(msg), msg)
+
+    def _create_backend(self, port: int) -> NetBackend:
+        """
+        Create the networking backend of the lobby.
+
+        Parameters:
+        - port (int): The port number the backend listens on.
+
+        Returns:
+        - NetBackend: The backend used to send and receive the messages.
+        """
+        return TcpBackend(port)
 
-            _logger.debug(f"Received {type(msg.message).__name__}: {msg.message.__dict__}")
-            self._call_message_handler(type(msg.message), msg.message)
+    def _schedule(self, delay: float, callback: Callable, *args):
+        """
+        Schedule a callback to be called once after the given delay.
+
+        The timer wheel thread only hands the expired callbacks over to the timer workers, so a callback
+        which blocks (e.g. on a broadcast or the state of the application) does not delay the other timers.
+        The calls of the same callback function are run one at a time in the order their timers expired,
+        while different callbacks may run in parallel.
+
+        Parameters:
+        - delay (float): The delay in seconds.
+        - callback (Callable): The callback to call.
+        - args: Positional arguments to be passed to the callback.
+
+        Returns:
+        - WheelTimer: A timer handle, which can be used to cancel the callback with its cancel() method.
+        """
+        return self._timer_wheel.schedule(delay, self._timer_dispatcher.submit, getattr(callback, "__func__", callback), callback, *args)
 
     def _add_member(self, peer: Peer):
         """
@@ -372,12 +613,29 @@ class BaseLobby(EventManager, MessageManager):
         Parameters:
         - peer (Peer): The peer object representing the new lobby member.
         """
-        member_identity = peer.ip_address
-        if member_identity not in self._members:
-            self._members[member_identity] = peer
+        if self._membership.add(peer):
             self._raise_event(self.EVENT_MEMBERS_CHANGED, self._members, self._identity, self._leader)
         else:
-            _logger.warn(f"Tried to add member who is already in the list: {peer.__dict__}")
+            _logger.warn(f"Tried to add member who is already in the list: {peer!r}")
+
+    def _add_members(self, peers: list[Peer]):
+        """
+        Add multiple new peer members to the lobby.
+
+        This method is used to add multiple new peer members to the lobby. Instead of
+        raising multiple events for each addition, it raises a single members changed event
+        after adding all specified members.
+
+        Parameters:
+        - peers (list[Peer]): The list of peer objects representing the new lobby members.
+        """
+        added = self._membership.add_all(peers)
+        for member in peers:
+            if member not in added:
+                _logger.warn(f"Tried to add member who is already in the list: {member!r}")
+
+        if added:
+            self._raise_event(self.EVENT_MEMBERS_CHANGED, self._members, self._identity, self._leader)
 
     def _remove_member(self, peer: Peer):
         """
@@ -390,12 +648,10 @@ class BaseLobby(EventManager, MessageManager):
         Parameters:
         - peer (Peer): The peer object representing the lobby member to be removed.
         """
-        member_identity = peer.ip_address
-        if member_identity in self._members:
-            del self._members[member_identity]
+        if self._membership.remove([peer.ip_address]):
             self._raise_event(self.EVENT_MEMBERS_CHANGED, self._members, self._identity, self._leader)
         else:
-            _logger.warn(f"Tried to remove member who is not in the list: {peer.__dict__}")
+            _logger.warn(f"Tried to remove member who is not in the list: {peer!r}")
 
     def _remove_members(self, peers: list[Peer]):
         """
@@ -408,18 +664,68 @@ class BaseLobby(EventManager, MessageManager):
         Parameters:
         - peers (list[Peer]): The list of peer objects representing the lobby members to be removed.
         """
-        member_removed = False
+        removed = self._membership.remove([member.ip_address for member in peers])
         for member in peers:
-            member_identity = member.ip_address
-            if member_identity in self._members:
-                del self._members[member_identity]
-                member_removed = True
-            else:
-                _logger.warn(f"Tried to remove member who is not in the list: {member.__dict__}")
-
-        if member_removed:
+            if member not in removed:
+                _logger.warn(f"Tried to remove member who is not in the list: {member!r}")
+
+        if removed:
             self._raise_event(self.EVENT_MEMBERS_CHANGED, self._members, self._identity, self._leader)
 
+    def _remove_unavailable_members(self, peers: list[Peer]):
+        """
+        Remove the members the leader could not reach, and notify the other members about it.
+
+        Parameters:
+        - peers (list[Peer]): The members which could not be reached.
+        """
+        removed = [member for member in peers if member.ip_address in self._members]
+        if not removed:
+            return
+
+        self._remove_members(removed)
+        self._announce_members_left([member.ip_address for member in removed])
+
+    def _announce_new_members(self, peers: list[Peer], targets: list[Peer] | None = None):
+        """
+        Tell the other members that new members have joined, as a single membership change.
+
+        Parameters:
+        - peers (list[Peer]): The members which have joined.
+        - targets (list[Peer] | None): The members to tell, all the other members by default.
+        """
+        joined = self._membership.to_dict(peer.ip_address for peer in peers)
+        epoch = self._next_membership_epoch(joined, ())
+        self.broadcast(NewMemberMessage(self._identity, joined, epoch), targets)
+
+    def _announce_members_left(self, addresses: list[IpAddress]):
+        """
+        Tell the other members that members have left, each of them as a membership change of its own.
+
+        Parameters:
+        - addresses (list[IpAddress]): The addresses of the members which have left.
+        """
+        for address in addresses:
+            epoch = self._next_membership_epoch({}, (address,))
+            self.broadcast(MemberLeftMessage(self._identity, address, epoch))
+
+    def _next_membership_epoch(self, joined: dict[IpAddress, dict[str, any]], left: tuple[IpAddress, ...]) -> int:
+        """
+        Start a new membership epoch for a change announced by this client, and log the change.
+
+        Parameters:
+        - joined (dict[IpAddress, dict[str, any]]): The members which joined, as JSON compatible dictionaries.
+        - left (tuple[IpAddress, ...]): The addresses of the members which left.
+
+        Returns:
+        - int: The new membership epoch.
+        """
+        with self._membership_epoch_lock:
+            self._membership_epoch += 1
+            self._membership_issuer = self._identity
+            self._membership_log.append(MembershipDelta(self._membership_epoch, self._identity, joined, left))
+            return self._membership_epoch
+
     def _generate_random_id(self) -> int:
         """
         Generate a new unique ID for a lobby member.
@@ -433,7 +739,7 @@ class BaseLobby(EventManager, MessageManager):
         - int: A new unique ID for a lobby member.
         """
         id = random.randint(-(2**31), 2**31 - 1)
-        while any(member.id == id for member in self._members.values()):
+        while self._members.has_id(id):
             id = random.randint(-(2**31), 2**31 - 1)
         return id
 
@@ -505,8 +811,8 @@ class BaseLobby(EventManager, MessageManager):
         Process the received NewMemberMessage within the lobby.
 
         This method is responsible for handling the NewMemberMessage, which is sent by the leader
-        to all members of the lobby. The purpose of this message is to notify all members that a
-        new member has successfully joined the lobby.
+        to all members of the lobby. The purpose of this message is to notify all members that
+        new members have successfully joined the lobby.
 
         Parameters:
         - msg (NewMemberMessage): The NewMemberMessage received from the lobby leader.
@@ -612,8 +918,41 @@ class BaseLobby(EventManager, MessageManager):
         """
         pass
 
-def _write_message(msg) -> str:
-    return json.dumps(msg)
+# The routing header preceding every message body: flags, type, subtype and the length of the sender
+_HEADER = struct.Struct('!BBBH')
 
-def _read_message(data: str):
-    return json.loads(data)
+# Set in the flags if the message was sent to the leader
+_FLAG_TO_LEADER = 0x01
+
+def _write_message(to_leader: bool, sender: IpAddress, msg: BaseMessage, body: bytes) -> bytes:
+    """
+    Prepend the routing header to an encoded message.
+
+    Parameters:
+    - to_leader (bool): Whether the message is sent to the leader.
+    - sender (IpAddress): The identity of the sending client.
+    - msg (BaseMessage): The message.
+    - body (bytes): The encoded message.
+
+    Returns:
+    - bytes: The message ready to be sent.
+    """
+    encoded_sender = sender.encode('utf-8')
+    type, subtype = msg._key
+    return _HEADER.pack(_FLAG_TO_LEADER if to_leader else 0, type, subtype, len(encoded_sender)) + encoded_sender + body
+
+def _read_header(data: bytes) -> tuple[bool, type | None, IpAddress, memoryview]:
+    """
+    Read the routing header of a received message without decoding its body.
+
+    Parameters:
+    - data (bytes): The received message.
+
+    Returns:
+    - tuple[bool, type | None, IpAddress, memoryview]: Whether the message was sent to the leader, the class of the
+      message (None if it is unknown), the identity of the sender and the still encoded body of the message.
+    """
+    flags, type, subtype, sender_length = _HEADER.unpack_from(data)
+    sender_end = _HEADER.size + sender_length
+    sender = str(data[_HEADER.size:sender_end], 'utf-8')
+    return bool(flags & _FLAG_TO_LEADER), message_class(type, subtype), sender, memoryview(data)[sender_end:]
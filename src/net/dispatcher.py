@@ -0,0 +1,94 @@
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Hashable
+
+import log
+
+_logger = log.getLogger(__name__)
+
+class OrderedDispatcher:
+    """
+    Runs callbacks on a pool of worker threads while keeping their order per key.
+
+    Every key has its own lane: the callbacks submitted with the same key are called one at a time
+    in the order they were submitted, while the callbacks of different keys run in parallel. A lane
+    only holds a worker while it has callbacks to run, and gives the worker up after a batch of
+    callbacks, so a busy lane cannot starve the others.
+    """
+    # Number of callbacks a lane runs before giving its worker to the other lanes
+    _BATCH_SIZE = 32
+
+    # The worker threads
+    _pool: ThreadPoolExecutor
+
+    # The pending callbacks of the lanes, a lane exists while its callbacks are being run
+    _lanes: dict[Hashable, deque[tuple[Callable, tuple]]]
+
+    # Guards the lanes
+    _lock: threading.Lock
+
+    def __init__(self, workers: int, name: str):
+        """
+        Constructor for the OrderedDispatcher class.
+
+        Parameters:
+        - workers (int): The maximum number of callbacks running at the same time.
+        - name (str): Prefix of the names of the worker threads.
+        """
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lanes = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: Hashable, callback: Callable, *args):
+        """
+        Run a callback after the callbacks previously submitted with the same key.
+
+        Parameters:
+        - key (Hashable): The key of the lane.
+        - callback (Callable): The callback to run.
+        - args: Positional arguments to be passed to the callback.
+        """
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane is not None:
+                lane.append((callback, args))
+                return
+            self._lanes[key] = deque(((callback, args),))
+        self._run_lane(key)
+
+    def shutdown(self):
+        """
+        Stop the dispatcher, the callbacks not yet started are dropped.
+        """
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run_lane(self, key: Hashable):
+        try:
+            self._pool.submit(self._drain, key)
+        except RuntimeError:
+            # The dispatcher has been shut down
+            with self._lock:
+                del self._lanes[key]
+
+    def _drain(self, key: Hashable):
+        """
+        Run the pending callbacks of a lane on a worker thread.
+        """
+        with self._lock:
+            lane = self._lanes[key]
+        for _ in range(self._BATCH_SIZE):
+            with self._lock:
+                if not lane:
+                    del self._lanes[key]
+                    return
+                callback, args = lane.popleft()
+
+            try:
+                callback(*args)
+            except Exception:
+                _logger.exception(f"Dispatched callback {callback} failed")
+
+        # Let the other lanes run before continuing
+        self._run_lane(key)
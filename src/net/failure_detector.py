@@ -0,0 +1,189 @@
+import math
+import statistics
+import threading
+import time
+
+from collections import deque
+
+from net.backend import IpAddress
+
+class PhiAccrualFailureDetector:
+    """
+    Phi accrual failure detector.
+
+    Instead of declaring a peer dead after a fixed timeout, the detector keeps a sliding window of the
+    intervals between the heartbeats of every peer, and expresses the suspicion of a peer as phi: the
+    negative base 10 logarithm of the probability that the next heartbeat is still to come, given the
+    time elapsed since the last one and the normal distribution of the measured intervals. A phi of 1
+    means a 10% chance of a mistake when declaring the peer dead, a phi of 8 a chance of 1e-8. As the
+    distribution follows the real jitter of the network, the detection is fast on a steady link and
+    patient on a lossy one.
+
+    Besides the heartbeats, any other traffic from a peer proves that it is alive. Such traffic can be
+    recorded with touch(), which postpones the suspicion without adding an interval to the window, as
+    the intervals between the heartbeats would no longer represent the heartbeat rate.
+    """
+    # The phi of a peer whose next heartbeat is too unlikely to be represented as a float
+    _MAX_PHI = 300.0
+
+    # The peers with phi above this are considered dead
+    _threshold: float
+
+    # The standard deviation used when the measured one is smaller, so a very steady link does not make the detector jumpy
+    _min_std_deviation: float
+
+    # The expected interval used before there are enough measurements
+    _first_heartbeat_estimate: float
+
+    # The intervals between the heartbeats of every peer
+    _intervals: dict[IpAddress, deque[float]]
+
+    # The time of the last heartbeat of every peer
+    _last_heartbeat: dict[IpAddress, float]
+
+    # The time of the last heartbeat or other traffic of every peer
+    _last_heard: dict[IpAddress, float]
+
+    _lock: threading.Lock
+
+    def __init__(self, threshold: float = 8.0, window_size: int = 100, min_std_deviation: float = 0.2, first_heartbeat_estimate: float = 5.0):
+        """
+        Constructor for the PhiAccrualFailureDetector class.
+
+        Parameters:
+        - threshold (float): The peers with phi above the threshold are considered dead.
+        - window_size (int): The number of intervals kept for every peer.
+        - min_std_deviation (float): The minimum standard deviation of the intervals in seconds.
+        - first_heartbeat_estimate (float): The expected interval between the heartbeats in seconds,
+          used until the intervals have been measured.
+        """
+        self._threshold = threshold
+        self._window_size = window_size
+        self._min_std_deviation = min_std_deviation
+        self._first_heartbeat_estimate = first_heartbeat_estimate
+        self._intervals = {}
+        self._last_heartbeat = {}
+        self._last_heard = {}
+        self._lock = threading.Lock()
+
+    def heartbeat(self, address: IpAddress, now: float = None):
+        """
+        Record a heartbeat of a peer.
+
+        Parameters:
+        - address (IpAddress): The peer.
+        - now (float): The time of the heartbeat, the current monotonic time by default.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            last = self._last_heartbeat.get(address)
+            if address not in self._intervals:
+                self._seed(address)
+            elif last is not None and self._last_heard[address] <= last:
+                self._intervals[address].append(now - last)
+            self._last_heartbeat[address] = now
+            self._last_heard[address] = max(now, self._last_heard.get(address, now))
+
+    def touch(self, address: IpAddress, now: float = None):
+        """
+        Record other traffic than a heartbeat from a monitored peer.
+
+        Parameters:
+        - address (IpAddress): The peer.
+        - now (float): The time of the traffic, the current monotonic time by default.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if address in self._last_heard and now > self._last_heard[address]:
+                self._last_heard[address] = now
+
+    def last_heard(self, address: IpAddress) -> float | None:
+        """
+        Get the time of the last heartbeat or other traffic of a peer, or None if it is not monitored.
+        """
+        return self._last_heard.get(address)
+
+    def monitor(self, address: IpAddress, now: float = None):
+        """
+        Start monitoring a peer, unless it is already monitored.
+
+        The peer is expected to send its first heartbeat within the estimated interval from now on,
+        but the time is not used as a heartbeat, as the first interval would not be a real one.
+
+        Parameters:
+        - address (IpAddress): The peer.
+        - now (float): The current time, the current monotonic time by default.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if address not in self._intervals:
+                self._seed(address)
+                self._last_heard[address] = now
+
+    def remove(self, address: IpAddress):
+        """
+        Stop monitoring a peer.
+        """
+        with self._lock:
+            self._intervals.pop(address, None)
+            self._last_heartbeat.pop(address, None)
+            self._last_heard.pop(address, None)
+
+    def clear(self):
+        """
+        Stop monitoring all the peers.
+        """
+        with self._lock:
+            self._intervals.clear()
+            self._last_heartbeat.clear()
+            self._last_heard.clear()
+
+    def phi(self, address: IpAddress, now: float = None) -> float:
+        """
+        Get the suspicion level of a peer.
+
+        Parameters:
+        - address (IpAddress): The peer.
+        - now (float): The current time, the current monotonic time by default.
+
+        Returns:
+        - float: The suspicion level, 0 for the peers which are not monitored.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            last = self._last_heard.get(address)
+            if last is None:
+                return 0.0
+            intervals = self._intervals[address]
+            mean = statistics.fmean(intervals)
+            std_deviation = max(statistics.pstdev(intervals, mean), self._min_std_deviation)
+
+        # The probability that the next heartbeat is still to come, from the complementary error function,
+        # which does not overflow far from the mean. Far after the mean it underflows to 0.
+        y = (now - last - mean) / std_deviation
+        p_later = 0.5 * math.erfc(y / math.sqrt(2.0))
+        if p_later <= 0.0:
+            return self._MAX_PHI
+        return min(-math.log10(p_later), self._MAX_PHI)
+
+    def is_available(self, address: IpAddress, now: float = None) -> bool:
+        """
+        Check whether a peer is considered alive.
+
+        Parameters:
+        - address (IpAddress): The peer.
+        - now (float): The current time, the current monotonic time by default.
+
+        Returns:
+        - bool: True if the suspicion level of the peer is below the threshold, False otherwise.
+        """
+        return self.phi(address, now) < self._threshold
+
+    def _seed(self, address: IpAddress):
+        """
+        Seed the window of a new peer with the estimate, so the first intervals are judged reasonably.
+        """
+        std_deviation = self._first_heartbeat_estimate / 10
+        self._intervals[address] = deque((self._first_heartbeat_estimate - std_deviation,
+                                          self._first_heartbeat_estimate + std_deviation),
+                                         maxlen=self._window_size)
@@ -1,8 +1,14 @@
 from net.lobby_message_implementation import LobbyMessageImplementation
+from net.lobby_handoff_implementation import LobbyHandoffImplementation
+from net.lobby_standby_implementation import LobbyStandbyImplementation
+from net.lobby_command_log_implementation import LobbyCommandLogImplementation
+from net.lobby_relay_implementation import LobbyRelayImplementation
+from net.lobby_swim_implementation import LobbySwimImplementation
 from net.lobby_health_check_implementation import LobbyHealthCheckImplementation
+from net.lobby_term_election_implementation import LobbyTermElectionImplementation
 from net.lobby_leader_election_implementation import LobbyLeaderElectionImplementation
 
-class NetLobby(LobbyMessageImplementation, LobbyHealthCheckImplementation, LobbyLeaderElectionImplementation):
+class NetLobby(LobbyMessageImplementation, LobbyHandoffImplementation, LobbyStandbyImplementation, LobbyCommandLogImplementation, LobbyRelayImplementation, LobbySwimImplementation, LobbyHealthCheckImplementation, LobbyTermElectionImplementation, LobbyLeaderElectionImplementation):
     """
     Main class for creating and managing a lobby.
 
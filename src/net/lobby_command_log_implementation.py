@@ -0,0 +1,299 @@
+import threading
+
+from collections import deque
+
+from net.backend import IpAddress
+from net.base_lobby import BaseLobby
+from net.membership import Peer
+from net.timer_wheel import WheelTimer
+
+from messages.messages import *
+
+import log
+
+_logger = log.getLogger(__name__)
+
+class LobbyCommandLogImplementation(BaseLobby):
+    """
+    Sequenced application commands for the BaseLobby.
+
+    Without sequence numbers, a member which misses a broadcast command diverges silently until the
+    next state is broadcast. With them:
+
+        - The leader assigns the next sequence number to every application command it broadcasts,
+          and keeps the latest commands in a bounded log.
+        - A member handles the commands in the order of their sequence numbers. A command which arrives
+          ahead of a missing one is held back, and the member asks the leader for the missing commands.
+          The leader sends them again from its log, or its current state if it no longer has them.
+        - The health checks of the leader carry the sequence number of its last command, so a member
+          notices a missed command even if no command follows it.
+        - If the missing commands do not arrive in time, the held back commands are handled anyway.
+
+    A state replaces all the commands before it, so it is handled even if commands before it are missing.
+    The sequence numbers of different leaders are not comparable: after the leader has changed, the
+    members continue from the first command of the new leader.
+    """
+    # Number of the latest commands the leader keeps for the members which have missed some
+    _COMMAND_LOG_SIZE = 256
+
+    # Time a member waits for the missing commands before handling the commands after them anyway
+    _COMMAND_GAP_TIMEOUT = 1.0
+
+    # As the leader, the sequence number of the last broadcast command, otherwise of the last command handled in order
+    _command_seq: int
+
+    # The leader the sequence numbers belong to
+    _command_issuer: IpAddress
+
+    # The sequence number of the last command of the leader announced by its previous health check
+    _command_seq_announced: int
+
+    # The latest commands broadcast by this client as the leader, the oldest first
+    _command_log: deque[ApplicationMessage]
+
+    # The commands received ahead of a missing command, by sequence number
+    _command_buffer: dict[int, ApplicationMessage]
+
+    # The commands ready to be handled in order, their handlers are called without holding the command lock
+    _command_ready: deque[ApplicationMessage]
+
+    # Whether a thread is calling the handlers of the ready commands
+    _command_delivering: bool
+
+    # Timer for handling the held back commands if the missing ones do not arrive, None if there is no gap
+    _command_gap_timer: WheelTimer | None
+
+    # Guards the sequence numbers, the log and the held back commands
+    _command_lock: threading.RLock
+
+    def __init__(self):
+        super().__init__()
+        self._command_seq = 0
+        self._command_issuer = ""
+        self._command_seq_announced = 0
+        self._command_log = deque(maxlen=self._COMMAND_LOG_SIZE)
+        self._command_buffer = {}
+        self._command_ready = deque()
+        self._command_delivering = False
+        self._command_gap_timer = None
+        self._command_lock = threading.RLock()
+
+        self.connect_to_message(CommandRequestMessage, self._process_command_request)
+
+    def broadcast(self, msg: BaseMessage, targets: list[Peer] | None = None) -> None:
+        """
+        Broadcast a message to all lobby members.
+
+        The leader assigns the next sequence number to an application command broadcast to all the members,
+        and logs the command.
+
+        Parameters:
+        - msg (BaseMessage): The message to be broadcasted to all members.
+        - targets (list[Peer] | None): The members to send the message to, all the other members by default.
+        """
+        if msg.type == MessageTypes.ApplicationMessage.value and targets is None and self.is_leader():
+            with self._command_lock:
+                self._follow_command_issuer(self._identity)
+                self._command_seq += 1
+                msg.seq = self._command_seq
+                self._command_log.append(msg)
+        super().broadcast(msg, targets)
+
+    def _call_message_handler(self, type: object, *args, **kwargs):
+        """
+        Call the handler of a received message, the application commands of the leader in the order of their sequence numbers.
+        """
+        msg = args[0] if len(args) == 1 else None
+        if not isinstance(msg, ApplicationMessage) or not msg.seq or self.is_leader():
+            return super()._call_message_handler(type, *args, **kwargs)
+
+        with self._command_lock:
+            if self._follow_command_issuer(self._leader):
+                # The first command of a new leader
+                self._command_seq = msg.seq - 1
+            if msg.seq <= self._command_seq:
+                _logger.debug(f"Dropped the already handled command {msg.seq}")
+                return
+            if msg.command_type != CommandType.State.value and msg.seq != self._command_seq + 1:
+                self._command_buffer[msg.seq] = msg
+            else:
+                self._handle_command(msg)
+            gap = self._handle_buffered_commands()
+        self._deliver_ready_commands()
+        if gap:
+            self._request_commands()
+
+    def _reset_command_seq(self, leader: IpAddress, seq: int):
+        """
+        Continue from the given command of the leader, e.g. after joining the lobby with its state.
+
+        Parameters:
+        - leader (IpAddress): The identity of the leader.
+        - seq (int): The sequence number of the last command included in the state.
+        """
+        with self._command_lock:
+            self._follow_command_issuer(leader)
+            self._command_seq = seq
+            gap = self._handle_buffered_commands()
+        self._deliver_ready_commands()
+        if gap:
+            self._request_commands()
+
+    def _check_command_seq(self, leader: IpAddress, seq: int):
+        """
+        Ask for the missed commands if the leader has announced a command this client has not handled.
+
+        The command announced by the health check may still be on its way, so only the command announced
+        by the previous health check is required to have arrived.
+
+        Parameters:
+        - leader (IpAddress): The identity of the leader.
+        - seq (int): The sequence number of the last command of the leader.
+        """
+        with self._command_lock:
+            if leader != self._command_issuer:
+                return
+            missed = self._command_seq < self._command_seq_announced
+            self._command_seq_announced = seq
+        if missed:
+            self._request_commands()
+
+    def _follow_command_issuer(self, issuer: IpAddress) -> bool:
+        """
+        Start following the sequence numbers of another leader. The command lock must be held.
+
+        Parameters:
+        - issuer (IpAddress): The leader issuing the sequence numbers.
+
+        Returns:
+        - bool: True if the leader has changed.
+        """
+        if issuer == self._command_issuer:
+            return False
+        self._command_issuer = issuer
+        self._command_seq_announced = 0
+        self._command_log.clear()
+        self._command_buffer.clear()
+        self._cancel_command_gap_timer()
+        return True
+
+    def _handle_command(self, msg: ApplicationMessage):
+        """
+        Accept a command as the next one in order, its handler is called by _deliver_ready_commands().
+        The command lock must be held.
+
+        Parameters:
+        - msg (ApplicationMessage): The command.
+        """
+        self._command_seq = msg.seq
+        self._command_ready.append(msg)
+
+    def _deliver_ready_commands(self):
+        """
+        Call the handlers of the commands accepted in order, without holding the command lock.
+
+        The handlers may be slow (e.g. the media player), and the health checks check the sequence numbers
+        under the command lock. Only one thread calls the handlers at a time, so the commands are still
+        handled in order when they are accepted by different threads.
+        """
+        with self._command_lock:
+            if self._command_delivering:
+                return
+            self._command_delivering = True
+        try:
+            while True:
+                with self._command_lock:
+                    if not self._command_ready:
+                        self._command_delivering = False
+                        return
+                    msg = self._command_ready.popleft()
+                super()._call_message_handler(type(msg), msg)
+        except BaseException:
+            with self._command_lock:
+                self._command_delivering = False
+            raise
+
+    def _handle_buffered_commands(self) -> bool:
+        """
+        Accept the held back commands which are next in order, and start waiting for the missing commands if a gap remains.
+        The command lock must be held.
+
+        Returns:
+        - bool: True if a new gap was found, and the missing commands should be requested after releasing the lock.
+        """
+        for seq in [seq for seq in self._command_buffer if seq <= self._command_seq]:
+            del self._command_buffer[seq]
+        while self._command_seq + 1 in self._command_buffer:
+            self._handle_command(self._command_buffer.pop(self._command_seq + 1))
+
+        if not self._command_buffer:
+            self._cancel_command_gap_timer()
+        elif self._command_gap_timer is None:
+            _logger.debug(f"Missing commands after {self._command_seq}, {len(self._command_buffer)} commands held back")
+            self._command_gap_timer = self._schedule(self._COMMAND_GAP_TIMEOUT, self._command_gap_expired, self._command_issuer)
+            return True
+        return False
+
+    def _cancel_command_gap_timer(self):
+        """
+        Cancel the timer for the missing commands. The command lock must be held.
+        """
+        if self._command_gap_timer is not None:
+            self._command_gap_timer.cancel()
+            self._command_gap_timer = None
+
+    def _command_gap_expired(self, issuer: IpAddress):
+        """
+        Handle the held back commands, as the missing ones have not arrived in time.
+
+        Parameters:
+        - issuer (IpAddress): The leader whose commands are missing.
+        """
+        with self._command_lock:
+            self._command_gap_timer = None
+            if issuer != self._command_issuer or not self._command_buffer:
+                return
+            first = min(self._command_buffer)
+            _logger.warning(f"Skipping the missing commands {self._command_seq + 1}-{first - 1}")
+            self._command_seq = first - 1
+            gap = self._handle_buffered_commands()
+        self._deliver_ready_commands()
+        if gap:
+            self._request_commands()
+
+    def _request_commands(self):
+        """
+        Ask the leader for the commands after the last one handled in order.
+        """
+        self.send_to(self._leader, CommandRequestMessage(self._identity, self._command_seq))
+
+    def _process_command_request(self, msg: CommandRequestMessage):
+        """
+        Process the received CommandRequestMessage within the lobby.
+
+        The leader sends the requested commands again from its log. If it no longer has all of them,
+        it sends its current state instead, which replaces the missing commands.
+
+        Parameters:
+        - msg (CommandRequestMessage): The CommandRequestMessage received from a member.
+        """
+        if not self.is_leader():
+            return
+
+        with self._command_lock:
+            seq = self._command_seq
+            missing = [command for command in self._command_log if command.seq > msg.since]
+        if msg.since >= seq:
+            return
+
+        state = self._state_provider() if self._state_provider is not None else None
+        if (not missing or missing[0].seq != msg.since + 1) and state is not None:
+            _logger.debug(f"Sending the state instead of the commands {msg.since + 1}-{seq} to {msg.sender}")
+            state_msg = StateMessage(state)
+            state_msg.seq = seq
+            self.send_to(msg.sender, state_msg)
+            return
+
+        _logger.debug(f"Sending the commands {msg.since + 1}-{seq} again to {msg.sender}")
+        for command in missing:
+            self.send_to(msg.sender, command)
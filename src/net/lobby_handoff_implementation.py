@@ -0,0 +1,100 @@
+from net.backend import IpAddress
+from net.base_lobby import BaseLobby
+from net.membership import Peer
+
+from messages.messages import *
+
+import log
+
+_logger = log.getLogger(__name__)
+
+class LobbyHandoffImplementation(BaseLobby):
+    """
+    Graceful leader handoff for the BaseLobby.
+
+    When the leader leaves the lobby, it hands the lobby over to a successor instead of leaving the members
+    to elect a new leader:
+
+        - The leader picks the successor: the standby successor if it has designated one, otherwise the
+          best member of the RTT ranking if it is enabled, or the member with the greatest id, which the
+          bully election would elect as well.
+        - The leader sends the members, the state of the application, its term and the sequence number
+          of the last application command to the successor. If the successor cannot be reached,
+          the next candidate is tried.
+        - The successor removes the leaving leader, promotes itself with a single IAmLeaderMessage in a
+          newer term, and tells the members that the previous leader has left. Then it handles the
+          transferred state as if it had received it from a member, so it is applied and broadcast.
+
+    The leader change takes a single round trip and no election. If no candidate can be reached, the
+    leader leaves as before, and the members elect a new leader.
+    """
+    def __init__(self):
+        super().__init__()
+        self.connect_to_message(HandoffMessage, self._process_handoff)
+
+    def leave_lobby(self):
+        """
+        Leave the lobby.
+
+        The leader hands the lobby over to a successor before leaving. The other members send
+        a leave message to the leader.
+        """
+        if not self.is_leader() or len(self._members) < 2:
+            return super().leave_lobby()
+
+        state = self._state_provider() if self._state_provider is not None else None
+        msg = HandoffMessage(self._identity, self._membership.to_dict(), state or State(-1, 0, False), self._term, self._command_seq)
+        for candidate in self._handoff_candidates():
+            if self.send_to(candidate, msg):
+                _logger.info(f"Handed the lobby over to {candidate}")
+                # The messages sent by this client are sent to the new leader from now on
+                self._stop_health_check()
+                self._leader = candidate
+                return
+            _logger.warning(f"Could not hand the lobby over to {candidate}")
+
+        super().leave_lobby()
+
+    def _handoff_candidates(self) -> list[IpAddress]:
+        """
+        Get the members the leader can hand the lobby over to, the preferred ones first.
+
+        Returns:
+        - list[IpAddress]: The identities of the candidates.
+        """
+        candidates = self._rank_by_rtt([member.ip_address for member in sorted(self._members.values(), key=lambda member: member.id, reverse=True)
+                                        if member.ip_address != self._identity])
+        if self._use_standby and self._successor_of == self._identity and self._successor in candidates:
+            candidates.remove(self._successor)
+            candidates.insert(0, self._successor)
+        return candidates
+
+    def _process_handoff(self, msg: HandoffMessage):
+        """
+        Process the received HandoffMessage within the lobby.
+
+        This client takes over the lobby from the leaving leader.
+
+        Parameters:
+        - msg (HandoffMessage): The HandoffMessage received from the leaving leader.
+        """
+        if msg.sender != self._leader or self.is_leader():
+            return
+
+        _logger.info(f"Taking over the lobby from the leaving leader {msg.sender}")
+        self._stop_health_check()
+        self._membership.remove([msg.sender])
+        # The members the leader knew about, but whose join this client has not received yet
+        added = self._membership.add_all([Peer.from_dict(member) for address, member in msg.members.items()
+                                          if address != msg.sender and address not in self._members])
+
+        self._term = max(self._term, msg.term) + 1
+        with self._command_lock:
+            self._command_seq = max(self._command_seq, msg.command_seq)
+        self._promote_to_leader()
+        self._announce_members_left([msg.sender])
+        if added:
+            self._announce_new_members(added)
+
+        if msg.state.index >= 0:
+            self._dispatch(self._identity, StateMessage(msg.state))
@@ -1,6 +1,14 @@
 import threading
+import time
 
-from net.base_lobby import BaseLobby
+from typing import Callable
+
+from net.backend import IpAddress
+from net.base_lobby import BaseLobby, Peer
+from net.failure_detector import PhiAccrualFailureDetector
+from net.membership import MembershipSnapshot
+from net.rtt_matrix import RttMatrix
+from net.timer_wheel import WheelTimer
 from net.lobby_message_implementation import LobbyMessageImplementation
 
 from messages.messages import *
@@ -19,27 +27,106 @@ class LobbyHealthCheckImplementation(BaseLobby):
         - _start_health_check
         - _stop_health_check
         - _process_health_check
+
+    The leader sends a health check to the members periodically, and the members acknowledge it.
+    Instead of fixed timeouts, the failures are detected with a phi accrual failure detector fed with
+    the health checks (on the members) and the acknowledgements (on the leader), so the detection
+    adapts to the jitter of the network.
+
+    The lobby and application messages prove their sender alive just as well, so the leader only sends
+    a health check to the members it has not both heard from and sent to during the last interval.
+    During an active session most of the health checks are therefore left out.
+
+    The health checks also measure the round trip times (RTT) between the members. The leader measures
+    its RTT to every member from their acknowledgements. If the RTT ranking is enabled with use_rtt_ranking(),
+    every member also probes one other member (in turn) whenever it receives a health check, and reports
+    its RTTs to the leader in the acknowledgement. The leader collects the reports into a matrix, ranks the
+    members by their median RTT to the rest of the lobby, and sends the best ranked members along with its
+    health checks. The ranking is used to pick the next leader. As the RTTs are only measured and reported
+    along with the health checks, the leader sends them at least every _RTT_REFRESH_INTERVAL even to the
+    members it is busy exchanging other messages with, so the matrix and the ranking do not go stale.
     """
-    # Time we wait on the leader for health acknowledgement
-    _HEALTH_CHECK_EXPIRATION_TIMER = 5.0
+    # Time between the health checks sent by the leader
+    _HEALTH_CHECK_INTERVAL = 5.0
+
+    # How often the suspicion levels of the monitored members are evaluated
+    _FAILURE_CHECK_INTERVAL = 0.5
 
-    # Time we wait for leader health check message
-    _HEALTH_CHECK_LEADER_ALIVE_TIMER = 8.0
+    # The members whose suspicion level (phi) exceeds this are considered dead
+    _PHI_THRESHOLD = 8.0
 
-    # The main health check loop thread
-    _health_check_loop_thread: threading.Thread
+    # The number of the best ranked members the leader sends along with its health checks
+    _RTT_RANKING_SIZE = 8
 
-    # Timer for waiting the health check
-    _health_check_expiration_timer: threading.Timer
+    # Longest time between the health checks sent to a member when the RTT ranking is enabled, so its RTTs are refreshed
+    _RTT_REFRESH_INTERVAL = 6 * _HEALTH_CHECK_INTERVAL
+
+    # Timer for the next evaluation of the health check
+    _health_check_expiration_timer: WheelTimer
+
+    # Measures the heartbeats of the monitored members, the leader on the members and the members on the leader
+    _failure_detector: PhiAccrualFailureDetector
+
+    # When the leader sent its last health check to every member
+    _health_check_sent: dict[IpAddress, float]
 
     # This can be used to stop the health check
     _is_health_check_running: bool
 
+    # Incremented on every start, so the timers of a stopped health check cannot restart it
+    _health_check_generation: int
+
+    # Guards the state of the health check between the timer callbacks and the other threads
+    _health_check_lock: threading.Lock
+
+    # Whether the members measure their RTTs to each other and the next leader is picked by them
+    _use_rtt_ranking: bool
+
+    # The RTTs measured by this client, and on the leader the ones reported by the members
+    _rtt_matrix: RttMatrix
+
+    # The members preferred as the next leader, the best first. Ranked by the leader, and received from it on the members.
+    _rtt_ranking: list[IpAddress]
+
+    # Used to probe the other members in turn
+    _rtt_probe_index: int
+
     def __init__(self):
         super().__init__()
-        self._health_check_loop_thread = None
         self._health_check_expiration_timer = None
         self._is_health_check_running = False
+        self._health_check_generation = 0
+        self._health_check_lock = threading.Lock()
+        self._failure_detector = PhiAccrualFailureDetector(self._PHI_THRESHOLD, first_heartbeat_estimate=self._HEALTH_CHECK_INTERVAL)
+        self._health_check_sent = {}
+        self._use_rtt_ranking = False
+        self._rtt_matrix = RttMatrix()
+        self._rtt_ranking = []
+        self._rtt_probe_index = 0
+
+        self.connect_to_event(self.EVENT_MEMBERS_CHANGED, self._retain_rtts)
+
+    def use_rtt_ranking(self, enabled: bool = True):
+        """
+        Select whether the members measure their round trip times to each other, so the next leader can be picked by them.
+
+        All the members of a lobby should use the same setting.
+
+        Parameters:
+        - enabled (bool): True to rank the members by their round trip times, False to pick the next leader by id.
+        """
+        self._use_rtt_ranking = enabled
+
+    def rtt_matrix(self) -> dict[IpAddress, dict[IpAddress, float]]:
+        """
+        Get the round trip times between the members known to the client.
+
+        On the leader these include the round trip times reported by the members.
+
+        Returns:
+        - dict[IpAddress, dict[IpAddress, float]]: The round trip times in seconds by the measuring and the measured member.
+        """
+        return self._rtt_matrix.to_dict()
 
     def _start_health_check(self):
         """
@@ -50,9 +137,17 @@ class LobbyHealthCheckImplementation(BaseLobby):
         system, please refer to the documentation or the implementation.
         """
         self._stop_health_check()
-        self._health_check_loop_thread = threading.Thread(target=self._health_check_loop)
-        self._is_health_check_running = True
-        self._health_check_loop_thread.start()
+        with self._health_check_lock:
+            self._health_check_generation += 1
+            self._is_health_check_running = True
+            generation = self._health_check_generation
+
+        # The leader may have changed, the monitored members are picked again
+        self._failure_detector.clear()
+        self._health_check_sent = {}
+        if not self.is_leader():
+            self._failure_detector.monitor(self._leader)
+        self._health_check_round(generation)
 
     def _stop_health_check(self):
         """
@@ -62,9 +157,11 @@ class LobbyHealthCheckImplementation(BaseLobby):
         the lobby. It effectively stops the monitoring of the status and availability
         of lobby members.
         """
-        self._is_health_check_running = False
-        if self._health_check_loop_thread is not None:
-            self._health_check_loop_thread.join()
+        with self._health_check_lock:
+            self._is_health_check_running = False
+            if self._health_check_expiration_timer is not None:
+                self._health_check_expiration_timer.cancel()
+                self._health_check_expiration_timer = None
 
     def _process_health_check(self, msg: HealthCheckMessage):
         """
@@ -77,91 +174,248 @@ class LobbyHealthCheckImplementation(BaseLobby):
         Parameters:
         - msg (HealthCheckMessage): The HealthCheckMessage received from another lobby member.
         """
-        if msg.sender in self._members:
-            self._members[msg.sender].is_alive = True
-            if not self.is_leader():
-                _logger.debug(f"Received health check from leader {self._leader_peer.name}/{self._leader_peer.ip_address}")
-                self._send_health_check()
-            else:
-                _logger.debug(f"Received health check acknowledge from {self._members[msg.sender].name}/{self._members[msg.sender].ip_address}")
+        if msg.sender not in self._members:
+            return
+
+        self._membership.set_alive(msg.sender, True)
+        if self.is_leader():
+            _logger.debug(f"Received health check acknowledge from {self._members[msg.sender].name}/{self._members[msg.sender].ip_address}")
+            self._failure_detector.heartbeat(msg.sender)
+            if msg.echo:
+                self._rtt_matrix.record(self._identity, msg.sender, _elapsed(msg.echo))
+            if msg.rtts:
+                self._rtt_matrix.set_row(msg.sender, {address: rtt / 1e6 for address, rtt in msg.rtts.items()})
+        elif msg.sender == self._leader:
+            _logger.debug(f"Received health check from leader {self._leader}")
+            self._failure_detector.heartbeat(msg.sender)
+            self._rtt_ranking = msg.ranking
+            self._send_health_check(echo=msg.sent_at)
+            self._check_membership_epoch(msg.sender, msg.epoch)
+            self._check_command_seq(msg.sender, msg.command_seq)
+            if self._use_rtt_ranking:
+                self._probe_rtt()
+        elif msg.echo:
+            # The answer to a probe of this client
+            self._rtt_matrix.record(self._identity, msg.sender, _elapsed(msg.echo))
+        elif msg.sent_at:
+            # A probe from another member
+            self.send_to(msg.sender, HealthCheckMessage(self._identity, echo=msg.sent_at))
+
+    def _is_health_check_current(self, generation: int) -> bool:
+        """
+        Check whether the health check started with the given generation is still running.
+
+        Parameters:
+        - generation (int): The generation of the health check.
+
+        Returns:
+        - bool: True if the health check has not been stopped or restarted since, False otherwise.
+        """
+        return self._is_health_check_running and generation == self._health_check_generation
 
-    def _health_check_loop(self):
+    def _health_check_round(self, generation: int):
         """
-        Main health check loop for monitoring leader or member health.
+        Start a new health check round for monitoring leader or member health.
 
-        This method serves as the main health check loop, started on a separate thread.
         As a lobby member, it is used to monitor the health of the leader, while as a leader,
-        it is used to monitor the health of the lobby members.
+        it is used to monitor the health of the lobby members and to send the health checks
+        when they are due. The round ends when its expiration timer fires, after which the
+        suspicion levels are evaluated and the next round is started.
+
+        Parameters:
+        - generation (int): The generation of the health check the round belongs to.
         """
-        # Initiate the expiration timer
-        self._health_check_expiration_timer = None
         if self.is_leader():
-            self._health_check_expiration_timer = threading.Timer(self._HEALTH_CHECK_EXPIRATION_TIMER, self._process_leader_health_check_expired)
-            self._send_health_check()
+            expired = self._process_leader_health_check_expired
+            if self._use_rtt_ranking:
+                self._update_rtt_ranking()
+            now = time.monotonic()
+            due = [member for address, member in self._members.items()
+                   if address != self._identity and self._is_health_check_due(address, now)]
+            if due:
+                self._send_health_check(due)
         else:
-            self._leader_peer.is_alive = False
-            self._health_check_expiration_timer = threading.Timer(self._HEALTH_CHECK_LEADER_ALIVE_TIMER, self._process_member_health_check_expired)
-        
-        # Start the timer
-        self._health_check_expiration_timer.start()
+            expired = self._process_member_health_check_expired
+
+        with self._health_check_lock:
+            if self._is_health_check_current(generation):
+                self._health_check_expiration_timer = self._schedule(self._FAILURE_CHECK_INTERVAL, self._health_check_round_expired, generation, expired)
 
-        while self._is_health_check_running:
-            # As soon as the expiration timer has expired we are starting a new one
-            if not self._health_check_expiration_timer.is_alive():
-                if self.is_leader():
-                    self._send_health_check()
-                    self._health_check_expiration_timer = threading.Timer(self._HEALTH_CHECK_EXPIRATION_TIMER, self._process_leader_health_check_expired)
-                else:
-                    self._leader_peer.is_alive = False
-                    self._health_check_expiration_timer = threading.Timer(self._HEALTH_CHECK_LEADER_ALIVE_TIMER, self._process_member_health_check_expired)
+    def _health_check_round_expired(self, generation: int, expired: Callable):
+        """
+        Finish a health check round and start the next one.
+
+        Parameters:
+        - generation (int): The generation of the health check the round belongs to.
+        - expired (Callable): The expiration handler of the round.
+        """
+        if not self._is_health_check_current(generation):
+            return
+
+        try:
+            expired()
+        finally:
+            # The expiration handler may have stopped the health check (e.g. to start a leader election).
+            # The next round is started even if the handler failed, so the failure detection keeps running.
+            if self._is_health_check_current(generation):
+                self._health_check_round(generation)
+
+    def _is_health_check_due(self, address: IpAddress, now: float) -> bool:
+        """
+        Check whether the leader should send a health check to a member.
+
+        A health check is due if the leader has not sent one to the member during the last interval,
+        and it has either not sent any other message to the member or not heard from the member.
+        With the RTT ranking enabled, a health check is also due if none has been sent to the member during
+        the last _RTT_REFRESH_INTERVAL, as the RTTs are only measured and reported along with them.
+
+        Parameters:
+        - address (IpAddress): The identity of the member.
+        - now (float): The current monotonic time.
 
-                self._health_check_expiration_timer.start()
+        Returns:
+        - bool: True if a health check should be sent, False otherwise.
+        """
+        since_sent = now - self._health_check_sent.get(address, 0.0)
+        if since_sent < self._HEALTH_CHECK_INTERVAL:
+            return False
+        if self._use_rtt_ranking and since_sent >= self._RTT_REFRESH_INTERVAL:
+            return True
+        self._touch_from_traffic(address)
+        last_heard = self._failure_detector.last_heard(address)
+        return (last_heard is None
+                or now - last_heard >= self._HEALTH_CHECK_INTERVAL
+                or now - self._last_sent.get(address, 0.0) >= self._HEALTH_CHECK_INTERVAL)
 
-        self._health_check_expiration_timer.cancel()
+    def _touch_from_traffic(self, address: IpAddress):
+        """
+        Let the failure detector know about the other messages received from a member.
+        """
+        last_received = self._last_received.get(address)
+        if last_received is not None:
+            self._failure_detector.touch(address, last_received)
 
-    def _send_health_check(self):
+    def _send_health_check(self, targets: list[Peer] | None = None, echo: int = 0):
         """
         Send a health check message to monitor leader or member health.
 
         This method is used to send a health check message. If the client is a lobby member,
-        it sends the health check to the leader. If the client is the leader, it broadcasts
-        the health check to all the members.
+        it sends the health check to the leader. If the client is the leader, it sends the
+        health check to the given members.
+
+        Parameters:
+        - targets (list[Peer] | None): The members the leader sends the health check to.
+        - echo (int): The sent_at of the health check of the leader a member acknowledges.
         """
         if self.is_leader():
-            for address, member in self._members.copy().items():
-                if address != self._identity:
-                    member.is_alive = False
-            _logger.debug(f"Broadcasting health check to members")
-            self.broadcast(HealthCheckMessage(self._identity))
+            now = time.monotonic()
+            for member in targets:
+                self._failure_detector.monitor(member.ip_address, now)
+                self._health_check_sent[member.ip_address] = now
+            ranking = self._rtt_ranking[:self._RTT_RANKING_SIZE] if self._use_rtt_ranking else None
+            _logger.debug(f"Sending health check to {len(targets)} members")
+            self.broadcast(HealthCheckMessage(self._identity, _now(), ranking=ranking, epoch=self._membership_epoch, command_seq=self._command_seq), targets)
+        else:
+            rtts = None
+            if self._use_rtt_ranking:
+                rtts = {address: min(round(rtt * 1e6), 2**32 - 1) for address, rtt in self._rtt_matrix.row(self._identity).items()}
+            _logger.debug(f"Sending health check acknowledge to leader {self._leader}")
+            self.send_to(self._leader, HealthCheckMessage(self._identity, echo=echo, rtts=rtts))
+
+    def _probe_rtt(self):
+        """
+        Measure the round trip time to the next other member in turn.
+        """
+        peers = sorted(address for address in self._members if address not in (self._identity, self._leader))
+        if not peers:
+            return
+        target = peers[self._rtt_probe_index % len(peers)]
+        self._rtt_probe_index += 1
+
+        msg = HealthCheckMessage(self._identity, _now())
+        # An unavailable member must not delay the handling of the health checks
+        if self._backend.blocking_send:
+            self._broadcast_pool.submit(self.send_to, target, msg)
         else:
-            _logger.debug(f"Sending health check acknowledge to leader {self._leader_peer.name}/{self._leader_peer.ip_address}")
-            self.send_to(self._leader, HealthCheckMessage(self._identity))
+            self.send_to(target, msg)
+
+    def _update_rtt_ranking(self):
+        """
+        Rank the members by their median round trip time to the rest of the lobby.
+
+        The leader itself is not ranked, and the members which have not been measured yet are ranked
+        last by their ids, as the bully election would pick them.
+        """
+        members = sorted((member for address, member in self._members.items() if address != self._identity), key=lambda member: member.id, reverse=True)
+        candidates = [member.ip_address for member in members]
+        self._rtt_ranking = self._rtt_matrix.rank(candidates, candidates)
+
+    def _rank_by_rtt(self, candidates: list[IpAddress]) -> list[IpAddress]:
+        """
+        Order the candidates for the next leader by the RTT ranking, if it is enabled.
+
+        Parameters:
+        - candidates (list[IpAddress]): The candidates, in the order they are preferred without the ranking.
+
+        Returns:
+        - list[IpAddress]: The ranked candidates first, then the rest in their original order.
+        """
+        if not self._use_rtt_ranking:
+            return candidates
+        ranked = [address for address in self._rtt_ranking if address in candidates]
+        return ranked + [address for address in candidates if address not in ranked]
+
+    def _retain_rtts(self, members: MembershipSnapshot, identity: IpAddress, leader: IpAddress):
+        """
+        Forget the round trip times of the members which have left.
+        """
+        self._rtt_matrix.retain(set(members))
 
     def _process_leader_health_check_expired(self):
         """
         Process leader health check timer expiration.
 
-        This method is called on the leader when the timer to receive the health check
-        acknowledgment from the members has expired. It allows the leader to handle the
-        situation where members have not responded within the expected time.
+        This method is called on the leader when the timer of a health check round has expired.
+        It allows the leader to handle the situation where members have not responded within
+        the expected time.
 
-        When a member has no responded within the expected time, it is immediately removed
+        When the suspicion level of a member exceeds the threshold, it is immediately removed
         from the lobby.
         """
-        for address, member in self._members.copy().items():
-            if not member.is_alive:
-                self.broadcast(MemberLeftMessage(self._identity, address))
-                _logger.info(f"Member {member.name}/{member.ip_address} timeout")
+        for address, member in self._members.items():
+            if address == self._identity:
+                continue
+            self._touch_from_traffic(address)
+            available = self._failure_detector.is_available(address)
+            self._membership.set_alive(address, available)
+            if not available:
+                _logger.info(f"Member {member.name}/{member.ip_address} timeout (phi {self._failure_detector.phi(address):.1f})")
                 self._remove_member(member)
-        
+                self._failure_detector.remove(address)
+                self._announce_members_left([address])
+
     def _process_member_health_check_expired(self):
         """
         Process member health check timer expiration.
 
-        This method is called on the members when the timer to receive the health check from
-        the leader has expired. If the leader didn't send a message within the expected time,
-        it initiates a new leader election procedure.
+        This method is called on the members when the timer of a health check round has expired.
+        If the suspicion level of the leader exceeds the threshold, because it has not sent a health
+        check for much longer than it usually does, a new leader election procedure is initiated.
         """
-        if not self._leader_peer.is_alive:
-            _logger.info(f"Leader {self._leader_peer.name}/{self._leader_peer.ip_address} timeout")
+        self._touch_from_traffic(self._leader)
+        if not self._failure_detector.is_available(self._leader):
+            self._membership.set_alive(self._leader, False)
+            _logger.info(f"Leader {self._leader} timeout (phi {self._failure_detector.phi(self._leader):.1f})")
             self._start_leader_election()
+
+def _now() -> int:
+    """
+    Get the current monotonic time in microseconds, used to measure the round trip times.
+    """
+    return time.monotonic_ns() // 1000
+
+def _elapsed(sent_at: int) -> float:
+    """
+    Get the time elapsed since the given monotonic time in microseconds, in seconds.
+    """
+    return max(_now() - sent_at, 0) / 1e6
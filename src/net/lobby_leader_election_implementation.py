@@ -1,6 +1,6 @@
-import threading
-
+from net.backend import IpAddress
 from net.base_lobby import BaseLobby
+from net.timer_wheel import WheelTimer
 from net.lobby_health_check_implementation import LobbyHealthCheckImplementation
 
 from messages.messages import *
@@ -26,7 +26,7 @@ class LobbyLeaderElectionImplementation(BaseLobby):
     _ELECTION_EXPIRATION_TIMER = 5.0
 
     # Timer for waiting election ok message
-    _election_timer: threading.Timer
+    _election_timer: WheelTimer
 
     # Used to monitor whether a leader election is in progress
     _leader_election_in_progress: bool
@@ -34,12 +34,16 @@ class LobbyLeaderElectionImplementation(BaseLobby):
     # Used to check whether an ElectionOk message has been received after the election has started
     _ok_received: bool
 
+    # The term of the current leader, only advanced by the term based election
+    _term: int
+
     def __init__(self):
         super().__init__()
 
         self._election_timer = None
         self._leader_election_in_progress = False
         self._ok_received = False
+        self._term = 0
 
     def _start_leader_election(self):
         """
@@ -53,25 +57,23 @@ class LobbyLeaderElectionImplementation(BaseLobby):
 
         # The health check will be stopped while the leader election takes place
         self._stop_health_check()
-        self._leader_peer.is_alive = False
+        self._membership.set_alive(self._leader, False)
         _logger.info(f"Starting a leader election")
 
         # If the current leader is still in our member list, we remove it
-        if self._leader in self._members:
-            del self._members[self._leader]
+        failed_leader = self._leader
+        self._membership.remove([failed_leader])
 
         # Iterate over all the members and send an ElectionStart message to those, whose id is greater
         has_greater = False
-        for address, member in self._members.items():
-            if member.id > self._me.id:
-                self._ok_received = False
-                self.send_to(address, ElectionStartMessage(self._identity))
-                has_greater = True
+        for member in self._members.higher(self._me.id):
+            self._ok_received = False
+            self.send_to(member.ip_address, ElectionStartMessage(self._identity, failed_leader))
+            has_greater = True
 
         # If there are members with greater id, we are waiting for ElectionOk message
         if has_greater:
-            self._election_timer = threading.Timer(self._ELECTION_EXPIRATION_TIMER, self._election_timer_expired)
-            self._election_timer.start()
+            self._election_timer = self._schedule(self._ELECTION_EXPIRATION_TIMER, self._election_timer_expired)
         else:
             # If there is no member with greater id, this client is immediately promoted to leader
             self._promote_to_leader()
@@ -90,6 +92,10 @@ class LobbyLeaderElectionImplementation(BaseLobby):
         if msg.sender in self._members:
             if self.is_leader():
                 self.send_to(msg.sender, ElectionOkMessage(self._identity))
+            elif msg.leader != self._leader and self._leader_peer is not None and not self._leader_election_in_progress:
+                # The election was started against a leader which has already been replaced, the new
+                # leader has announced itself to the sender as well
+                self.send_to(msg.sender, ElectionOkMessage(self._identity))
             elif self._me.id > self._members[msg.sender].id:
                 self.send_to(msg.sender, ElectionOkMessage(self._identity))
                 if not self._leader_election_in_progress:
@@ -126,35 +132,45 @@ class LobbyLeaderElectionImplementation(BaseLobby):
             if self._election_timer is not None:
                 self._election_timer.cancel()
 
-            if self.is_leader():
-                # If this client is the leader and received a new leader message from a member with greater id
-                # it simply yields and give it the role
-                if self._members[msg.sender].id > self._me.id:
-                    self._leader = msg.sender
-                    self._members[self._leader].is_leader = True
-                    self._members[self._identity].is_leader = False
-                else:
-                    # This cannot really happen, just be sure a message is printed
-                    _logger.fatal(f"{self._members[msg.sender]}/{self._members[msg.sender].ip_address} also promoted itself to leader, but its id is lesser than mine")
-            else:
-                # If this new leader is caused by the previous leader's timeout and the previous leader is
-                # still in the member list, it must be removed
-                if self._leader_peer is not None and (not self._leader_peer.is_alive or not self._leader_election_in_progress):
-                    del self._members[self._leader]
-
-                self._leader = msg.sender
-                self._members[self._leader].is_leader = True
-                self._members[self._leader].is_alive = True
-
-                # Send the pending messages to the new leader
-                for msg in self._pending_leader_msgs:
-                    self.send_to(self._leader, msg)
-                self._pending_leader_msgs = []
-
-            # Restart health check
-            self._leader_election_in_progress = False
-            self._start_health_check()
-            self._raise_event(self.EVENT_MEMBERS_CHANGED, self._members, self._identity, self._leader)
+            # If this client is the leader and received a new leader message from a member with greater id
+            # it simply yields and give it the role, a member with a lesser id cannot become the leader
+            if self.is_leader() and self._members[msg.sender].id < self._me.id:
+                # This cannot really happen, just be sure a message is printed
+                _logger.fatal(f"{self._members[msg.sender]}/{self._members[msg.sender].ip_address} also promoted itself to leader, but its id is lesser than mine")
+                return
+
+            self._accept_leader(msg.sender)
+
+    def _accept_leader(self, leader: IpAddress, remove_previous: bool = True):
+        """
+        Accept a new leader announced by an IAmLeaderMessage.
+
+        The previous leader is removed if it has failed, the messages queued for the leader are sent to
+        the new one, and the health check is restarted.
+
+        Parameters:
+        - leader (IpAddress): The identity of the new leader.
+        - remove_previous (bool): Whether the previous leader is removed if it has failed.
+        """
+        # If this new leader is caused by the previous leader's timeout and the previous leader is
+        # still in the member list, it must be removed
+        if (remove_previous and not self.is_leader() and self._leader != leader and self._leader_peer is not None
+                and (not self._membership.is_alive(self._leader) or not self._leader_election_in_progress)):
+            self._membership.remove([self._leader])
+
+        self._leader = leader
+        self._membership.set_leader(self._leader)
+        self._membership.set_alive(self._leader, True)
+
+        # Send the pending messages to the new leader
+        pending_leader_msgs, self._pending_leader_msgs = self._pending_leader_msgs, []
+        for msg in pending_leader_msgs:
+            self.send_to(self._leader, msg)
+
+        # Restart health check
+        self._leader_election_in_progress = False
+        self._start_health_check()
+        self._raise_event(self.EVENT_MEMBERS_CHANGED, self._members, self._identity, self._leader)
 
     def _election_timer_expired(self):
         """
@@ -173,8 +189,9 @@ class LobbyLeaderElectionImplementation(BaseLobby):
         to all members and restarts the health check for the new leader.
         """
         self._leader = self._identity
-        self._members[self._leader].is_leader = True
-        self.broadcast(IAmLeaderMessage(self._identity))
+        self._leader_election_in_progress = False
+        self._membership.set_leader(self._leader)
+        self.broadcast(IAmLeaderMessage(self._identity, self._term))
         self._start_health_check()
         self._raise_event(self.EVENT_MEMBERS_CHANGED, self._members, self._identity, self._leader)
         _logger.info(f"I am promoted to leader")
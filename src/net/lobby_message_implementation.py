@@ -1,4 +1,10 @@
+import dataclasses
+import threading
+import time
+
+from net.backend import IpAddress
 from net.base_lobby import BaseLobby, Peer
+from net.membership import MembershipDelta, MembershipSnapshot
 
 from messages.messages import *
 
@@ -19,9 +25,42 @@ class LobbyMessageImplementation(BaseLobby):
         - _process_member_accept
         - _process_leave
         - _process_member_left
+
+    The leader admits the new members in batches. The join requests received within a short
+    admission window are collected, and the new members are announced to the lobby with a single
+    NewMemberMessage, while the joiners receive the same MemberAcceptMessage. A join storm of N
+    members then takes a few messages per member instead of one broadcast per join.
+
+    Every change of the members announced by the leader starts a new membership epoch. The members
+    apply a change only if it follows the last epoch they have seen, so a late or a repeated change
+    cannot add or remove a member again. A member which has missed changes, or which has accepted a
+    new leader, asks the leader for the changes since its last epoch. The leader answers with the
+    changes merged into one, or with all the members if it no longer has the missed changes.
     """
+    # Time the leader collects the join requests before admitting them together
+    _ADMISSION_WINDOW = 0.02
+
+    # Time a member waits for the answer to its membership request before asking the same member again
+    _MEMBERSHIP_REQUEST_INTERVAL = 0.5
+
+    # The names of the clients waiting to be admitted by the leader, by address
+    _pending_admissions: dict[IpAddress, str]
+
+    # Guards the pending admissions between the message handlers and the admission timer
+    _admission_lock: threading.Lock
+
+    # The member asked for the missed membership changes and when, None if there is no request pending
+    _membership_requested: tuple[IpAddress, float] | None
+
     def __init__(self):
         super().__init__()
+        self._pending_admissions = {}
+        self._admission_lock = threading.Lock()
+        self._membership_requested = None
+
+        self.connect_to_message(MembershipRequestMessage, self._process_membership_request)
+        self.connect_to_message(MembershipDeltaMessage, self._process_membership_delta)
+        self.connect_to_event(self.EVENT_MEMBERS_CHANGED, self._follow_membership_epoch)
 
     def _process_request_join(self, msg: RequestJoinMessage):
         """
@@ -48,43 +87,85 @@ class LobbyMessageImplementation(BaseLobby):
         This method is specifically designed to handle the RequestNewMemberMessage, which
         can only be received by the leader. The RequestNewMemberMessage is sent by another
         lobby member when that member receives a RequestJoinMessage and propagates it to the leader.
+        The client is admitted with the other clients requesting to join during the admission window.
 
         Parameters:
         - msg (RequestNewMemberMessage): The RequestNewMemberMessage received from another lobby member.
         """
-        # Generate a unique id for the new member
-        new_member_id = self._generate_random_id()
-
-        # Broadcast the new member
-        self.broadcast(NewMemberMessage(self._identity, msg.name, msg.new_member_address, new_member_id))
-        
-        # Add the new member
-        address = msg.new_member_address.split(':')
-        self._add_member(Peer(address[0], address[1], msg.name, new_member_id, False, True))
-        
-        # Send an acceptance message for the new member 
-        self.send_to(msg.new_member_address,
-                     MemberAcceptMessage(self._identity,
-                                         {address: member.__dict__ for address, member in self._members.items()}))
-
-        self._raise_event(self.EVENT_NEW_MEMBER, msg.new_member_address)
-        self._raise_event(self.EVENT_MEMBERS_CHANGED, self._members, self._identity, self._leader)
+        with self._admission_lock:
+            first = not self._pending_admissions
+            self._pending_admissions[msg.new_member_address] = msg.name
+        # The first request of a window schedules the admission of the whole batch
+        if first:
+            self._schedule(self._ADMISSION_WINDOW, self._admit_pending_members)
+
+    def _admit_pending_members(self):
+        """
+        Admit the clients whose join requests were received during the admission window.
+
+        The new members are added with a single change of the members, announced to the other members
+        with a single NewMemberMessage, and the joiners receive the same MemberAcceptMessage.
+        """
+        with self._admission_lock:
+            pending = self._pending_admissions
+            self._pending_admissions = {}
+
+        if not self.is_leader():
+            # The leader changed during the window, the requests are passed on to the new leader
+            for address, name in pending.items():
+                self.send_to(self._leader, RequestNewMemberMessage(self._identity, name, address))
+            return
+
+        # Generate unique ids for the new members, the clients which are already members are only sent the acceptance again
+        joiners = []
+        rejoiners = []
+        ids = set()
+        for address, name in pending.items():
+            if address in self._members:
+                rejoiners.append(self._members[address])
+                continue
+            new_member_id = self._generate_random_id()
+            while new_member_id in ids:
+                new_member_id = self._generate_random_id()
+            ids.add(new_member_id)
+            ip, port = address.split(':')
+            joiners.append(Peer(ip, int(port), name, new_member_id, False))
+
+        if joiners:
+            _logger.debug(f'Admitting {len(joiners)} new members')
+            others = [member for member in self._members.values() if member.ip_address != self._identity]
+            self._add_members(joiners)
+
+            # Announce the new members to the other members
+            self._announce_new_members(joiners, others)
+
+        # Send the acceptance to the new members, the message is encoded once for all of them. It carries
+        # the state of the application, so the new members are in sync without waiting for another message.
+        # The epoch is taken before the members, so a change in between is applied again rather than missed.
+        # Likewise, the sequence number of the last command is taken before the state.
+        epoch = self._membership_epoch
+        command_seq = self._command_seq
+        state = self._state_provider() if self._state_provider is not None else None
+        captured_at = int(time.time() * 1000)
+        self.broadcast(MemberAcceptMessage(self._identity, self._membership.to_dict(), epoch, state, captured_at, self._playlist_identity, command_seq), joiners + rejoiners)
+
+        for joiner in joiners:
+            self._raise_event(self.EVENT_NEW_MEMBER, joiner.ip_address)
 
     def _process_new_member(self, msg: NewMemberMessage):
         """
         Process the received NewMemberMessage within the lobby.
 
         This method is responsible for handling the NewMemberMessage, which is sent by the leader
-        to all members of the lobby. The purpose of this message is to notify all members that a
-        new member has successfully joined the lobby.
+        to all members of the lobby. The purpose of this message is to notify all members that
+        new members have successfully joined the lobby.
 
         Parameters:
         - msg (NewMemberMessage): The NewMemberMessage received from the lobby leader.
         """
-        # Leader is telling us about the new member
-        _logger.debug(f'New lobby member: {msg.new_member_address}')
-        address = msg.new_member_address.split(':')
-        self._add_member(Peer(address[0], address[1], msg.name, msg.new_member_id, False, True))
+        # Leader is telling us about the new members
+        _logger.debug(f'New lobby members: {", ".join(msg.members)}')
+        self._apply_membership_delta(msg.epoch - 1, MembershipDelta(msg.epoch, msg.sender, msg.members, ()))
 
     def _process_member_accept(self, msg: MemberAcceptMessage):
         """
@@ -92,20 +173,25 @@ class LobbyMessageImplementation(BaseLobby):
 
         This method is responsible for handling the MemberAcceptMessage, which is sent to a
         client after requesting to join the lobby. The MemberAcceptMessage contains the necessary
-        information for the client to initialize itself within the lobby.
+        information for the client to initialize itself within the lobby, including the state
+        of the application, which is applied right away.
 
         Parameters:
         - msg (MemberAcceptMessage): The MemberAcceptMessage received by a joining client.
         """
-        # Update my own member list
+        # Update my own member list, the acceptance is sent by the leader
+        self._leader = msg.sender
+        members = {self._identity: self._me}
         for ip_address, member in msg.members.items():
-            member = Peer(**member)
+            member = Peer.from_dict(member)
             if ip_address != self._identity:
-                self._members[ip_address] = member
-                if self._members[ip_address].is_leader:
-                    self._leader = ip_address
+                members[ip_address] = member
             else:
-                self._me.id = member.id
+                members[ip_address] = dataclasses.replace(self._me, id=member.id)
+        self._membership.assign(members.values())
+        self._reset_membership_epoch(msg.epoch, msg.sender)
+        # The commands of the leader are handled in order after the ones included in its state
+        self._reset_command_seq(msg.sender, msg.command_seq)
 
         # Start health check
         self._start_health_check()
@@ -113,6 +199,21 @@ class LobbyMessageImplementation(BaseLobby):
         self._raise_event(self.EVENT_MEMBERS_CHANGED, self._members, self._identity, self._leader)
         _logger.debug(f'Joined lobby, I am {self._identity}, with id {self._me.id} (leader: {self._leader})')
 
+        if msg.state.index < 0:
+            return
+        if msg.playlist and self._playlist_identity and msg.playlist != self._playlist_identity:
+            _logger.warning(f'The playlist of the leader differs from ours, not applying its state')
+            return
+
+        # The state has kept playing since the leader captured it. The clocks of the members may differ,
+        # but the state cannot be older than the time since the join request was sent.
+        state = msg.state
+        if state.playing:
+            round_trip = int((time.monotonic() - self._join_requested_at) * 1000)
+            age = min(max(int(time.time() * 1000) - msg.captured_at, 0), round_trip)
+            state = dataclasses.replace(state, timestamp=state.timestamp + age)
+        self._dispatch(self._identity, StateMessage(state))
+
     def _process_leave(self, msg: LeaveMessage):
         """
         Process the received LeaveMessage within the lobby.
@@ -130,7 +231,7 @@ class LobbyMessageImplementation(BaseLobby):
             _logger.debug(f'{msg.sender} has left the lobby')
             if self.is_leader():
                 self._remove_member(self._members[msg.sender])
-                self.broadcast(MemberLeftMessage(self._identity, msg.sender))
+                self._announce_members_left([msg.sender])
             elif self._leader == msg.sender:
                 self._start_leader_election()
 
@@ -145,4 +246,176 @@ class LobbyMessageImplementation(BaseLobby):
         Parameters:
         - msg (MemberLeftMessage): The MemberLeftMessage received from the lobby leader.
         """
-        self._remove_member(self._members[msg.member_address])
\ No newline at end of file
+        self._apply_membership_delta(msg.epoch - 1, MembershipDelta(msg.epoch, msg.sender, {}, (msg.member_address,)))
+
+    def _process_membership_request(self, msg: MembershipRequestMessage):
+        """
+        Process the received MembershipRequestMessage within the lobby.
+
+        The leader answers with the membership changes since the epoch of the requesting member merged
+        into one. If the leader does not have all the changes, or they would not be smaller than the
+        members, it answers with all the members instead.
+
+        Parameters:
+        - msg (MembershipRequestMessage): The MembershipRequestMessage received from a member.
+        """
+        if not self.is_leader():
+            return
+
+        with self._membership_epoch_lock:
+            epoch = self._membership_epoch
+            log = list(self._membership_log)
+
+        since = -1
+        joined = {}
+        left = set()
+        for i, delta in enumerate(log):
+            if delta.epoch == msg.epoch and delta.issuer == msg.issuer:
+                since = msg.epoch
+                for change in log[i + 1:]:
+                    for address in change.left:
+                        joined.pop(address, None)
+                    left.update(change.left)
+                    left.difference_update(change.joined)
+                    joined.update(change.joined)
+                break
+
+        if since < 0 or len(joined) + len(left) >= len(self._members):
+            since = -1
+            joined = self._membership.to_dict()
+            left = set()
+        _logger.debug(f'Sending the membership changes since {since} to {msg.sender}')
+        self.send_to(msg.sender, MembershipDeltaMessage(self._identity, since, epoch, joined, sorted(left)))
+
+    def _process_membership_delta(self, msg: MembershipDeltaMessage):
+        """
+        Process the received MembershipDeltaMessage within the lobby.
+
+        Parameters:
+        - msg (MembershipDeltaMessage): The MembershipDeltaMessage received from the leader.
+        """
+        with self._membership_epoch_lock:
+            self._membership_requested = None
+            if msg.since < 0:
+                # All the members, the other changes this client has seen are overridden
+                members = {self._identity: self._me}
+                for address, member in msg.joined.items():
+                    if address != self._identity:
+                        members[address] = Peer.from_dict(member)
+                self._membership.assign(members.values())
+                self._reset_membership_epoch(msg.epoch, msg.sender)
+                changed = True
+            elif msg.since == self._membership_epoch:
+                changed = self._change_members(MembershipDelta(msg.epoch, msg.sender, msg.joined, tuple(msg.left)))
+            else:
+                return
+
+        if changed:
+            self._raise_event(self.EVENT_MEMBERS_CHANGED, self._members, self._identity, self._leader)
+
+    def _apply_membership_delta(self, since: int, delta: MembershipDelta):
+        """
+        Apply a membership change announced by the leader, or ask for the missed changes if it does not follow the last epoch.
+
+        Parameters:
+        - since (int): The epoch the change applies on.
+        - delta (MembershipDelta): The change.
+        """
+        with self._membership_epoch_lock:
+            if delta.issuer == self._membership_issuer and delta.epoch <= self._membership_epoch:
+                # Already applied, e.g. with the changes requested after a gap
+                return
+            missed = delta.issuer != self._membership_issuer or since != self._membership_epoch
+            if not missed:
+                changed = self._change_members(delta)
+
+        if missed:
+            _logger.debug(f'Missed membership changes before epoch {delta.epoch} of {delta.issuer}')
+            self._request_membership(delta.issuer)
+        elif changed:
+            self._raise_event(self.EVENT_MEMBERS_CHANGED, self._members, self._identity, self._leader)
+
+    def _change_members(self, delta: MembershipDelta) -> bool:
+        """
+        Apply a membership change and log it. The membership epoch lock must be held.
+
+        Parameters:
+        - delta (MembershipDelta): The change.
+
+        Returns:
+        - bool: True if the members changed.
+        """
+        # The members may have been removed already, e.g. a leader which handed the lobby over
+        removed = self._membership.remove([address for address in delta.left if address != self._identity])
+        added = self._membership.add_all([Peer.from_dict(member) for address, member in delta.joined.items() if address not in self._members])
+        self._membership_epoch = delta.epoch
+        self._membership_issuer = delta.issuer
+        self._membership_log.append(delta)
+        return bool(removed or added)
+
+    def _reset_membership_epoch(self, epoch: int, issuer: IpAddress):
+        """
+        Continue from the given epoch after receiving all the members, the logged changes no longer apply.
+
+        Parameters:
+        - epoch (int): The epoch the members are up to date with.
+        - issuer (IpAddress): The leader which issued the epoch.
+        """
+        with self._membership_epoch_lock:
+            self._membership_epoch = epoch
+            self._membership_issuer = issuer
+            self._membership_log.clear()
+            self._membership_log.append(MembershipDelta(epoch, issuer, {}, ()))
+
+    def _request_membership(self, target: IpAddress):
+        """
+        Ask a leader for the membership changes since the last epoch this client has seen.
+
+        Parameters:
+        - target (IpAddress): The leader to ask.
+        """
+        now = time.monotonic()
+        with self._membership_epoch_lock:
+            if self._membership_requested is not None:
+                requested_from, requested_at = self._membership_requested
+                if requested_from == target and now - requested_at < self._MEMBERSHIP_REQUEST_INTERVAL:
+                    return
+            self._membership_requested = (target, now)
+            msg = MembershipRequestMessage(self._identity, self._membership_epoch, self._membership_issuer)
+        self.send_to(target, msg)
+
+    def _check_membership_epoch(self, leader: IpAddress, epoch: int):
+        """
+        Ask for the missed membership changes if the leader is at a later epoch than this client.
+
+        Parameters:
+        - leader (IpAddress): The identity of the leader.
+        - epoch (int): The membership epoch of the leader.
+        """
+        with self._membership_epoch_lock:
+            if not self._membership_issuer or (leader == self._membership_issuer and epoch <= self._membership_epoch):
+                return
+        self._request_membership(leader)
+
+    def _follow_membership_epoch(self, members: MembershipSnapshot, identity: IpAddress, leader: IpAddress):
+        """
+        Follow the membership epochs of a new leader after the members have changed.
+
+        A new leader starts an epoch of its own, and the other members ask it for the changes they have
+        missed, as it may have seen other changes of the previous leader than they have.
+
+        Parameters:
+        - members (MembershipSnapshot): The members of the lobby.
+        - identity (IpAddress): Own identity.
+        - leader (IpAddress): The identity of the leader.
+        """
+        with self._membership_epoch_lock:
+            if not leader or leader == self._membership_issuer:
+                return
+            if leader == identity:
+                self._next_membership_epoch({}, ())
+                return
+            if not self._membership_issuer:
+                # Not accepted to the lobby yet
+                return
+        self._request_membership(leader)
\ No newline at end of file
@@ -0,0 +1,257 @@
+import statistics
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import wait
+from dataclasses import dataclass
+
+from net.backend import IpAddress
+from net.base_lobby import BaseLobby, _write_message
+from net.membership import MembershipSnapshot, Peer
+
+from messages.messages import *
+
+import log
+
+_logger = log.getLogger(__name__)
+
+@dataclass(frozen=True, slots=True)
+class RelayLatency:
+    """
+    Delivery latency of the relayed broadcasts at a depth of the relay tree.
+    """
+    depth: int
+    count: int
+    mean: float # Seconds
+    max: float # Seconds
+
+class LobbyRelayImplementation(BaseLobby):
+    """
+    Relay tree broadcast for the BaseLobby.
+
+    By default the leader sends every broadcast to every member itself, so its upload bandwidth and
+    the number of its connections grow with the size of the lobby. With the relay tree the leader
+    sends a broadcast to a few relays only, and every relay forwards it to its own subtree:
+
+        - The members (except the leader) are split between the relays. The first member of every
+          part becomes a relay, and the rest of the part is its subtree, which it splits in the same
+          way, so the depth of the tree grows with the logarithm of the size of the lobby.
+        - The subtree travels with the message, so the relays do not need to know the tree, and a
+          relay forwarding a message never depends on its own view of the members.
+        - If a relay cannot be reached, its parent forwards the message to the subtree of the relay
+          itself. The leader removes the unreachable relays from the lobby, as in a direct broadcast.
+          A relay deeper in the tree reports the members it could not reach to the leader, which
+          removes them in the same way.
+
+    The leader rebuilds the tree whenever the members change. Every member measures the delivery
+    latency of the relayed messages by its depth in the tree, which assumes that the clocks of the
+    members are roughly in sync. The relay tree is enabled with use_relay_tree().
+    """
+    # The number of relays the leader and every relay forward a broadcast to
+    _RELAY_FANOUT = 4
+
+    # The number of latencies kept for every depth
+    _RELAY_LATENCY_WINDOW = 100
+
+    # The number of relays a broadcast is split between, 0 if the relay tree is not used
+    _relay_fanout: int
+
+    # The relays of the leader with their subtrees, empty if the client is not the leader
+    _relay_tree: list[tuple[IpAddress, list[IpAddress]]]
+
+    # The latest delivery latencies of the relayed messages by depth in seconds
+    _relay_latencies: dict[int, deque[float]]
+
+    # Guards the latencies between the message handlers and the readers
+    _relay_latency_lock: threading.Lock
+
+    def __init__(self):
+        super().__init__()
+        self._relay_fanout = 0
+        self._relay_tree = []
+        self._relay_latencies = {}
+        self._relay_latency_lock = threading.Lock()
+
+        self.connect_to_message(RelayMessage, self._process_relay)
+        self.connect_to_message(RelayUnreachableMessage, self._process_relay_unreachable)
+        self.connect_to_event(self.EVENT_MEMBERS_CHANGED, self._rebuild_relay_tree)
+
+    def use_relay_tree(self, enabled: bool = True, fanout: int = _RELAY_FANOUT):
+        """
+        Select whether the leader broadcasts through a tree of relays instead of sending to every member itself.
+
+        Only the leader needs to enable the relay tree, every member forwards the relayed messages it receives.
+
+        Parameters:
+        - enabled (bool): True to broadcast through the relay tree, False to send to every member directly.
+        - fanout (int): The number of relays the leader and every relay forward a broadcast to.
+        """
+        if enabled and fanout < 1:
+            raise ValueError('the fanout must be at least 1')
+        self._relay_fanout = fanout if enabled else 0
+        self._rebuild_relay_tree(self._members, self._identity, self._leader)
+
+    def relay_latency(self) -> list[RelayLatency]:
+        """
+        Get the delivery latencies of the relayed messages received by the client.
+
+        Returns:
+        - list[RelayLatency]: The latencies by depth in the relay tree, in ascending order of the depth.
+        """
+        with self._relay_latency_lock:
+            return [RelayLatency(depth, len(latencies), statistics.fmean(latencies), max(latencies))
+                    for depth, latencies in sorted(self._relay_latencies.items())]
+
+    def broadcast(self, msg: BaseMessage, targets: list[Peer] | None = None) -> None:
+        """
+        Broadcast a message to all lobby members.
+
+        If the relay tree is enabled, a broadcast to all the members is sent through the relay tree.
+        Otherwise, or if only some of the members are targeted, the message is sent to the members directly.
+
+        Parameters:
+        - msg (BaseMessage): The message to be broadcasted to all members.
+        - targets (list[Peer] | None): The members to send the message to, all the other members by default.
+        """
+        tree = self._relay_tree
+        if targets is not None or not self.is_leader() or not any(subtree for _, subtree in tree):
+            return super().broadcast(msg, targets)
+
+        _logger.debug(f"Relaying message to {len(self._members) - 1} members: {msg.__dict__}")
+        payload = _write_message(False, self._identity, msg, self._codec.encode(msg))
+        unreachable = self._relay(tree, self._relay_fanout, 1, time.time_ns() // 1000, payload)
+        self._remove_unavailable_members([self._members[address] for address in unreachable if address in self._members])
+
+    def _process_relay(self, msg: RelayMessage):
+        """
+        Process the received RelayMessage within the lobby.
+
+        The message is forwarded to the subtree of the client first, and then handled as if it had been
+        received from the leader directly.
+
+        Parameters:
+        - msg (RelayMessage): The RelayMessage received from the leader or a relay.
+        """
+        latency = max(time.time_ns() // 1000 - msg.sent_at, 0) / 1e6
+        with self._relay_latency_lock:
+            latencies = self._relay_latencies.get(msg.depth)
+            if latencies is None:
+                latencies = self._relay_latencies[msg.depth] = deque(maxlen=self._RELAY_LATENCY_WINDOW)
+            latencies.append(latency)
+        _logger.debug(f"Relayed message from {msg.sender} delivered at depth {msg.depth} in {latency * 1000:.1f} ms")
+
+        if msg.subtree:
+            unreachable = self._relay(_split(msg.subtree, msg.fanout), msg.fanout, msg.depth + 1, msg.sent_at, msg.payload)
+            if unreachable:
+                _logger.warning(f"Could not relay message to {unreachable}, reporting them to the leader")
+                self.send_to_leader(RelayUnreachableMessage(self._identity, unreachable))
+
+        self._process_data(msg.sender, msg.payload)
+
+    def _process_relay_unreachable(self, msg: RelayUnreachableMessage):
+        """
+        Process the received RelayUnreachableMessage within the lobby.
+
+        The leader removes the members a relay could not reach, as if its own broadcast had not reached them.
+
+        Parameters:
+        - msg (RelayUnreachableMessage): The RelayUnreachableMessage received from a relay.
+        """
+        if not self.is_leader():
+            return
+        self._remove_unavailable_members([self._members[address] for address in msg.unreachable
+                                          if address in self._members and address != self._identity])
+
+    def _relay(self, branches: list[tuple[IpAddress, list[IpAddress]]], fanout: int, depth: int, sent_at: int, payload: bytes) -> list[IpAddress]:
+        """
+        Forward a relayed message to the given relays.
+
+        If sending can block, the message is sent to the relays in parallel, so an unavailable relay
+        cannot delay the others. A relay whose send does not finish within the broadcast deadline is
+        unreachable together with its subtree.
+
+        Parameters:
+        - branches (list[tuple[IpAddress, list[IpAddress]]]): The relays with their subtrees.
+        - fanout (int): The number of relays every subtree is split between.
+        - depth (int): The depth of the relays in the relay tree.
+        - sent_at (int): When the leader sent the message, microseconds since the epoch.
+        - payload (bytes): The relayed message, including its routing header.
+
+        Returns:
+        - list[IpAddress]: The members which could not be reached.
+        """
+        if self._backend.blocking_send and len(branches) > 1:
+            sends = {self._broadcast_pool.submit(self._relay_branch, relay, subtree, fanout, depth, sent_at, payload): (relay, subtree)
+                     for relay, subtree in branches}
+            done, not_done = wait(sends, timeout=self._BROADCAST_DEADLINE)
+            # As with a direct broadcast, a relay whose send did not finish in time is unavailable. Its subtree
+            # has not received the message either, so it is unreachable as well.
+            unreachable = [address for send in not_done for address in (sends[send][0], *sends[send][1])]
+            unreachable.extend(address for send in done if send.exception() is not None for address in (sends[send][0], *sends[send][1]))
+            unreachable.extend(address for send in done if send.exception() is None for address in send.result())
+            if not_done:
+                _logger.warning(f"Broadcast deadline expired before relaying to {[sends[send][0] for send in not_done]}")
+            return unreachable
+
+        unreachable = []
+        for relay, subtree in branches:
+            unreachable.extend(self._relay_branch(relay, subtree, fanout, depth, sent_at, payload))
+        return unreachable
+
+    def _relay_branch(self, relay: IpAddress, subtree: list[IpAddress], fanout: int, depth: int, sent_at: int, payload: bytes) -> list[IpAddress]:
+        """
+        Forward a relayed message to a relay, or to its subtree if the relay cannot be reached.
+
+        Returns:
+        - list[IpAddress]: The relays which could not be reached.
+        """
+        msg = RelayMessage(self._identity, depth, fanout, sent_at, subtree, payload)
+        if self._send_data(relay, _write_message(False, self._identity, msg, self._codec.encode(msg)), msg):
+            return []
+
+        _logger.debug(f"Relay {relay} cannot be reached, forwarding to its subtree of {len(subtree)} members")
+        # Sent one at a time, as this may already run on a worker of the broadcast pool
+        unreachable = [relay]
+        for sub_relay, sub_subtree in _split(subtree, fanout):
+            unreachable.extend(self._relay_branch(sub_relay, sub_subtree, fanout, depth, sent_at, payload))
+        return unreachable
+
+    def _rebuild_relay_tree(self, members: MembershipSnapshot, identity: IpAddress, leader: IpAddress):
+        """
+        Rebuild the relay tree of the leader after the members have changed.
+
+        Parameters:
+        - members (MembershipSnapshot): The members of the lobby.
+        - identity (IpAddress): Own identity.
+        - leader (IpAddress): The identity of the leader.
+        """
+        if self._relay_fanout == 0 or identity != leader:
+            self._relay_tree = []
+            return
+
+        self._relay_tree = _split(sorted(address for address in members if address != identity), self._relay_fanout)
+        _logger.debug(f"Rebuilt the relay tree of {len(members) - 1} members with {len(self._relay_tree)} relays")
+
+def _split(addresses: list[IpAddress], fanout: int) -> list[tuple[IpAddress, list[IpAddress]]]:
+    """
+    Split members between relays.
+
+    The members are split into at most fanout parts of (nearly) the same size. The first member of
+    every part is the relay, and the rest of the part is the subtree of the relay.
+
+    Parameters:
+    - addresses (list[IpAddress]): The members.
+    - fanout (int): The maximum number of relays.
+
+    Returns:
+    - list[tuple[IpAddress, list[IpAddress]]]: The relays with their subtrees.
+    """
+    parts = min(fanout, len(addresses))
+    branches = []
+    start = 0
+    for part in range(parts):
+        end = start + (len(addresses) - start) // (parts - part)
+        branches.append((addresses[start], addresses[start + 1:end]))
+        start = end
+    return branches
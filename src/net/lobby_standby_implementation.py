@@ -0,0 +1,299 @@
+import threading
+
+from net.backend import IpAddress
+from net.base_lobby import BaseLobby
+from net.membership import MembershipSnapshot, Peer
+from net.timer_wheel import WheelTimer
+
+from messages.messages import *
+
+import log
+
+_logger = log.getLogger(__name__)
+
+class LobbyStandbyImplementation(BaseLobby):
+    """
+    Hot standby successor for the BaseLobby.
+
+    Without a standby, the members which notice the failure of the leader have to run a leader election
+    before the lobby can be controlled again. With the standby, the leader designates its successor in
+    advance and keeps it up to date:
+
+        - The leader picks the member with the greatest id as its successor, which is also the member
+          the bully election would elect, or with the RTT ranking the best ranked member, and tells
+          every member about it.
+        - The leader sends the members, the state of the application and the sequence number of the last
+          application command to the successor periodically.
+        - When the successor notices the failure of the leader, it promotes itself immediately with a
+          single IAmLeaderMessage, skipping the election rounds. It announces the state of the application,
+          so the members which missed the last commands of the failed leader catch up.
+        - The other members wait for the announcement of the successor for a while instead of starting an
+          election. If the successor does not announce itself in time (e.g. it has failed as well), they
+          fall back to the leader election.
+
+    The standby is enabled with use_standby(). All the members of a lobby should enable it, as the members
+    without it start an election of their own, which may elect another leader than the successor.
+    """
+    # Time between the updates the leader sends to its successor
+    _STANDBY_SYNC_INTERVAL = 1.0
+
+    # Time the members wait for the successor to announce itself before starting a leader election
+    _SUCCESSOR_TAKEOVER_TIMEOUT = 2.0
+
+    # With the RTT ranking, the successor is replaced only when it is not among this many best ranked members
+    _SUCCESSOR_RANK_TOLERANCE = 3
+
+    # Whether the leader designates a successor and the members wait for it when the leader fails
+    _use_standby: bool
+
+    # The successor designated by the leader, None if there is none
+    _successor: IpAddress | None
+
+    # The leader which designated the successor, the designation is void after the leader has changed
+    _successor_of: IpAddress | None
+
+    # The members the leader has told about its successor
+    _successor_informed: set[IpAddress]
+
+    # The latest update from the leader, None if this client is not the successor or has not received one
+    _standby_sync: StandbySyncMessage | None
+
+    # Timer for the next update the leader sends to its successor
+    _standby_sync_timer: WheelTimer
+
+    # Timer for the successor to announce itself after the failure of the leader
+    _successor_takeover_timer: WheelTimer
+
+    # Incremented whenever the updates are stopped, so a stale timer does nothing
+    _standby_generation: int
+
+    # Guards the designation and the updates between the timer callbacks and the message handlers
+    _standby_lock: threading.RLock
+
+    def __init__(self):
+        super().__init__()
+        self._use_standby = False
+        self._successor = None
+        self._successor_of = None
+        self._successor_informed = set()
+        self._standby_sync = None
+        self._standby_sync_timer = None
+        self._successor_takeover_timer = None
+        self._standby_generation = 0
+        self._standby_lock = threading.RLock()
+
+        self.connect_to_message(SuccessorMessage, self._process_successor)
+        self.connect_to_message(StandbySyncMessage, self._process_standby_sync)
+        self.connect_to_event(self.EVENT_MEMBERS_CHANGED, self._designate_successor)
+
+    def use_standby(self, enabled: bool = True):
+        """
+        Select whether the leader designates a hot standby successor, which takes over immediately if the leader fails.
+
+        All the members of a lobby should use the same setting, and it should be selected
+        before the lobby is created or joined.
+
+        Parameters:
+        - enabled (bool): True to use the standby successor, False to always elect a new leader.
+        """
+        self._use_standby = enabled
+        self._designate_successor(self._members, self._identity, self._leader)
+
+    def _update_rtt_ranking(self):
+        """
+        Rank the members by their round trip times, and designate a new successor if the current one is no longer ranked well.
+        """
+        super()._update_rtt_ranking()
+        if self._use_standby:
+            self._designate_successor(self._members, self._identity, self._leader)
+
+    def _start_leader_election(self):
+        """
+        Handle the failure of the leader.
+
+        The successor takes over immediately, and the other members wait for it to announce itself.
+        Without a valid designation, the leader election is started.
+        """
+        with self._standby_lock:
+            designated = self._use_standby and self._successor is not None and self._successor_of == self._leader
+            if designated:
+                if self._leader_election_in_progress:
+                    return
+                self._leader_election_in_progress = True
+                failed_leader = self._leader
+                take_over = self._successor == self._identity
+                if not take_over:
+                    self._successor_takeover_timer = self._schedule(self._SUCCESSOR_TAKEOVER_TIMEOUT, self._successor_takeover_expired, failed_leader)
+        if not designated:
+            return super()._start_leader_election()
+
+        self._stop_health_check()
+        self._membership.set_alive(failed_leader, False)
+        if take_over:
+            self._take_over(failed_leader)
+        else:
+            _logger.info(f"Waiting for the successor {self._successor} to take over")
+
+    def _take_over(self, failed_leader: IpAddress):
+        """
+        Take over the lobby as the successor of the failed leader.
+
+        Parameters:
+        - failed_leader (IpAddress): The identity of the failed leader.
+        """
+        with self._standby_lock:
+            sync = self._standby_sync
+        if sync is not None:
+            with self._command_lock:
+                self._command_seq = max(self._command_seq, sync.command_seq)
+
+        # The members the leader knew about, but whose join this client has not received yet
+        added = []
+        if sync is not None:
+            added = [Peer.from_dict(member) for address, member in sync.members.items() if address != failed_leader and address not in self._members]
+            self._add_members(added)
+
+        # As in the election, the failed leader is removed right away, except with the term based
+        # election, where the new leader removes it after its health check
+        if not self._use_term_election:
+            self._membership.remove([failed_leader])
+
+        # A newer term, so the announcement is accepted by the members using the term based election
+        self._term += 1
+        _logger.info(f"Taking over the lobby from the failed leader {failed_leader}")
+        self._promote_to_leader()
+        if added:
+            self._announce_new_members(added)
+
+        state = self._state_provider() if self._state_provider is not None else None
+        if state is None and sync is not None and sync.state.index >= 0:
+            state = sync.state
+        if state is not None:
+            self.broadcast(StateMessage(state))
+
+    def _successor_takeover_expired(self, failed_leader: IpAddress):
+        """
+        Start the leader election, as the successor has not announced itself in time.
+
+        Parameters:
+        - failed_leader (IpAddress): The identity of the failed leader.
+        """
+        with self._standby_lock:
+            self._successor_takeover_timer = None
+            if self._leader != failed_leader or not self._leader_election_in_progress:
+                return
+            self._leader_election_in_progress = False
+            self._successor = None
+
+        _logger.info(f"The successor did not take over in time")
+        self._start_leader_election()
+
+    def _designate_successor(self, members: MembershipSnapshot, identity: IpAddress, leader: IpAddress):
+        """
+        Designate the successor of the leader after the members have changed, and tell the members about it.
+
+        Parameters:
+        - members (MembershipSnapshot): The members of the lobby.
+        - identity (IpAddress): Own identity.
+        - leader (IpAddress): The identity of the leader.
+        """
+        with self._standby_lock:
+            if self._successor_takeover_timer is not None and leader != self._successor_of:
+                # A new leader has announced itself
+                self._successor_takeover_timer.cancel()
+                self._successor_takeover_timer = None
+            if not self._use_standby or identity != leader:
+                self._stop_standby_sync()
+                return
+
+            candidates = self._rank_by_rtt([member.ip_address for member in sorted(members.values(), key=lambda member: member.id, reverse=True)
+                                            if member.ip_address != identity])
+            # With the RTT ranking, the successor is kept while it is ranked well enough, so it does not change with every measurement
+            if (self._use_rtt_ranking and self._successor_of == identity and self._successor in members
+                    and self._successor in candidates[:self._SUCCESSOR_RANK_TOLERANCE]):
+                successor = self._successor
+            else:
+                successor = candidates[0] if candidates else None
+            changed = successor != self._successor or self._successor_of != identity
+            if changed:
+                self._successor = successor
+                self._successor_of = identity
+                self._successor_informed = set()
+                self._standby_sync = None
+                self._stop_standby_sync()
+            self._successor_informed &= set(members)
+            uninformed = [member for address, member in members.items() if address != identity and address not in self._successor_informed]
+            self._successor_informed.update(member.ip_address for member in uninformed)
+
+        if changed and successor is not None:
+            _logger.info(f"Designated {successor} as the successor")
+            self._start_standby_sync()
+        if uninformed and successor is not None:
+            self.broadcast(SuccessorMessage(identity, successor), uninformed)
+
+    def _start_standby_sync(self):
+        """
+        Start sending the updates to the successor.
+        """
+        with self._standby_lock:
+            self._standby_generation += 1
+            generation = self._standby_generation
+        self._standby_sync_expired(generation)
+
+    def _stop_standby_sync(self):
+        """
+        Stop sending the updates to the successor.
+        """
+        with self._standby_lock:
+            self._standby_generation += 1
+            if self._standby_sync_timer is not None:
+                self._standby_sync_timer.cancel()
+                self._standby_sync_timer = None
+
+    def _standby_sync_expired(self, generation: int):
+        """
+        Send an update to the successor, and schedule the next one.
+
+        Parameters:
+        - generation (int): The generation of the updates.
+        """
+        with self._standby_lock:
+            if generation != self._standby_generation or self._successor is None:
+                return
+            successor = self._successor
+            command_seq = self._command_seq
+
+        state = self._state_provider() if self._state_provider is not None else None
+        self.send_to(successor, StandbySyncMessage(self._identity, self._membership.to_dict(), state or State(-1, 0, False), command_seq))
+
+        with self._standby_lock:
+            if generation == self._standby_generation:
+                self._standby_sync_timer = self._schedule(self._STANDBY_SYNC_INTERVAL, self._standby_sync_expired, generation)
+
+    def _process_successor(self, msg: SuccessorMessage):
+        """
+        Process the received SuccessorMessage within the lobby.
+
+        Parameters:
+        - msg (SuccessorMessage): The SuccessorMessage received from the leader.
+        """
+        # The designation may arrive before the acceptance to the lobby, it is only used while its sender is the leader
+        with self._standby_lock:
+            self._successor = msg.successor
+            self._successor_of = msg.sender
+            if msg.successor != self._identity:
+                self._standby_sync = None
+        _logger.debug(f"The leader designated {msg.successor} as its successor")
+
+    def _process_standby_sync(self, msg: StandbySyncMessage):
+        """
+        Process the received StandbySyncMessage within the lobby.
+
+        Parameters:
+        - msg (StandbySyncMessage): The StandbySyncMessage received from the leader.
+        """
+        with self._standby_lock:
+            # The update may arrive before the designation
+            self._successor = self._identity
+            self._successor_of = msg.sender
+            self._standby_sync = msg
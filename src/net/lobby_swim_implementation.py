@@ -0,0 +1,394 @@
+import math
+import random
+import threading
+
+from net.backend import IpAddress
+from net.base_lobby import BaseLobby, _write_message
+from net.timer_wheel import WheelTimer
+
+from messages.messages import *
+
+import log
+
+_logger = log.getLogger(__name__)
+
+class LobbySwimImplementation(BaseLobby):
+    """
+    SWIM failure detection for the BaseLobby.
+
+    In the default health check the leader sends a health check to every member and waits for their
+    acknowledgements, so its load grows with the size of the lobby. In the SWIM mode every member
+    (the leader included) probes one member per protocol period instead, so the load of every member
+    stays the same regardless of the size of the lobby:
+
+        - The probed member is pinged directly. If it does not acknowledge in time, a few other
+          members are asked to ping it on our behalf, and their acknowledgements are forwarded to us.
+        - If no acknowledgement arrives within the protocol period, the member is suspected. A suspected
+          member can refute the suspicion by raising its incarnation number, otherwise it is confirmed
+          dead after the suspicion timeout and removed from the lobby.
+        - The suspicions, the confirmations and the refutations are gossiped by piggybacking them on
+          the probe messages. The leader removes a confirmed member as a membership change of its own,
+          so the members which missed the gossip catch up with the membership epoch.
+        - The messages of the leader carry its membership epoch and the sequence number of its last
+          application command, as its health checks do, so the members notice the changes and the
+          commands they have missed.
+
+    If the leader is confirmed dead, a leader election is started. The SWIM mode is enabled with
+    use_swim(), otherwise the lobby falls back to the default health check.
+    """
+    # Length of a protocol period, one member is probed per period
+    _SWIM_PROTOCOL_PERIOD = 1.0
+
+    # Time we wait for the direct acknowledgement before asking other members to probe
+    _SWIM_PING_TIMEOUT = 0.3
+
+    # Number of members asked to probe a member which did not acknowledge the direct ping
+    _SWIM_INDIRECT_PROBES = 3
+
+    # Time a suspected member has to refute the suspicion before it is confirmed dead
+    _SWIM_SUSPICION_TIMEOUT = 5.0
+
+    # Maximum number of membership updates piggybacked on a message
+    _SWIM_MAX_PIGGYBACK = 6
+
+    # An update is gossiped this many times the logarithm of the lobby size
+    _SWIM_RETRANSMIT_MULTIPLIER = 3
+
+    # Whether the SWIM mode is used instead of the default health check
+    _use_swim: bool
+
+    # Incremented on every start, so the timers of a stopped protocol cannot restart it
+    _swim_generation: int
+
+    _is_swim_running: bool
+
+    # Own incarnation number, raised to refute suspicions
+    _incarnation: int
+
+    # The latest known incarnation numbers of the other members
+    _swim_incarnations: dict[IpAddress, int]
+
+    # The suspected members with the incarnation they are suspected at and their suspicion timer
+    _swim_suspects: dict[IpAddress, tuple[int, WheelTimer]]
+
+    # The updates to be gossiped by address: type, incarnation and the number of remaining transmissions
+    _swim_updates: dict[IpAddress, list[int]]
+
+    # The members to be probed during the current round, in a random order
+    _swim_probe_order: list[IpAddress]
+
+    # The probes waiting for an acknowledgement by sequence number
+    _swim_probes: dict[int, IpAddress]
+
+    # The probes done on behalf of other members by sequence number: the prober and its sequence number
+    _swim_forwards: dict[int, tuple[IpAddress, int]]
+
+    _swim_seq: int
+
+    # The timers of the current protocol period
+    _swim_timers: list[WheelTimer]
+
+    # Guards the state of the protocol between the timer callbacks and the message handlers
+    _swim_lock: threading.RLock
+
+    def __init__(self):
+        super().__init__()
+        self._use_swim = False
+        self._swim_generation = 0
+        self._is_swim_running = False
+        self._incarnation = 0
+        self._swim_incarnations = {}
+        self._swim_suspects = {}
+        self._swim_updates = {}
+        self._swim_probe_order = []
+        self._swim_probes = {}
+        self._swim_forwards = {}
+        self._swim_seq = 0
+        self._swim_timers = []
+        self._swim_lock = threading.RLock()
+
+        self.connect_to_message(SwimPingMessage, self._process_swim_ping)
+        self.connect_to_message(SwimPingReqMessage, self._process_swim_ping_req)
+        self.connect_to_message(SwimAckMessage, self._process_swim_ack)
+
+    def use_swim(self, enabled: bool = True):
+        """
+        Select whether the SWIM failure detection is used instead of the default health check.
+
+        All the members of a lobby should use the same failure detection, and it should be selected
+        before the lobby is created or joined.
+
+        Parameters:
+        - enabled (bool): True to use SWIM, False to use the default health check.
+        """
+        self._use_swim = enabled
+
+    def _start_health_check(self):
+        """
+        Start the failure detection, SWIM if it is enabled and the default health check otherwise.
+        """
+        if not self._use_swim:
+            return super()._start_health_check()
+
+        self._stop_health_check()
+        with self._swim_lock:
+            self._swim_generation += 1
+            self._is_swim_running = True
+            generation = self._swim_generation
+        self._swim_period(generation)
+
+    def _stop_health_check(self):
+        """
+        Stop the failure detection.
+        """
+        super()._stop_health_check()
+        with self._swim_lock:
+            self._is_swim_running = False
+            for timer in self._swim_timers:
+                timer.cancel()
+            self._swim_timers = []
+            for _, timer in self._swim_suspects.values():
+                timer.cancel()
+            self._swim_suspects = {}
+            self._swim_probes = {}
+            self._swim_forwards = {}
+
+    def _is_swim_current(self, generation: int) -> bool:
+        return self._is_swim_running and generation == self._swim_generation
+
+    def _swim_period(self, generation: int):
+        """
+        Start a protocol period by pinging the next member.
+
+        Parameters:
+        - generation (int): The generation of the protocol the period belongs to.
+        """
+        with self._swim_lock:
+            if not self._is_swim_current(generation):
+                return
+            target = self._next_probe_target()
+            seq = None
+            if target is not None:
+                seq = self._next_swim_seq()
+                self._swim_probes[seq] = target
+                self._swim_timers = [self._schedule(self._SWIM_PING_TIMEOUT, self._swim_ping_timeout, generation, seq, target)]
+            self._swim_timers.append(self._schedule(self._SWIM_PROTOCOL_PERIOD, self._swim_period_expired, generation, seq, target))
+            updates = self._take_swim_updates()
+
+        if target is not None:
+            self._send_swim(target, SwimPingMessage(self._identity, seq, updates))
+
+    def _swim_ping_timeout(self, generation: int, seq: int, target: IpAddress):
+        """
+        Ask other members to probe the target, as it has not acknowledged the direct ping in time.
+        """
+        with self._swim_lock:
+            if not self._is_swim_current(generation) or seq not in self._swim_probes:
+                return
+            candidates = [address for address in self._members if address not in (self._identity, target)]
+            helpers = random.sample(candidates, min(self._SWIM_INDIRECT_PROBES, len(candidates)))
+            updates = self._take_swim_updates()
+
+        _logger.debug(f"No acknowledgement from {target}, asking {helpers} to probe it")
+        for helper in helpers:
+            self._send_swim(helper, SwimPingReqMessage(self._identity, seq, updates, target))
+
+    def _swim_period_expired(self, generation: int, seq: int | None, target: IpAddress | None):
+        """
+        Finish a protocol period, suspecting the probed member if it was not acknowledged, and start the next one.
+        """
+        with self._swim_lock:
+            if not self._is_swim_current(generation):
+                return
+            if seq is not None and self._swim_probes.pop(seq, None) is not None and target in self._members:
+                self._swim_suspect(target, self._swim_incarnations.get(target, 0))
+
+        self._swim_period(generation)
+
+    def _process_swim_ping(self, msg: SwimPingMessage):
+        self._apply_swim_updates(msg.updates)
+        self._check_swim_leader(msg)
+        with self._swim_lock:
+            updates = self._take_swim_updates()
+        self._send_swim(msg.sender, SwimAckMessage(self._identity, msg.seq, updates, self._identity))
+
+    def _process_swim_ping_req(self, msg: SwimPingReqMessage):
+        self._apply_swim_updates(msg.updates)
+        self._check_swim_leader(msg)
+        with self._swim_lock:
+            if not self._is_swim_running:
+                return
+            seq = self._next_swim_seq()
+            self._swim_forwards[seq] = (msg.sender, msg.seq)
+            self._schedule(self._SWIM_PROTOCOL_PERIOD, self._swim_forward_expired, seq)
+            updates = self._take_swim_updates()
+        self._send_swim(msg.target, SwimPingMessage(self._identity, seq, updates))
+
+    def _process_swim_ack(self, msg: SwimAckMessage):
+        self._apply_swim_updates(msg.updates)
+        self._check_swim_leader(msg)
+        with self._swim_lock:
+            forward = self._swim_forwards.pop(msg.seq, None)
+            if forward is None:
+                self._swim_probes.pop(msg.seq, None)
+                return
+            updates = self._take_swim_updates()
+
+        prober, seq = forward
+        self._send_swim(prober, SwimAckMessage(self._identity, seq, updates, msg.target))
+
+    def _check_swim_leader(self, msg: SwimMessage):
+        """
+        Catch up with the membership changes and the commands of the leader, if it has sent the message.
+
+        Parameters:
+        - msg (SwimMessage): The received message.
+        """
+        if msg.sender != self._leader or self.is_leader():
+            return
+        self._check_membership_epoch(msg.sender, msg.epoch)
+        self._check_command_seq(msg.sender, msg.command_seq)
+
+    def _swim_forward_expired(self, seq: int):
+        with self._swim_lock:
+            self._swim_forwards.pop(seq, None)
+
+    def _apply_swim_updates(self, updates: list[tuple[int, str, int]]):
+        """
+        Apply the membership updates gossiped by another member.
+
+        Parameters:
+        - updates (list[tuple[int, str, int]]): The updates as (type, address, incarnation).
+        """
+        for kind, address, incarnation in updates:
+            with self._swim_lock:
+                if address == self._identity:
+                    # Refute the suspicion by raising our incarnation
+                    if kind != SwimUpdateType.Alive.value and incarnation >= self._incarnation:
+                        self._incarnation = incarnation + 1
+                        self._gossip(SwimUpdateType.Alive, self._identity, self._incarnation)
+                    continue
+
+                if address not in self._members:
+                    continue
+
+                known = self._swim_incarnations.get(address, 0)
+                if kind == SwimUpdateType.Alive.value:
+                    if incarnation > known:
+                        self._swim_incarnations[address] = incarnation
+                        suspicion = self._swim_suspects.pop(address, None)
+                        if suspicion is not None:
+                            suspicion[1].cancel()
+                        self._gossip(SwimUpdateType.Alive, address, incarnation)
+                elif kind == SwimUpdateType.Suspect.value:
+                    if incarnation >= known:
+                        self._swim_suspect(address, incarnation)
+
+            if kind == SwimUpdateType.Confirm.value:
+                self._swim_confirm(address, incarnation)
+
+    def _swim_suspect(self, address: IpAddress, incarnation: int):
+        """
+        Suspect a member to be dead, it is confirmed dead unless it refutes the suspicion in time.
+        """
+        with self._swim_lock:
+            suspicion = self._swim_suspects.get(address)
+            if suspicion is not None and suspicion[0] >= incarnation:
+                return
+            if suspicion is not None:
+                suspicion[1].cancel()
+
+            _logger.info(f"Suspecting {address} (incarnation {incarnation})")
+            self._swim_incarnations[address] = incarnation
+            timer = self._schedule(self._SWIM_SUSPICION_TIMEOUT, self._swim_suspicion_expired, self._swim_generation, address, incarnation)
+            self._swim_suspects[address] = (incarnation, timer)
+            self._gossip(SwimUpdateType.Suspect, address, incarnation)
+
+    def _swim_suspicion_expired(self, generation: int, address: IpAddress, incarnation: int):
+        with self._swim_lock:
+            suspicion = self._swim_suspects.get(address)
+            if not self._is_swim_current(generation) or suspicion is None or suspicion[0] != incarnation:
+                return
+        self._swim_confirm(address, incarnation)
+
+    def _swim_confirm(self, address: IpAddress, incarnation: int):
+        """
+        Remove a member confirmed dead from the lobby, starting a leader election if it was the leader.
+        """
+        with self._swim_lock:
+            member = self._members.get(address)
+            if member is None:
+                return
+            suspicion = self._swim_suspects.pop(address, None)
+            if suspicion is not None:
+                suspicion[1].cancel()
+            self._gossip(SwimUpdateType.Confirm, address, incarnation)
+
+        _logger.info(f"Member {member.name}/{address} confirmed dead")
+        if address == self._leader:
+            self._start_leader_election()
+        elif self.is_leader():
+            # Announced as a membership change, so the members which missed the gossip catch up
+            self._remove_unavailable_members([member])
+        else:
+            self._remove_member(member)
+
+    def _gossip(self, kind: SwimUpdateType, address: IpAddress, incarnation: int):
+        """
+        Queue a membership update to be piggybacked on the next messages.
+        """
+        transmissions = self._SWIM_RETRANSMIT_MULTIPLIER * max(1, math.ceil(math.log2(len(self._members) + 1)))
+        self._swim_updates[address] = [kind.value, incarnation, transmissions]
+
+    def _take_swim_updates(self) -> list[tuple[int, str, int]]:
+        """
+        Take the updates to be piggybacked on a message, the least gossiped ones first.
+        """
+        if not self._swim_updates:
+            return []
+        chosen = sorted(self._swim_updates.items(), key=lambda item: -item[1][2])[:self._SWIM_MAX_PIGGYBACK]
+        updates = []
+        for address, update in chosen:
+            updates.append((update[0], address, update[1]))
+            update[2] -= 1
+            if update[2] <= 0:
+                del self._swim_updates[address]
+        return updates
+
+    def _next_probe_target(self) -> IpAddress | None:
+        """
+        Get the next member to be probed.
+
+        The members are probed in rounds, in a new random order on every round, so every member is
+        probed within a bounded time.
+        """
+        while self._swim_probe_order:
+            address = self._swim_probe_order.pop()
+            if address in self._members:
+                return address
+
+        self._swim_probe_order = [address for address in self._members if address != self._identity]
+        random.shuffle(self._swim_probe_order)
+        return self._swim_probe_order.pop() if self._swim_probe_order else None
+
+    def _next_swim_seq(self) -> int:
+        self._swim_seq = (self._swim_seq + 1) % 2**31
+        return self._swim_seq
+
+    def _send_swim(self, target: IpAddress, msg: SwimMessage):
+        """
+        Send a SWIM message. Unlike the other messages, a probe of an unavailable leader is not queued for the next leader.
+
+        The leader stamps the message with its membership epoch and the sequence number of its last command.
+        If sending can block, the message is sent on the broadcast pool, as the probed member is often
+        unavailable and the handlers of the control messages must not wait for it.
+        """
+        if self.is_leader():
+            msg.epoch = self._membership_epoch
+            msg.command_seq = self._command_seq
+        _logger.debug(f"Sending message to {target}: {msg.__dict__}")
+        data = _write_message(False, self._identity, msg, self._codec.encode(msg))
+        if self._backend.blocking_send:
+            self._broadcast_pool.submit(self._backend.send, target, data)
+        else:
+            self._backend.send(target, data)
@@ -0,0 +1,339 @@
+import random
+import threading
+
+from net.backend import IpAddress
+from net.base_lobby import BaseLobby, _write_message
+from net.timer_wheel import WheelTimer
+
+from messages.messages import *
+
+import log
+
+_logger = log.getLogger(__name__)
+
+class LobbyTermElectionImplementation(BaseLobby):
+    """
+    Term based leader election for the BaseLobby.
+
+    In the default bully election every member which notices the failure of the leader sends an
+    ElectionStart to every member with a greater id, each of which starts an election of its own,
+    so a failover costs O(n²) messages. In the term based election the time is divided into numbered
+    terms with at most one leader each:
+
+        - A member which notices the failure of the leader waits for a randomized timeout, and unless
+          a new leader has announced itself by then, it starts a new term as a candidate: it votes for
+          itself and requests the votes of the other members.
+        - Every member grants its vote to the first candidate of a term, and restarts its own timeout,
+          so the member takes over if the candidate fails as well.
+        - The candidate which receives the votes of the majority of the members becomes the leader
+          and announces itself with its term. The announcements of older terms are ignored.
+        - If no candidate wins (e.g. the votes were split), the next timeout starts a new term.
+        - The failed leader is not removed by the election. If it has really failed, the new leader
+          removes it after its health check, otherwise it can still announce itself.
+
+    With the RTT ranking of the health checks, the best ranked members wait for a shorter time, so the
+    leader is likely to be a member with short round trip times to the rest of the lobby.
+
+    The randomized timeouts make it likely that a single candidate requests the votes before the others,
+    so a failover usually costs O(n) messages. The failed leader does not vote, and neither do the members
+    which cannot be reached. If a leader which is still alive receives a vote request, it announces itself
+    again in a term newer than the one of the candidate, so a member suspecting a live leader cannot depose it.
+
+    The term based election is enabled with use_term_election(), otherwise the lobby falls back to the
+    bully election. All the members of a lobby should use the same election.
+    """
+    # The range of the randomized time a member waits before it becomes a candidate
+    _TERM_ELECTION_TIMEOUT = (0.15, 0.45)
+
+    # Whether the term based election is used instead of the bully election
+    _use_term_election: bool
+
+    # The candidate this client has voted for in the current term
+    _voted_for: IpAddress | None
+
+    # The members which have voted for this client in the current term, None if it is not a candidate
+    _term_votes: set[IpAddress] | None
+
+    # The members whose votes count in the current term
+    _term_electorate: set[IpAddress]
+
+    # Timer for becoming a candidate
+    _term_election_timer: WheelTimer
+
+    # Incremented whenever the election timer is restarted or stopped, so a stale timer does nothing
+    _term_generation: int
+
+    # Guards the state of the election between the timer callbacks and the message handlers
+    _term_lock: threading.RLock
+
+    def __init__(self):
+        super().__init__()
+        self._use_term_election = False
+        self._voted_for = None
+        self._term_votes = None
+        self._term_electorate = set()
+        self._term_election_timer = None
+        self._term_generation = 0
+        self._term_lock = threading.RLock()
+
+        self.connect_to_message(RequestVoteMessage, self._process_request_vote)
+        self.connect_to_message(VoteMessage, self._process_vote)
+
+    def use_term_election(self, enabled: bool = True):
+        """
+        Select whether the term based leader election is used instead of the bully election.
+
+        All the members of a lobby should use the same election, and it should be selected
+        before the lobby is created or joined.
+
+        Parameters:
+        - enabled (bool): True to use the term based election, False to use the bully election.
+        """
+        self._use_term_election = enabled
+
+    def _start_leader_election(self):
+        """
+        Start the leader election, the term based one if it is enabled and the bully election otherwise.
+
+        In the term based election the client becomes a candidate after a randomized timeout,
+        unless a new leader has announced itself by then.
+        """
+        if not self._use_term_election:
+            return super()._start_leader_election()
+
+        with self._term_lock:
+            if self._leader_election_in_progress:
+                return
+            self._leader_election_in_progress = True
+            self._restart_term_election_timer()
+
+        # The health check will be stopped while the leader election takes place
+        self._stop_health_check()
+        self._membership.set_alive(self._leader, False)
+        _logger.info(f"Starting a leader election in term {self._term + 1}")
+
+    def _restart_term_election_timer(self):
+        """
+        Restart the randomized timer for becoming a candidate.
+        """
+        if self._term_election_timer is not None:
+            self._term_election_timer.cancel()
+        self._term_generation += 1
+        self._term_election_timer = self._schedule(self._term_election_timeout(), self._term_election_timer_expired, self._term_generation)
+
+    def _term_election_timeout(self) -> float:
+        """
+        Get a randomized time to wait before becoming a candidate.
+
+        With the RTT ranking, the range of the timeout is divided into slots, one for every ranked member
+        in the order of the ranking, and one shared by the rest of the members, so the best ranked member
+        which is still alive usually becomes the candidate first.
+
+        Returns:
+        - float: The timeout in seconds.
+        """
+        low, high = self._TERM_ELECTION_TIMEOUT
+        ranking = self._rtt_ranking if self._use_rtt_ranking else []
+        if not ranking:
+            return random.uniform(low, high)
+
+        slot = (high - low) / (len(ranking) + 1)
+        position = ranking.index(self._identity) if self._identity in ranking else len(ranking)
+        return low + slot * position + random.uniform(0, slot)
+
+    def _stop_term_election_timer(self):
+        """
+        Stop the timer for becoming a candidate.
+        """
+        if self._term_election_timer is not None:
+            self._term_election_timer.cancel()
+            self._term_election_timer = None
+        self._term_generation += 1
+
+    def _term_election_timer_expired(self, generation: int):
+        """
+        Start a new term as a candidate, as no leader has been elected before the timeout.
+
+        Parameters:
+        - generation (int): The generation of the timer.
+        """
+        with self._term_lock:
+            if generation != self._term_generation or not self._leader_election_in_progress:
+                return
+
+            self._term += 1
+            self._voted_for = self._identity
+            self._term_votes = {self._identity}
+            # The failed leader does not vote, but it gets the request, so it can announce itself if it is still alive
+            self._term_electorate = {address for address in self._members if address != self._leader}
+            targets = [address for address in self._members if address != self._identity]
+            term = self._term
+            failed_leader = self._leader
+
+            # If the votes are split, a new term is started after the next timeout
+            self._restart_term_election_timer()
+            won = self._has_majority()
+
+        _logger.info(f"Requesting votes for term {term} from {len(targets)} members")
+        if won:
+            return self._win_term_election(term)
+
+        msg = RequestVoteMessage(self._identity, term, failed_leader)
+        for target in targets:
+            # The requests are sent in parallel, so the unreachable members do not delay the others
+            if self._backend.blocking_send and len(targets) > 1:
+                self._broadcast_pool.submit(self._request_vote, target, msg)
+            else:
+                self._request_vote(target, msg)
+
+    def _request_vote(self, target: IpAddress, msg: RequestVoteMessage):
+        """
+        Request the vote of a member, a member which cannot be reached is left out of the electorate.
+
+        Parameters:
+        - target (IpAddress): The identity of the member.
+        - msg (RequestVoteMessage): The vote request.
+        """
+        if self._send_election(target, msg):
+            return
+
+        with self._term_lock:
+            if self._term_votes is None or msg.term != self._term:
+                return
+            self._term_electorate.discard(target)
+            won = self._has_majority()
+        if won:
+            self._win_term_election(msg.term)
+
+    def _send_election(self, target: IpAddress, msg: ElectionMessage) -> bool:
+        """
+        Send an election message. Unlike the other messages, a request to an unavailable leader is not queued for the next leader.
+        """
+        _logger.debug(f"Sending message to {target}: {msg.__dict__}")
+        return self._backend.send(target, _write_message(False, self._identity, msg, self._codec.encode(msg)))
+
+    def _has_majority(self) -> bool:
+        """
+        Check whether this client has received the votes of the majority of the electorate.
+        """
+        return self._term_votes is not None and len(self._term_votes & self._term_electorate) > len(self._term_electorate) // 2
+
+    def _win_term_election(self, term: int):
+        """
+        Become the leader of the given term.
+
+        Parameters:
+        - term (int): The term the election was won in.
+        """
+        with self._term_lock:
+            # The majority may be reached more than once, or a newer term may have started meanwhile
+            if self._term_votes is None or term != self._term:
+                return
+            self._term_votes = None
+            self._stop_term_election_timer()
+
+        _logger.info(f"Won the election of term {term}")
+        self._promote_to_leader()
+
+    def _process_request_vote(self, msg: RequestVoteMessage):
+        """
+        Process the received RequestVoteMessage within the lobby.
+
+        The vote is granted to the first candidate of a term. The leader does not vote, but announces
+        itself again in the term of the candidate, as it is evidently still alive.
+
+        Parameters:
+        - msg (RequestVoteMessage): The RequestVoteMessage received from a candidate.
+        """
+        if not self._use_term_election or msg.sender not in self._members:
+            return
+
+        start_election = False
+        with self._term_lock:
+            if self.is_leader():
+                # The announcement must win over the candidate even if it has already been elected
+                self._term = max(self._term, msg.term) + 1
+                announce = True
+            else:
+                announce = False
+                if msg.term > self._term:
+                    self._term = msg.term
+                    self._voted_for = None
+                    self._term_votes = None
+                # A candidate replacing a leader which has already been replaced is out of date
+                replaced = msg.leader != self._leader and self._leader_peer is not None and not self._leader_election_in_progress
+                granted = msg.term == self._term and self._voted_for in (None, msg.sender) and not replaced
+                if granted:
+                    self._voted_for = msg.sender
+                    # Take over if the candidate fails as well
+                    start_election = not self._leader_election_in_progress
+                    self._leader_election_in_progress = True
+                    self._restart_term_election_timer()
+            term = self._term
+
+        if announce:
+            _logger.info(f"Received a vote request from {msg.sender} while being the leader, announcing myself in term {term}")
+            self.broadcast(IAmLeaderMessage(self._identity, term))
+            return
+
+        if start_election:
+            self._stop_health_check()
+            self._membership.set_alive(self._leader, False)
+        _logger.debug(f"{'Granted' if granted else 'Denied'} the vote of term {term} to {msg.sender}")
+        self._send_election(msg.sender, VoteMessage(self._identity, term, granted))
+
+    def _process_vote(self, msg: VoteMessage):
+        """
+        Process the received VoteMessage within the lobby.
+
+        Parameters:
+        - msg (VoteMessage): The VoteMessage received from a member.
+        """
+        if not self._use_term_election:
+            return
+
+        with self._term_lock:
+            if msg.term > self._term:
+                # A newer term has started, this client is no longer a candidate
+                self._term = msg.term
+                self._voted_for = None
+                self._term_votes = None
+                return
+            if self._term_votes is None or msg.term != self._term or not msg.granted:
+                return
+            self._term_votes.add(msg.sender)
+            won = self._has_majority()
+        if won:
+            self._win_term_election(msg.term)
+
+    def _process_i_am_leader(self, msg: IAmLeaderMessage):
+        """
+        Process the received IAmLeaderMessage within the lobby.
+
+        In the term based election the leader is accepted unless its term is older than the current one.
+
+        Parameters:
+        - msg (IAmLeaderMessage): The IAmLeaderMessage received from the new lobby leader.
+        """
+        if not self._use_term_election:
+            return super()._process_i_am_leader(msg)
+
+        if msg.sender not in self._members:
+            return
+
+        with self._term_lock:
+            if msg.term < self._term:
+                _logger.debug(f"Ignored the leader announcement of {msg.sender} from the old term {msg.term}")
+                return
+            if msg.sender == self._leader and not self._leader_election_in_progress:
+                self._term = msg.term
+                return
+            self._term = msg.term
+            # The leader has already been elected in this term, no other candidate gets the vote
+            self._voted_for = msg.sender
+            self._term_votes = None
+            self._stop_term_election_timer()
+
+        # The previous leader is not removed, as it may still be alive and announce itself in a newer
+        # term. If it has failed, the new leader removes it after its health check.
+        self._accept_leader(msg.sender, remove_previous=False)
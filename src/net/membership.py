@@ -0,0 +1,319 @@
+import bisect
+import dataclasses
+import threading
+
+from collections.abc import Iterable, Iterator, Mapping
+from dataclasses import dataclass
+
+from net.backend import IpAddress
+
+@dataclass(frozen=True, slots=True)
+class Peer:
+    ip: str = ""
+    port: int = 0
+    name: str = ""
+    id: int = 0
+    is_leader: bool = True
+
+    @property
+    def ip_address(self) -> IpAddress:
+        return f"{self.ip}:{self.port}"
+
+    def __str__(self) -> str:
+        return f"{self.name}:{self.id}"
+
+    def __eq__(self, __value: object) -> bool:
+        if isinstance(__value, Peer):
+            return self.ip == __value.ip and self.port == __value.port
+        elif isinstance(__value, IpAddress):
+            return self.ip_address == __value
+        return False
+
+    def __hash__(self) -> int:
+        # Consistent with __eq__, which only compares the addresses
+        return hash(self.ip_address)
+
+    @staticmethod
+    def from_dict(d: dict[str, any]) -> "Peer":
+        return Peer(d['ip'], int(d['port']), d['name'], d['id'], d['is_leader'])
+
+@dataclass(frozen=True, slots=True)
+class MembershipDelta:
+    """
+    A change of the members announced by a leader.
+    """
+    epoch: int # The membership epoch of the change
+    issuer: IpAddress # The leader which announced the change
+    joined: dict[IpAddress, dict[str, any]] # The members which joined, as JSON compatible dictionaries
+    left: tuple[IpAddress, ...] # The addresses of the members which left
+
+class MembershipSnapshot(Mapping[IpAddress, Peer]):
+    """
+    Immutable view of the members of a lobby at a given version.
+
+    A snapshot never changes after it has been published, so it can be read and iterated
+    from any thread without a lock or a copy. Besides the members by address, it indexes
+    the members by their id and keeps the ids sorted for the leader election.
+    """
+    __slots__ = ('version', '_members', '_by_id', '_ids')
+
+    def __init__(self, version: int, members: dict[IpAddress, Peer], by_id: dict[int, IpAddress], ids: list[int]):
+        self.version = version
+        self._members = members
+        self._by_id = by_id # The addresses of the members by id
+        self._ids = ids # The ids of the members in ascending order
+
+    def __getitem__(self, address: IpAddress) -> Peer:
+        return self._members[address]
+
+    def __contains__(self, address: object) -> bool:
+        return address in self._members
+
+    def __iter__(self) -> Iterator[IpAddress]:
+        return iter(self._members)
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def has_id(self, id: int) -> bool:
+        """
+        Check whether a member has the given id.
+        """
+        return id in self._by_id
+
+    def by_id(self, id: int) -> Peer | None:
+        """
+        Get the member with the given id, or None if there is no such member.
+        """
+        address = self._by_id.get(id)
+        return None if address is None else self._members[address]
+
+    def higher(self, id: int) -> list[Peer]:
+        """
+        Get the members whose id is greater than the given id.
+
+        Parameters:
+        - id (int): The id to compare with.
+
+        Returns:
+        - list[Peer]: The members with a greater id, in ascending order of their ids.
+        """
+        members, by_id = self._members, self._by_id
+        return [members[by_id[higher_id]] for higher_id in self._ids[bisect.bisect_right(self._ids, id):]]
+
+class Membership:
+    """
+    Copy-on-write table of the members of a lobby.
+
+    The members are published as versioned immutable snapshots. The readers simply take the
+    current snapshot, while every change copies the members, applies the change and publishes
+    the result as the next version. The writers are serialized with a lock. Looking a member up
+    by its address or id is O(1), and finding the members with a greater id is a binary search.
+
+    The liveness of the members changes on every health check round, so it is not part of
+    the snapshots but tracked separately in a bitmap. Every member gets a bit of its own, and
+    the bits of the removed members are reused.
+    """
+    # The current members
+    _snapshot: MembershipSnapshot
+
+    # Serializes the writers
+    _lock: threading.Lock
+
+    # The liveness bit of every member by address
+    _bits: dict[IpAddress, int]
+
+    # The liveness bits of the removed members, which can be given to new members
+    _free_bits: list[int]
+
+    # The liveness bitmap, a set bit means the member is alive
+    _alive: bytearray
+
+    def __init__(self):
+        self._snapshot = MembershipSnapshot(0, {}, {}, [])
+        self._lock = threading.Lock()
+        self._bits = {}
+        self._free_bits = []
+        self._alive = bytearray()
+
+    @property
+    def snapshot(self) -> MembershipSnapshot:
+        """
+        Get the current members.
+        """
+        return self._snapshot
+
+    def add(self, peer: Peer) -> bool:
+        """
+        Add a new member.
+
+        Parameters:
+        - peer (Peer): The new member.
+
+        Returns:
+        - bool: True if the member was added, False if it was already a member.
+        """
+        return bool(self.add_all([peer]))
+
+    def add_all(self, peers: Iterable[Peer]) -> list[Peer]:
+        """
+        Add new members in a single change.
+
+        Parameters:
+        - peers (Iterable[Peer]): The new members.
+
+        Returns:
+        - list[Peer]: The added members, the ones which were already members are ignored.
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            added = []
+            members = dict(snapshot._members)
+            by_id = dict(snapshot._by_id)
+            ids = list(snapshot._ids)
+            for peer in peers:
+                if peer.ip_address in members:
+                    continue
+                members[peer.ip_address] = peer
+                if peer.id not in by_id:
+                    bisect.insort(ids, peer.id)
+                by_id[peer.id] = peer.ip_address
+                added.append(peer)
+            if added:
+                self._publish(members, by_id, ids)
+                for peer in added:
+                    self._assign_bit(peer.ip_address)
+            return added
+
+    def remove(self, addresses: Iterable[IpAddress]) -> list[Peer]:
+        """
+        Remove members.
+
+        Parameters:
+        - addresses (Iterable[IpAddress]): The addresses of the members to be removed.
+
+        Returns:
+        - list[Peer]: The removed members, the addresses which were not members are ignored.
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            removed = [snapshot._members[address] for address in set(addresses) if address in snapshot._members]
+            if removed:
+                members = dict(snapshot._members)
+                by_id = dict(snapshot._by_id)
+                ids = list(snapshot._ids)
+                for peer in removed:
+                    del members[peer.ip_address]
+                    if by_id.get(peer.id) == peer.ip_address:
+                        del by_id[peer.id]
+                        del ids[bisect.bisect_left(ids, peer.id)]
+                    self._free_bits.append(self._bits.pop(peer.ip_address))
+                self._publish(members, by_id, ids)
+            return removed
+
+    def replace(self, peer: Peer):
+        """
+        Replace the details of a member.
+
+        Parameters:
+        - peer (Peer): The new details of the member, it is matched by its address.
+        """
+        with self._lock:
+            members = dict(self._snapshot._members)
+            members[peer.ip_address] = peer
+            self._publish(*_index(members))
+            self._assign_bit(peer.ip_address)
+
+    def assign(self, peers: Iterable[Peer]):
+        """
+        Replace all the members.
+
+        Parameters:
+        - peers (Iterable[Peer]): The new members.
+        """
+        with self._lock:
+            self._publish(*_index({peer.ip_address: peer for peer in peers}))
+            self._bits.clear()
+            self._free_bits.clear()
+            self._alive = bytearray()
+            for address in self._snapshot:
+                self._assign_bit(address)
+
+    def set_leader(self, address: IpAddress):
+        """
+        Mark a member as the leader, and all the other members as not the leader.
+
+        Parameters:
+        - address (IpAddress): The address of the new leader.
+        """
+        with self._lock:
+            members = {member_address: peer if peer.is_leader == (member_address == address)
+                       else dataclasses.replace(peer, is_leader=member_address == address)
+                       for member_address, peer in self._snapshot._members.items()}
+            # The ids do not change, so the index is shared with the previous version
+            self._publish(members, self._snapshot._by_id, self._snapshot._ids)
+
+    def is_alive(self, address: IpAddress) -> bool:
+        """
+        Check whether a member is considered alive.
+        """
+        bit = self._bits.get(address)
+        if bit is None:
+            return True
+        return bool(self._alive[bit >> 3] & (1 << (bit & 7)))
+
+    def set_alive(self, address: IpAddress, alive: bool):
+        """
+        Set whether a member is considered alive.
+        """
+        with self._lock:
+            bit = self._bits.get(address)
+            if bit is not None:
+                self._set_bit(bit, alive)
+
+    def to_dict(self, addresses: Iterable[IpAddress] | None = None) -> dict[IpAddress, dict[str, any]]:
+        """
+        Get the current members as JSON compatible dictionaries.
+
+        Parameters:
+        - addresses (Iterable[IpAddress] | None): The addresses of the members to include, all the members by default.
+
+        Returns:
+        - dict[IpAddress, dict[str, any]]: The members, including their liveness, by address.
+        """
+        snapshot = self._snapshot
+        if addresses is None:
+            addresses = snapshot.keys()
+        return {address: dataclasses.asdict(snapshot[address]) | {'is_alive': self.is_alive(address)}
+                for address in addresses if address in snapshot}
+
+    def _publish(self, members: dict[IpAddress, Peer], by_id: dict[int, IpAddress], ids: list[int]):
+        self._snapshot = MembershipSnapshot(self._snapshot.version + 1, members, by_id, ids)
+
+    def _assign_bit(self, address: IpAddress):
+        """
+        Give a new member a liveness bit, the member is alive to begin with.
+        """
+        if address in self._bits:
+            return
+        if self._free_bits:
+            bit = self._free_bits.pop()
+        else:
+            bit = len(self._bits)
+            if bit >> 3 >= len(self._alive):
+                self._alive.append(0)
+        self._bits[address] = bit
+        self._set_bit(bit, True)
+
+    def _set_bit(self, bit: int, value: bool):
+        if value:
+            self._alive[bit >> 3] |= 1 << (bit & 7)
+        else:
+            self._alive[bit >> 3] &= ~(1 << (bit & 7)) & 0xff
+
+def _index(members: dict[IpAddress, Peer]) -> tuple[dict[IpAddress, Peer], dict[int, IpAddress], list[int]]:
+    """
+    Build the id index of the members.
+    """
+    by_id = {peer.id: address for address, peer in members.items()}
+    return members, by_id, sorted(by_id)
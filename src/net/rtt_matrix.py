@@ -0,0 +1,121 @@
+import statistics
+import threading
+
+from net.backend import IpAddress
+
+class RttMatrix:
+    """
+    Round trip times between the members of a lobby.
+
+    Every member measures the round trip times to some of the other members, and the rows of the
+    members are collected into a matrix. A new measurement is smoothed with the previous ones, so a
+    single delayed message does not change the picture much. The times are assumed to be symmetric,
+    so a pair of members needs to be measured in one direction only.
+
+    The members are ranked by their median round trip time to the other members, which estimates
+    how fast the messages of a leader would reach the lobby.
+    """
+    # The weight of a new measurement in the smoothed round trip time
+    _SMOOTHING = 0.25
+
+    # The smoothed round trip times in seconds by the measuring member and the measured member
+    _rtts: dict[IpAddress, dict[IpAddress, float]]
+
+    _lock: threading.Lock
+
+    def __init__(self):
+        self._rtts = {}
+        self._lock = threading.Lock()
+
+    def record(self, source: IpAddress, target: IpAddress, rtt: float):
+        """
+        Record a measured round trip time.
+
+        Parameters:
+        - source (IpAddress): The measuring member.
+        - target (IpAddress): The measured member.
+        - rtt (float): The round trip time in seconds.
+        """
+        with self._lock:
+            row = self._rtts.setdefault(source, {})
+            previous = row.get(target)
+            row[target] = rtt if previous is None else previous + self._SMOOTHING * (rtt - previous)
+
+    def set_row(self, source: IpAddress, row: dict[IpAddress, float]):
+        """
+        Replace the round trip times measured by a member with the ones it has reported.
+
+        Parameters:
+        - source (IpAddress): The measuring member.
+        - row (dict[IpAddress, float]): The round trip times in seconds by the measured member.
+        """
+        with self._lock:
+            self._rtts[source] = dict(row)
+
+    def row(self, source: IpAddress) -> dict[IpAddress, float]:
+        """
+        Get the round trip times measured by a member.
+
+        Returns:
+        - dict[IpAddress, float]: The round trip times in seconds by the measured member.
+        """
+        with self._lock:
+            return dict(self._rtts.get(source, {}))
+
+    def rtt(self, a: IpAddress, b: IpAddress) -> float | None:
+        """
+        Get the round trip time between two members, measured in either direction.
+
+        Returns:
+        - float | None: The round trip time in seconds, None if it has not been measured.
+        """
+        with self._lock:
+            return self._rtt(a, b)
+
+    def retain(self, members: set[IpAddress]):
+        """
+        Forget the members which are not in the given set.
+        """
+        with self._lock:
+            self._rtts = {source: {target: rtt for target, rtt in row.items() if target in members}
+                          for source, row in self._rtts.items() if source in members}
+
+    def to_dict(self) -> dict[IpAddress, dict[IpAddress, float]]:
+        """
+        Get a copy of the matrix.
+
+        Returns:
+        - dict[IpAddress, dict[IpAddress, float]]: The round trip times in seconds by the measuring and the measured member.
+        """
+        with self._lock:
+            return {source: dict(row) for source, row in self._rtts.items()}
+
+    def rank(self, candidates: list[IpAddress], members: list[IpAddress]) -> list[IpAddress]:
+        """
+        Rank the candidates by their median round trip time to the other members.
+
+        The candidates without any measurements are ranked last, in their original order.
+
+        Parameters:
+        - candidates (list[IpAddress]): The members to rank.
+        - members (list[IpAddress]): The members the round trip times are taken to.
+
+        Returns:
+        - list[IpAddress]: The candidates, the one with the lowest median round trip time first.
+        """
+        with self._lock:
+            medians = {}
+            for candidate in candidates:
+                rtts = [rtt for member in members if member != candidate
+                        for rtt in (self._rtt(candidate, member),) if rtt is not None]
+                if rtts:
+                    medians[candidate] = statistics.median(rtts)
+        measured = sorted(medians, key=medians.get)
+        return measured + [candidate for candidate in candidates if candidate not in medians]
+
+    def _rtt(self, a: IpAddress, b: IpAddress) -> float | None:
+        forward = self._rtts.get(a, {}).get(b)
+        backward = self._rtts.get(b, {}).get(a)
+        if forward is None or backward is None:
+            return forward if backward is None else backward
+        return (forward + backward) / 2
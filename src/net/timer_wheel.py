@@ -0,0 +1,205 @@
+import math
+import threading
+import time
+
+from typing import Callable
+
+import log
+
+_logger = log.getLogger(__name__)
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel running all the timers of a lobby on a single thread.
+
+    Time is divided into ticks. The first level of the wheel has a slot for each of the next 256 ticks,
+    while every further level covers the whole span of the previous one with each of its 64 slots.
+    A timer is put into the slot of the lowest level whose span reaches its expiration, and whenever a
+    level has gone around, the timers of the next slot of the level above are moved down a level.
+    Scheduling and cancelling a timer are O(1).
+
+    The thread only wakes up when a timer expires or a slot has to be moved down, and sleeps without
+    a timeout while there are no timers at all.
+    """
+    # Number of bits of the slot index on every level of the wheel
+    _LEVEL_BITS = (8, 6, 6, 6)
+
+    # Length of a tick in seconds
+    _tick: float
+
+    # The slots of every level, a slot holds its timers in a dict for O(1) removal
+    _levels: list[list[dict["WheelTimer", None]]]
+
+    # The number of ticks elapsed since the wheel was created
+    _current_tick: int
+
+    # The number of timers on the wheel
+    _count: int
+
+    # Guards the wheel and wakes up the thread when a timer is added or the wheel is stopped
+    _condition: threading.Condition
+
+    # Runs the expired timers, started with the first timer
+    _thread: threading.Thread | None
+
+    _running: bool
+
+    def __init__(self, tick: float = 0.01):
+        """
+        Constructor for the TimerWheel class.
+
+        Parameters:
+        - tick (float): The resolution of the wheel in seconds.
+        """
+        self._tick = tick
+        self._levels = [[{} for _ in range(1 << bits)] for bits in self._LEVEL_BITS]
+        self._start = time.monotonic()
+        self._current_tick = 0
+        self._count = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = True
+
+    def schedule(self, delay: float, callback: Callable, *args) -> "WheelTimer":
+        """
+        Schedule a callback to be called once after the given delay.
+
+        Parameters:
+        - delay (float): The delay in seconds.
+        - callback (Callable): The callback to call.
+        - args: Positional arguments to be passed to the callback.
+
+        Returns:
+        - WheelTimer: The timer, which can be used to cancel the callback.
+        """
+        with self._condition:
+            expiry = math.ceil((time.monotonic() - self._start + delay) / self._tick)
+            timer = WheelTimer(self, max(expiry, self._current_tick + 1), callback, args)
+            self._insert(timer)
+            self._count += 1
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="timer-wheel")
+                self._thread.start()
+            self._condition.notify()
+        return timer
+
+    def cancel(self, timer: "WheelTimer"):
+        """
+        Cancel a scheduled timer. Cancelling an expired or already cancelled timer has no effect.
+
+        Parameters:
+        - timer (WheelTimer): The timer to cancel.
+        """
+        with self._condition:
+            if timer.slot is not None:
+                del timer.slot[timer]
+                timer.slot = None
+                self._count -= 1
+
+    def stop(self):
+        """
+        Stop the wheel thread, the remaining timers are never called.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _insert(self, timer: "WheelTimer"):
+        """
+        Put a timer into the slot matching its expiration.
+        """
+        remaining = timer.expiry - self._current_tick
+        shift = 0
+        for level, bits in enumerate(self._LEVEL_BITS):
+            if remaining < (1 << (shift + bits)) or level == len(self._LEVEL_BITS) - 1:
+                slot = self._levels[level][(timer.expiry >> shift) & ((1 << bits) - 1)]
+                slot[timer] = None
+                timer.slot = slot
+                return
+            shift += bits
+
+    def _cascade(self):
+        """
+        Move the timers of the next slots of the upper levels down, as the lower levels have gone around.
+        """
+        shift = 0
+        for level, bits in enumerate(self._LEVEL_BITS[:-1]):
+            shift += bits
+            if self._current_tick & ((1 << shift) - 1) != 0:
+                return
+            next_bits = self._LEVEL_BITS[level + 1]
+            slot = self._levels[level + 1][(self._current_tick >> shift) & ((1 << next_bits) - 1)]
+            timers = list(slot)
+            slot.clear()
+            for timer in timers:
+                self._insert(timer)
+
+    def _ticks_to_wait(self) -> int | None:
+        """
+        Get the number of ticks the thread can sleep before it has something to do.
+
+        Returns:
+        - int | None: The number of ticks, or None if there are no timers.
+        """
+        if self._count == 0:
+            return None
+
+        size = 1 << self._LEVEL_BITS[0]
+        for distance in range(1, size - (self._current_tick & (size - 1))):
+            if self._levels[0][(self._current_tick + distance) & (size - 1)]:
+                return distance
+
+        # Nothing on the first level, sleep until it goes around
+        return size - (self._current_tick & (size - 1))
+
+    def _run(self):
+        """
+        Main loop of the wheel thread, calls the timers as they expire.
+        """
+        while True:
+            expired = []
+            with self._condition:
+                while self._running and not expired:
+                    now = int((time.monotonic() - self._start) / self._tick)
+                    while self._current_tick < now:
+                        self._current_tick += 1
+                        self._cascade()
+                        slot = self._levels[0][self._current_tick & ((1 << self._LEVEL_BITS[0]) - 1)]
+                        for timer in slot:
+                            timer.slot = None
+                        expired.extend(slot)
+                        self._count -= len(slot)
+                        slot.clear()
+
+                    if not expired:
+                        ticks = self._ticks_to_wait()
+                        timeout = None if ticks is None else (self._current_tick + ticks) * self._tick - (time.monotonic() - self._start)
+                        self._condition.wait(None if timeout is None else max(timeout, 0))
+
+                if not self._running:
+                    return
+
+            for timer in expired:
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    _logger.exception(f"Timer callback {timer.callback} failed")
+
+class WheelTimer:
+    """
+    Handle of a callback scheduled on a TimerWheel.
+    """
+    __slots__ = ('_wheel', 'expiry', 'callback', 'args', 'slot')
+
+    def __init__(self, wheel: TimerWheel, expiry: int, callback: Callable, args: tuple):
+        self._wheel = wheel
+        self.expiry = expiry # The tick the timer expires on
+        self.callback = callback
+        self.args = args
+        self.slot: dict | None = None # The slot holding the timer, None if it has expired or been cancelled
+
+    def cancel(self):
+        self._wheel.cancel(self)
@@ -0,0 +1,46 @@
+import math
+
+from net.failure_detector import PhiAccrualFailureDetector
+
+PEER = "127.0.0.1:5000"
+
+def _steady_detector(interval: float = 5.0, heartbeats: int = 10) -> tuple[PhiAccrualFailureDetector, float]:
+    """
+    Create a detector which has received steady heartbeats, so the standard deviation is clamped to its minimum.
+
+    Returns:
+    - tuple[PhiAccrualFailureDetector, float]: The detector and the time of the last heartbeat.
+    """
+    detector = PhiAccrualFailureDetector()
+    now = 0.0
+    for _ in range(heartbeats):
+        now += interval
+        detector.heartbeat(PEER, now)
+    return detector, now
+
+def test_phi_right_after_heartbeat_is_zero():
+    detector, last = _steady_detector()
+    phi = detector.phi(PEER, last + 0.5)
+    assert math.isfinite(phi)
+    assert phi < 1e-6
+    assert detector.is_available(PEER, last + 0.5)
+
+def test_phi_long_after_heartbeat_is_finite():
+    detector, last = _steady_detector()
+    phi = detector.phi(PEER, last + 12.0)
+    assert math.isfinite(phi)
+    assert phi > 100.0
+    assert not detector.is_available(PEER, last + 12.0)
+
+def test_phi_is_capped_when_probability_underflows():
+    detector, last = _steady_detector()
+    assert detector.phi(PEER, last + 3600.0) == PhiAccrualFailureDetector._MAX_PHI
+
+def test_phi_grows_with_silence():
+    detector, last = _steady_detector()
+    phis = [detector.phi(PEER, last + elapsed) for elapsed in (4.0, 5.0, 5.5, 6.0, 7.0, 60.0)]
+    assert phis == sorted(phis)
+    assert math.isclose(phis[1], math.log10(2.0), rel_tol=1e-6)
+
+def test_phi_of_unmonitored_peer_is_zero():
+    assert PhiAccrualFailureDetector().phi(PEER, 100.0) == 0.0
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+from net import timer_wheel
+from net.timer_wheel import TimerWheel
+
+# Ticks of one second keep the times of the fake clock exact
+TICK = 1.0
+
+# The number of ticks covered by the first level, and by the first two levels of the wheel
+LEVEL_0_SPAN = 1 << TimerWheel._LEVEL_BITS[0]
+LEVEL_1_SPAN = 1 << (TimerWheel._LEVEL_BITS[0] + TimerWheel._LEVEL_BITS[1])
+
+class _FakeClock:
+    """
+    Replaces time.monotonic() for the wheel, so the tests can move the time forward without waiting.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch) -> _FakeClock:
+    clock = _FakeClock()
+    monkeypatch.setattr(timer_wheel, "time", clock)
+    return clock
+
+@pytest.fixture
+def wheel(clock):
+    wheel = TimerWheel(TICK)
+    yield wheel
+    wheel.stop()
+
+def _run_until(wheel: TimerWheel, clock: _FakeClock, tick: int):
+    """
+    Move the clock to the given tick, and wait until the wheel has called the timers expiring before it.
+
+    A marker timer is scheduled on the tick, the wheel calls it only after all the timers of the earlier ticks.
+    """
+    done = threading.Event()
+    wheel.schedule(tick * TICK - clock.now, done.set)
+    clock.now = tick * TICK
+    with wheel._condition:
+        wheel._condition.notify()
+    assert done.wait(10.0)
+
+def test_timers_across_levels_fire_in_order(wheel, clock):
+    delays = [LEVEL_1_SPAN + 10, 300, LEVEL_0_SPAN, 5, LEVEL_0_SPAN - 1, 1000, LEVEL_0_SPAN + 1, LEVEL_1_SPAN - 1]
+    fired = []
+    for delay in delays:
+        wheel.schedule(delay * TICK, fired.append, delay)
+
+    _run_until(wheel, clock, LEVEL_1_SPAN + 11)
+    assert fired == sorted(delays)
+
+def test_cancelled_timers_do_not_fire(wheel, clock):
+    fired = []
+    near = wheel.schedule(10 * TICK, fired.append, "near")
+    far = wheel.schedule(1000 * TICK, fired.append, "far")
+    wheel.schedule(20 * TICK, fired.append, "kept")
+    near.cancel()
+    far.cancel()
+    far.cancel()
+
+    _run_until(wheel, clock, 1001)
+    assert fired == ["kept"]
+
+@pytest.mark.parametrize("delay", [LEVEL_0_SPAN + 44, LEVEL_1_SPAN + 44])
+def test_long_delay_cascades_and_fires_on_time(wheel, clock, delay):
+    fired = []
+    wheel.schedule(delay * TICK, fired.append, delay)
+
+    _run_until(wheel, clock, delay - 1)
+    assert fired == []
+    _run_until(wheel, clock, delay + 1)
+    assert fired == [delay]